@@ -0,0 +1,60 @@
+""" cold start benchmark
+
+    python benchmarks/import_time.py -n 20
+"""
+import os
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+STATEMENTS = {
+    "import sjtrade": "import sjtrade",
+    "import sjtrade.utils": "import sjtrade.utils",
+    "import sjtrade.io.file": "import sjtrade.io.file",
+    "from sjtrade import SJTrader": "from sjtrade import SJTrader",
+}
+
+TEMPLATE = """
+import sys, time
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+print(elapsed, int("shioaji" in sys.modules))
+"""
+
+
+def measure(stmt: str, n: int, cwd: str):
+    samples, sdk_loaded = [], False
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    for _ in range(n):
+        out = subprocess.run(
+            [sys.executable, "-c", TEMPLATE.format(stmt=stmt)],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        samples.append(float(out[-2]))
+        sdk_loaded = out[-1] == "1"
+    return statistics.median(samples), sdk_loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sjtrade import time benchmark")
+    parser.add_argument("-n", type=int, default=10)
+    args = parser.parse_args()
+    # shioaji writes its log file into cwd on import
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, stmt in STATEMENTS.items():
+            median, sdk_loaded = measure(stmt, args.n, cwd)
+            print(f"{name:<32} {median * 1000:8.2f} ms  shioaji loaded: {sdk_loaded}")
+
+
+if __name__ == "__main__":
+    main()
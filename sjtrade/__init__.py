@@ -16,5 +16,33 @@ def inject_env():
         )
 
 inject_env()
-from .trader import SJTrader
-from .strategy import StrategyBase
+
+# shioaji, loguru and rs2py are only loaded when these are first accessed
+_lazy_attrs = {
+    "SJTrader": ".trader",
+    "StrategyBase": ".strategy",
+}
+
+
+def __getattr__(name: str):
+    import importlib
+
+    if name in _lazy_attrs:
+        value = getattr(importlib.import_module(_lazy_attrs[name], __name__), name)
+    elif not name.startswith("_"):
+        try:
+            value = importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(
+                f"module {__name__!r} has no attribute {name!r}"
+            ) from None
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attrs))
@@ -0,0 +1,556 @@
+""" tick level backtest of StrategyBase subclasses, no shioaji session needed
+
+the engine replays the same day phases as SJTrader over a tick history:
+
+- entry orders are queued into the opening auction
+- 08:54:59 - 09:00 short entries are cancelled when the trial match lock at limit up
+- the first real tick is the auction open, marketable orders fill at the open price
+- LMT orders fill at their price when a later tick touch it, MKT orders fill at the next tick
+- 13:25:59 working orders are cancelled and the open quantity is covered on close
+  at limit_down/limit_up, filled at the last price of the day
+
+strategies declaring pure_threshold rules can run through run_fast, a per code
+replay that jump over the ticks which can not cross any working price.
+"""
+import csv
+import time
+import bisect
+import datetime
+import operator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+from shioaji.constant import StockPriceType
+
+from .position import Position, PositionCond, PriceSet
+from .registry import TradeRole
+from .strategy import StrategyBase
+
+
+def seconds_of(t: datetime.time) -> float:
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+
+@dataclass
+class BacktestConfig:
+    cancel_preorder_time: datetime.time = datetime.time(8, 54, 59)
+    cover_time: datetime.time = datetime.time(13, 25, 59)
+    stop_enabled: bool = True
+
+
+class TickTable:
+    """columnar tick history sorted by time, ts in seconds of day"""
+
+    __slots__ = ("ts", "code", "price", "volume", "simtrade")
+
+    def __init__(
+        self,
+        ts: Sequence[float] = (),
+        code: Sequence[str] = (),
+        price: Sequence[float] = (),
+        volume: Sequence[int] = (),
+        simtrade: Sequence[bool] = (),
+    ):
+        self.ts = list(ts)
+        self.code = list(code)
+        self.price = list(price)
+        self.volume = list(volume) or [0] * len(self.ts)
+        self.simtrade = list(simtrade) or [False] * len(self.ts)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def append(
+        self, ts: float, code: str, price: float, volume: int = 0, simtrade: bool = False
+    ):
+        self.ts.append(ts)
+        self.code.append(code)
+        self.price.append(price)
+        self.volume.append(volume)
+        self.simtrade.append(simtrade)
+
+    @classmethod
+    def from_ticks(cls, ticks: Iterable[Any]) -> "TickTable":
+        """build from TickSTKv1 like objects with code, datetime, close, volume, simtrade"""
+        table = cls()
+        for tick in ticks:
+            dt = tick.datetime
+            if isinstance(dt, str):
+                dt = datetime.datetime.fromisoformat(dt)
+            table.append(
+                seconds_of(dt.time()),
+                tick.code,
+                float(tick.close),
+                getattr(tick, "volume", 0),
+                bool(tick.simtrade),
+            )
+        return table
+
+    @classmethod
+    def from_csv(cls, filepath: Union[Path, str]) -> "TickTable":
+        """read a ts,code,price,volume,simtrade file written by to_csv"""
+        table = cls()
+        with open(filepath, newline="") as f:
+            for row in csv.DictReader(f):
+                table.append(
+                    float(row["ts"]),
+                    row["code"],
+                    float(row["price"]),
+                    int(row["volume"]),
+                    row["simtrade"] == "1",
+                )
+        return table
+
+    def to_csv(self, filepath: Union[Path, str]):
+        with open(filepath, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.__slots__)
+            writer.writerows(
+                zip(
+                    self.ts,
+                    self.code,
+                    self.price,
+                    self.volume,
+                    (int(s) for s in self.simtrade),
+                )
+            )
+
+    def group(self) -> Dict[str, "TickTable"]:
+        groups: Dict[str, TickTable] = {}
+        for idx, code in enumerate(self.code):
+            table = groups.get(code)
+            if table is None:
+                table = groups[code] = TickTable()
+            table.append(
+                self.ts[idx],
+                code,
+                self.price[idx],
+                self.volume[idx],
+                self.simtrade[idx],
+            )
+        return groups
+
+
+class Fill:
+    __slots__ = ("ts", "code", "role", "quantity", "price")
+
+    def __init__(self, ts: float, code: str, role: TradeRole, quantity: int, price: float):
+        self.ts = ts
+        self.code = code
+        self.role = role
+        self.quantity = quantity
+        self.price = price
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Fill) and all(
+            getattr(self, k) == getattr(other, k) for k in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Fill({self.code}, {self.role.value}, ts={self.ts}, "
+            f"quantity={self.quantity}, price={self.price})"
+        )
+
+
+class SimOrder:
+    __slots__ = ("role", "price_set", "price", "price_type", "quantity", "placed_at")
+
+    def __init__(
+        self,
+        role: TradeRole,
+        price_set: Optional[PriceSet],
+        price: float,
+        price_type: StockPriceType,
+        quantity: int,
+        placed_at: float,
+    ):
+        self.role = role
+        self.price_set = price_set
+        self.price = price
+        self.price_type = price_type
+        self.quantity = quantity
+        self.placed_at = placed_at
+
+
+class Book:
+    __slots__ = ("position", "orders", "opened", "last_price", "pending_cover")
+
+    def __init__(self, position: Position):
+        self.position = position
+        self.orders: List[SimOrder] = []
+        self.opened = False
+        self.last_price = 0.0
+        self.pending_cover = 0
+
+
+@dataclass
+class BacktestResult:
+    positions: Dict[str, Position]
+    fills: List[Fill] = field(default_factory=list)
+    ticks: int = 0
+    wall_time: float = 0.0
+
+    def pnl(self) -> Dict[str, float]:
+        res: Dict[str, float] = {}
+        for fill in self.fills:
+            unit = getattr(self.positions[fill.code].contract, "unit", 1) or 1
+            res[fill.code] = res.get(fill.code, 0.0) - fill.quantity * fill.price * unit
+        return res
+
+    @property
+    def total_pnl(self) -> float:
+        return sum(self.pnl().values())
+
+    @property
+    def open_positions(self) -> Dict[str, int]:
+        return {
+            code: position.status.open_quantity
+            for code, position in self.positions.items()
+            if position.status.open_quantity
+        }
+
+    @property
+    def throughput(self) -> float:
+        return self.ticks / self.wall_time if self.wall_time else 0.0
+
+
+class Backtest:
+    def __init__(
+        self,
+        strategy: StrategyBase,
+        contracts: Any,
+        config: Optional[BacktestConfig] = None,
+    ):
+        self.strategy = strategy
+        # sj.contracts.Contracts or any code -> contract mapping
+        self.contracts: Mapping[str, Any] = getattr(contracts, "Stocks", contracts)
+        self.config = config or BacktestConfig()
+        self.cancel_preorder_ts = seconds_of(self.config.cancel_preorder_time)
+        self.cover_ts = seconds_of(self.config.cover_time)
+
+    def entry(self) -> Dict[str, Book]:
+        books: Dict[str, Book] = {}
+        for kwargs in self.strategy.entry_positions():
+            code = kwargs["code"]
+            try:
+                contract = self.contracts[code]
+            except KeyError:
+                contract = None
+            if not contract:
+                continue
+            position = Position(
+                contract=contract,
+                cond=PositionCond(
+                    quantity=kwargs["pos"],
+                    entry_price=kwargs["entry_price"],
+                    stop_profit_price=kwargs["stop_profit_price"],
+                    stop_loss_price=kwargs["stop_loss_price"],
+                ),
+            )
+            book = books[code] = Book(position)
+            for price_set in position.cond.entry_price:
+                book.orders.append(
+                    SimOrder(
+                        TradeRole.Entry,
+                        price_set,
+                        price_set.price,
+                        price_set.price_type,
+                        price_set.quantity,
+                        0.0,
+                    )
+                )
+                price_set.in_transit_quantity += price_set.quantity
+        return books
+
+    def fill(self, book: Book, order: SimOrder, ts: float, price: float, fills: List[Fill]):
+        status = book.position.status
+        q = order.quantity
+        status.open_quantity += q
+        if order.role == TradeRole.Entry:
+            status.entry_order_quantity += q
+            status.entry_quantity += q
+        else:
+            status.cover_order_quantity += q
+            status.cover_quantity += q
+            book.pending_cover -= q
+        fills.append(Fill(ts, book.position.contract.code, order.role, q, price))
+
+    def match(self, book: Book, ts: float, price: float, auction: bool, fills: List[Fill]):
+        remain = []
+        for order in book.orders:
+            if order.price_type == StockPriceType.MKT:
+                # placed after matching of an earlier tick, fill at this one
+                self.fill(book, order, ts, price, fills)
+                continue
+            if order.quantity > 0 and price <= order.price:
+                self.fill(book, order, ts, price if auction else order.price, fills)
+                continue
+            if order.quantity < 0 and price >= order.price:
+                self.fill(book, order, ts, price if auction else order.price, fills)
+                continue
+            remain.append(order)
+        book.orders = remain
+
+    def cancel_entry(self, book: Book):
+        book.position.status.cancel_preorder = True
+        remain = []
+        for order in book.orders:
+            if order.role == TradeRole.Entry:
+                book.position.status.cancel_quantity += order.quantity
+                if order.price_set is not None:
+                    order.price_set.in_transit_quantity -= order.quantity
+            else:
+                remain.append(order)
+        book.orders = remain
+
+    def re_entry(self, book: Book, ts: float, price: float):
+        position = book.position
+        if position.status.cancel_preorder and price < position.cond.stop_loss_price[0].price:
+            book.orders.append(
+                SimOrder(
+                    TradeRole.Entry,
+                    None,
+                    0.0,
+                    StockPriceType.MKT,
+                    position.cond.quantity,
+                    ts,
+                )
+            )
+
+    def stop(self, book: Book, ts: float, price: float):
+        position = book.position
+        open_quantity = position.status.open_quantity
+        if not open_quantity:
+            return
+        long = open_quantity > 0
+        for price_sets, op in (
+            (position.cond.stop_loss_price, operator.le if long else operator.ge),
+            (position.cond.stop_profit_price, operator.ge if long else operator.le),
+        ):
+            for price_set in price_sets:
+                if abs(price_set.quantity) == abs(price_set.in_transit_quantity):
+                    continue
+                if not op(price, price_set.price):
+                    continue
+                available = abs(open_quantity + book.pending_cover)
+                q = min(abs(price_set.quantity), available)
+                if not q:
+                    return
+                cover = -q if long else q
+                price_set.in_transit_quantity += q if price_set.quantity > 0 else -q
+                book.pending_cover += cover
+                book.orders.append(
+                    SimOrder(
+                        TradeRole.Cover,
+                        price_set,
+                        price_set.price,
+                        price_set.price_type,
+                        cover,
+                        ts,
+                    )
+                )
+
+    def cover_onclose(self, book: Book, ts: float):
+        remain = []
+        for order in book.orders:
+            if order.price_type == StockPriceType.MKT:
+                remain.append(order)
+                continue
+            if order.role == TradeRole.Cover:
+                book.pending_cover -= order.quantity
+            if order.price_set is not None:
+                order.price_set.in_transit_quantity -= order.quantity
+        book.orders = remain
+        position = book.position
+        # same quantity as strategy cover_price_set_onclose, net of pending MKT covers
+        for price_set in self.strategy.cover_price_set_onclose(position):
+            quantity = price_set.quantity - book.pending_cover
+            if not quantity:
+                continue
+            position.cond.cover_price.append(price_set)
+            book.pending_cover += quantity
+            book.orders.append(
+                SimOrder(
+                    TradeRole.Cover,
+                    price_set,
+                    price_set.price,
+                    price_set.price_type,
+                    quantity,
+                    ts,
+                )
+            )
+
+    def close(self, book: Book, ts: float, fills: List[Fill]):
+        # closing auction, every remaining marketable order fill at the last price
+        if book.opened and book.orders:
+            self.match(book, ts, book.last_price, True, fills)
+
+    def step(
+        self,
+        book: Book,
+        ts: float,
+        price: float,
+        simtrade: bool,
+        covered: bool,
+        fills: List[Fill],
+    ):
+        position = book.position
+        if simtrade:
+            if (
+                ts >= self.cancel_preorder_ts
+                and not book.opened
+                and not position.status.cancel_preorder
+                and position.cond.quantity < 0
+                and price == position.contract.limit_up
+            ):
+                self.cancel_entry(book)
+            return
+        opening = not book.opened
+        book.opened = True
+        book.last_price = price
+        if book.orders:
+            # after cover time the next real tick is the closing auction
+            self.match(book, ts, price, opening or covered, fills)
+        if opening:
+            self.re_entry(book, ts, price)
+        if self.config.stop_enabled and not covered:
+            self.stop(book, ts, price)
+
+    def run(self, ticks: TickTable) -> BacktestResult:
+        start = time.perf_counter()
+        books = self.entry()
+        fills: List[Fill] = []
+        cover_ts = self.cover_ts
+        covered = False
+        tss, codes, prices, simtrades = ticks.ts, ticks.code, ticks.price, ticks.simtrade
+        step = self.step
+        for idx in range(len(tss)):
+            book = books.get(codes[idx])
+            if book is None:
+                continue
+            ts = tss[idx]
+            if not covered and ts >= cover_ts:
+                for each in books.values():
+                    self.cover_onclose(each, cover_ts)
+                covered = True
+            step(book, ts, prices[idx], simtrades[idx], covered, fills)
+        close_ts = max(tss[-1] if tss else 0.0, cover_ts)
+        for book in books.values():
+            if not covered:
+                self.cover_onclose(book, cover_ts)
+            self.close(book, close_ts, fills)
+        return BacktestResult(
+            positions={code: book.position for code, book in books.items()},
+            fills=fills,
+            ticks=len(tss),
+            wall_time=time.perf_counter() - start,
+        )
+
+    def supports_fast(self) -> bool:
+        return bool(getattr(self.strategy, "pure_threshold", False))
+
+    def run_fast(self, ticks: TickTable) -> BacktestResult:
+        """per code replay that jump over ticks which can not trigger anything
+
+        valid for pure price threshold strategies, all decisions come from the
+        entry, stop and on close price sets. fills equal run, ordered by (ts, code).
+        """
+        if not self.supports_fast():
+            return self.run(ticks)
+        start = time.perf_counter()
+        books = self.entry()
+        fills: List[Fill] = []
+        close_ts = max(ticks.ts[-1] if len(ticks) else 0.0, self.cover_ts)
+        groups = ticks.group()
+        for code, book in books.items():
+            table = groups.get(code)
+            if table is not None:
+                self.scan(book, table, fills)
+            else:
+                self.cover_onclose(book, self.cover_ts)
+            self.close(book, close_ts, fills)
+        fills.sort(key=lambda fill: (fill.ts, fill.code))
+        return BacktestResult(
+            positions={code: book.position for code, book in books.items()},
+            fills=fills,
+            ticks=len(ticks),
+            wall_time=time.perf_counter() - start,
+        )
+
+    def thresholds(self, book: Book) -> Optional[tuple]:
+        """(lo, hi) price bounds, a tick strictly inside can not trigger a thing"""
+        lo, hi = float("-inf"), float("inf")
+        for order in book.orders:
+            if order.price_type == StockPriceType.MKT:
+                return None
+            if order.quantity > 0:
+                lo = max(lo, order.price)
+            else:
+                hi = min(hi, order.price)
+        open_quantity = book.position.status.open_quantity
+        if open_quantity and self.config.stop_enabled:
+            cond = book.position.cond
+            long = open_quantity > 0
+            for price_sets, below in (
+                (cond.stop_loss_price, long),
+                (cond.stop_profit_price, not long),
+            ):
+                for price_set in price_sets:
+                    if abs(price_set.quantity) == abs(price_set.in_transit_quantity):
+                        continue
+                    if below:
+                        lo = max(lo, price_set.price)
+                    else:
+                        hi = min(hi, price_set.price)
+        return lo, hi
+
+    def scan(self, book: Book, table: TickTable, fills: List[Fill]):
+        tss, prices, simtrades = table.ts, table.price, table.simtrade
+        n = len(tss)
+        cover_idx = bisect.bisect_left(tss, self.cover_ts)
+        step = self.step
+        idx = 0
+        while idx < cover_idx:
+            step(book, tss[idx], prices[idx], simtrades[idx], False, fills)
+            idx += 1
+            if not book.opened:
+                continue
+            bounds = self.thresholds(book)
+            if bounds is None:
+                continue
+            jump = first_cross(prices, idx, cover_idx, *bounds)
+            if jump > idx:
+                # every skipped tick is a no-op except the last price seen
+                last_real = next(
+                    (i for i in range(jump - 1, idx - 1, -1) if not simtrades[i]), None
+                )
+                if last_real is not None:
+                    book.last_price = prices[last_real]
+                idx = jump
+        self.cover_onclose(book, self.cover_ts)
+        for idx in range(cover_idx, n):
+            step(book, tss[idx], prices[idx], simtrades[idx], True, fills)
+
+
+def first_cross(
+    prices: Sequence[float], start: int, stop: int, lo: float, hi: float
+) -> int:
+    for idx in range(start, stop):
+        price = prices[idx]
+        if price <= lo or price >= hi:
+            return idx
+    return stop
+
+
+def run_backtest(
+    strategy: StrategyBase,
+    contracts: Any,
+    ticks: TickTable,
+    config: Optional[BacktestConfig] = None,
+    fast: bool = True,
+) -> BacktestResult:
+    backtest = Backtest(strategy, contracts, config)
+    if fast and backtest.supports_fast():
+        return backtest.run_fast(ticks)
+    return backtest.run(ticks)
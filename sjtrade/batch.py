@@ -0,0 +1,153 @@
+""" micro batched ticks for StrategyBase.on_ticks
+
+ticks are appended into columnar arrays (array.array, so numpy can wrap them
+zero copy with numpy.frombuffer) and handed to the strategy once per window.
+codes are slot indices into the universe fixed at entry time, the strategy
+answer with columnar intents of (slot, quantity, price, price_type), the same
+record the shared memory IntentQueue carry.
+"""
+import datetime
+from array import array
+from threading import Lock
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .shared import PRICE_TYPE_LMT
+from .timer import TimerWheel
+
+
+def seconds_of_day(dt: Union[datetime.datetime, str]) -> float:
+    if isinstance(dt, str):
+        dt = datetime.datetime.fromisoformat(dt)
+    return dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6
+
+
+class TickBatch:
+    __slots__ = ("codes", "slot", "ts", "price", "volume", "simtrade")
+
+    def __init__(self, codes: Sequence[str]):
+        self.codes = codes
+        self.slot = array("l")
+        self.ts = array("d")
+        self.price = array("d")
+        self.volume = array("q")
+        self.simtrade = array("b")
+
+    def __len__(self) -> int:
+        return len(self.slot)
+
+    def append(
+        self, slot: int, ts: float, price: float, volume: int, simtrade: bool = False
+    ):
+        self.slot.append(slot)
+        self.ts.append(ts)
+        self.price.append(price)
+        self.volume.append(volume)
+        self.simtrade.append(simtrade)
+
+
+class OrderIntents:
+    """columnar (slot, quantity, price, price_type) answered by on_ticks"""
+
+    __slots__ = ("slot", "quantity", "price", "price_type")
+
+    def __init__(self):
+        self.slot: List[int] = []
+        self.quantity: List[int] = []
+        self.price: List[float] = []
+        self.price_type: List[int] = []
+
+    @classmethod
+    def from_arrays(
+        cls,
+        slot: Sequence[int],
+        quantity: Sequence[int],
+        price: Sequence[float],
+        price_type: Optional[Sequence[int]] = None,
+    ) -> "OrderIntents":
+        intents = cls()
+        intents.slot = [int(s) for s in slot]
+        intents.quantity = [int(q) for q in quantity]
+        intents.price = [float(p) for p in price]
+        intents.price_type = (
+            [int(t) for t in price_type]
+            if price_type is not None
+            else [PRICE_TYPE_LMT] * len(intents.slot)
+        )
+        return intents
+
+    def add(
+        self, slot: int, quantity: int, price: float, price_type: int = PRICE_TYPE_LMT
+    ):
+        self.slot.append(slot)
+        self.quantity.append(quantity)
+        self.price.append(price)
+        self.price_type.append(price_type)
+
+    def __len__(self) -> int:
+        return len(self.slot)
+
+    def __iter__(self) -> Iterator[Tuple[int, int, float, int]]:
+        return zip(self.slot, self.quantity, self.price, self.price_type)
+
+
+class TickBatcher:
+    """accumulate ticks for window_us, then hand the batch to on_batch
+
+    the first tick of a batch arm a timer on the wheel, a full batch
+    (max_size) flush right away. flush swap in a fresh batch under the
+    lock and call on_batch outside of it.
+    """
+
+    def __init__(
+        self,
+        codes: Sequence[str],
+        window_us: int,
+        on_batch: Callable[[TickBatch], None],
+        wheel: Optional[TimerWheel] = None,
+        max_size: int = 65536,
+    ):
+        self.codes = list(codes)
+        self.slots = {code: idx for idx, code in enumerate(self.codes)}
+        self.window = window_us / 1e6
+        self.on_batch = on_batch
+        self.wheel = wheel
+        self.max_size = max_size
+        self.batch = TickBatch(self.codes)
+        self.lock = Lock()
+
+    def append(self, tick) -> bool:
+        slot = self.slots.get(tick.code)
+        if slot is None:
+            return False
+        with self.lock:
+            batch = self.batch
+            batch.append(
+                slot,
+                seconds_of_day(tick.datetime),
+                float(tick.close),
+                tick.volume,
+                bool(tick.simtrade),
+            )
+            size = len(batch)
+        if size >= self.max_size or self.window <= 0:
+            self.flush()
+        elif size == 1:
+            if self.wheel is None:
+                self.wheel = TimerWheel()
+            self.wheel.schedule(self.window, self.flush_batch, batch)
+        return True
+
+    def flush_batch(self, batch: TickBatch) -> int:
+        # the timer of an already flushed batch is a no-op
+        if batch is not self.batch:
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        with self.lock:
+            batch = self.batch
+            if not len(batch):
+                return 0
+            self.batch = TickBatch(self.codes)
+        self.on_batch(batch)
+        return len(batch)
@@ -0,0 +1,226 @@
+"""contract fields sjtrade reads, and a per trading date file cache of them
+
+the cache is fixed size little endian records behind a small header, read
+with mmap and struct.iter_unpack, so a restart before the open can plan
+entries without waiting for the full contract download.
+"""
+
+import os
+import mmap
+import struct
+import datetime
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+
+class ContractRef:
+    """the contract fields trading logic reads, without a shioaji session"""
+
+    __slots__ = (
+        "code",
+        "exchange",
+        "reference",
+        "limit_up",
+        "limit_down",
+        "unit",
+        "day_trade",
+    )
+
+    def __init__(
+        self,
+        code: str,
+        exchange: str = "TSE",
+        reference: float = 0.0,
+        limit_up: float = 0.0,
+        limit_down: float = 0.0,
+        unit: int = 1000,
+        day_trade: str = "Yes",
+    ):
+        self.code = code
+        self.exchange = exchange
+        self.reference = reference
+        self.limit_up = limit_up
+        self.limit_down = limit_down
+        self.unit = unit
+        self.day_trade = day_trade
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ContractRef) and all(
+            getattr(self, k) == getattr(other, k) for k in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return "ContractRef({})".format(
+            ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        )
+
+    @classmethod
+    def from_contract(cls, contract) -> "ContractRef":
+        return cls(
+            code=contract.code,
+            exchange=str(getattr(contract.exchange, "value", contract.exchange)),
+            reference=float(contract.reference),
+            limit_up=float(contract.limit_up),
+            limit_down=float(contract.limit_down),
+            unit=int(contract.unit),
+            day_trade=str(getattr(contract.day_trade, "value", contract.day_trade)),
+        )
+
+    def to_contract(self):
+        """a shioaji Stock good enough for subscribe and place_order"""
+        import shioaji as sj
+
+        return sj.contracts.Stock(
+            code=self.code,
+            exchange=self.exchange,
+            reference=self.reference,
+            limit_up=self.limit_up,
+            limit_down=self.limit_down,
+            unit=self.unit,
+            day_trade=self.day_trade,
+        )
+
+
+class ContractTable:
+    """code -> ContractRef, looked up like api.Contracts.Stocks[code]"""
+
+    def __init__(self, contracts: Iterable[ContractRef] = ()):
+        self.contracts: Dict[str, ContractRef] = {c.code: c for c in contracts}
+
+    @property
+    def Stocks(self) -> "ContractTable":
+        return self
+
+    def __getitem__(self, code: str) -> Optional[ContractRef]:
+        return self.contracts.get(code)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.contracts
+
+    def __iter__(self) -> Iterator[ContractRef]:
+        return iter(self.contracts.values())
+
+    def __len__(self) -> int:
+        return len(self.contracts)
+
+    def add(self, contract: ContractRef):
+        self.contracts[contract.code] = contract
+
+    def update(self, other: "ContractTable"):
+        self.contracts.update(other.contracts)
+
+    def diff(self, other: "ContractTable") -> List[str]:
+        """codes of self missing or different in other"""
+        return [
+            code
+            for code, contract in self.contracts.items()
+            if other.contracts.get(code) != contract
+        ]
+
+    @classmethod
+    def from_contracts(cls, contracts) -> "ContractTable":
+        """every stock of a fetched api.Contracts"""
+        return cls(
+            ContractRef.from_contract(contract)
+            for exchange in contracts.Stocks
+            for contract in exchange
+        )
+
+
+_MAGIC = b"SJCR"
+_VERSION = 1
+# magic, version, trading date as yyyymmdd, record count
+_HEADER = struct.Struct("<4sHxxII")
+# code, exchange, reference, limit_up, limit_down, unit, day_trade
+_RECORD = struct.Struct("<12s4sdddi8s")
+
+
+def save_contract_table(
+    table: ContractTable, filepath: Union[Path, str], day: datetime.date
+):
+    p = Path(filepath)
+    buf = bytearray(_HEADER.size + _RECORD.size * len(table))
+    _HEADER.pack_into(buf, 0, _MAGIC, _VERSION, int(day.strftime("%Y%m%d")), len(table))
+    for idx, c in enumerate(table):
+        _RECORD.pack_into(
+            buf,
+            _HEADER.size + idx * _RECORD.size,
+            c.code.encode(),
+            c.exchange.encode(),
+            c.reference,
+            c.limit_up,
+            c.limit_down,
+            c.unit,
+            c.day_trade.encode(),
+        )
+    fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(buf)
+    # readers never see a partial file
+    os.replace(tmp, p)
+
+
+def _unpack_ref(record: tuple) -> ContractRef:
+    code, exchange, reference, limit_up, limit_down, unit, day_trade = record
+    return ContractRef(
+        code.rstrip(b"\0").decode(),
+        exchange.rstrip(b"\0").decode(),
+        reference,
+        limit_up,
+        limit_down,
+        unit,
+        day_trade.rstrip(b"\0").decode(),
+    )
+
+
+def load_contract_table(
+    filepath: Union[Path, str], day: Optional[datetime.date] = None
+) -> ContractTable:
+    """read a saved table, ValueError when corrupt or not of day"""
+    with open(filepath, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as m:
+        if len(m) < _HEADER.size:
+            raise ValueError(f"{filepath}: truncated contract cache")
+        magic, version, yyyymmdd, count = _HEADER.unpack_from(m)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{filepath}: not a contract cache v{_VERSION}")
+        if len(m) != _HEADER.size + _RECORD.size * count:
+            raise ValueError(f"{filepath}: truncated contract cache")
+        if day is not None and yyyymmdd != int(day.strftime("%Y%m%d")):
+            raise ValueError(f"{filepath}: contract cache of {yyyymmdd}, not {day}")
+        view = memoryview(m)[_HEADER.size :]
+        try:
+            table = ContractTable(map(_unpack_ref, _RECORD.iter_unpack(view)))
+        finally:
+            view.release()
+    return table
+
+
+class ContractCache:
+    """one contract table file per trading date under directory"""
+
+    def __init__(self, directory: Union[Path, str]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, day: datetime.date) -> Path:
+        return self.directory / f"contracts_{day.strftime('%Y%m%d')}.bin"
+
+    def load(self, day: datetime.date) -> Optional[ContractTable]:
+        path = self.path(day)
+        if not path.exists():
+            return None
+        try:
+            return load_contract_table(path, day)
+        except ValueError:
+            return None
+
+    def save(self, table: ContractTable, day: datetime.date) -> Path:
+        path = self.path(day)
+        save_contract_table(table, path, day)
+        return path
+
+    def __contains__(self, day: datetime.date) -> bool:
+        return self.path(day).exists()
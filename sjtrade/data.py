@@ -1,8 +1,62 @@
-from dataclasses import dataclass
-from decimal import Decimal
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import shioaji as sj
+
 
-@dataclass
 class Snapshot:
-    price: Decimal
-    bid: Decimal = 0
-    ask: Decimal = 0
+    __slots__ = (
+        "price",
+        "bid",
+        "ask",
+        "bid_volume",
+        "ask_volume",
+        "volume",
+        "amount",
+        "vwap",
+        "open",
+        "high",
+        "low",
+    )
+
+    def __init__(self, price: float = 0.0, bid: float = 0.0, ask: float = 0.0):
+        self.price = price
+        self.bid = bid
+        self.ask = ask
+        self.bid_volume = 0
+        self.ask_volume = 0
+        self.volume = 0
+        self.amount = 0.0
+        self.vwap = 0.0
+        self.open = 0.0
+        self.high = 0.0
+        self.low = 0.0
+
+    def __repr__(self) -> str:
+        return "Snapshot({})".format(
+            ", ".join(f"{k}={getattr(self, k)}" for k in self.__slots__)
+        )
+
+    def update_tick(self, tick: "sj.TickSTKv1"):
+        price = float(tick.close)
+        self.price = price
+        # simtrade price is trial match before open, not a real deal
+        if tick.simtrade:
+            return
+        if not self.open:
+            self.open = self.high = self.low = price
+        elif price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        volume = tick.volume
+        if volume:
+            self.volume += volume
+            self.amount += price * volume
+            self.vwap = self.amount / self.volume
+
+    def update_bidask(self, bidask: "sj.BidAskSTKv1"):
+        self.bid = float(bidask.bid_price[0])
+        self.ask = float(bidask.ask_price[0])
+        self.bid_volume = bidask.bid_volume[0]
+        self.ask_volume = bidask.ask_volume[0]
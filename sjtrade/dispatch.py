@@ -0,0 +1,185 @@
+import time
+import threading
+from enum import IntEnum
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from loguru import logger
+
+from .risk import TokenBucket
+
+
+class OrderPriority(IntEnum):
+    # risk reducing first, then cancels and price updates, then new exposure
+    Cover = 0
+    Cancel = 1
+    Entry = 2
+
+
+class DispatchJob:
+    __slots__ = ("priority", "func", "args", "future", "queued_at")
+
+    def __init__(
+        self, priority: OrderPriority, func: Callable, args: tuple, queued_at: float
+    ):
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.future: Future = Future()
+        self.queued_at = queued_at
+
+
+class DispatchStats:
+    __slots__ = ("submitted", "sent", "failed", "max_depth", "wait_time")
+
+    def __init__(self):
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_time = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "max_depth": self.max_depth,
+            "mean_wait": self.wait_time / self.sent if self.sent else 0.0,
+        }
+
+
+class OrderDispatcher:
+    """one sender thread draining per priority FIFO queues
+
+    a class is only served when every higher class is empty or out of its
+    rate budget, so covers overtake a burst of queued entries.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[Dict[OrderPriority, float]] = None,
+        burst: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+        autostart: bool = True,
+    ):
+        self.clock = clock
+        self.autostart = autostart
+        self.queues: Dict[OrderPriority, Deque[DispatchJob]] = {
+            priority: deque() for priority in OrderPriority
+        }
+        # orders per second per class, no bucket means unlimited
+        self.buckets: Dict[OrderPriority, TokenBucket] = {
+            priority: TokenBucket(rate, burst, clock)
+            for priority, rate in (rates or {}).items()
+            if rate
+        }
+        self.stats: Dict[OrderPriority, DispatchStats] = {
+            priority: DispatchStats() for priority in OrderPriority
+        }
+        self.cond = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = False
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def submit(self, priority: OrderPriority, func: Callable, *args) -> Future:
+        job = DispatchJob(priority, func, args, self.clock())
+        with self.cond:
+            queue = self.queues[priority]
+            queue.append(job)
+            stats = self.stats[priority]
+            stats.submitted += 1
+            stats.max_depth = max(stats.max_depth, len(queue))
+            self.cond.notify()
+        if self.autostart:
+            self.start()
+        return job.future
+
+    def cancel(
+        self,
+        priority: OrderPriority,
+        predicate: Optional[Callable[[DispatchJob], bool]] = None,
+    ) -> List[DispatchJob]:
+        """drop queued jobs of a class, return them so callers can undo reservations"""
+        with self.cond:
+            queue = self.queues[priority]
+            dropped = [job for job in queue if predicate is None or predicate(job)]
+            if dropped:
+                drop = set(dropped)
+                self.queues[priority] = deque(job for job in queue if job not in drop)
+        for job in dropped:
+            job.future.cancel()
+        return dropped
+
+    def next_job(self) -> Tuple[Optional[DispatchJob], Optional[float]]:
+        """(job, None) or (None, seconds until a budget refill, None when idle)"""
+        wait = None
+        for priority, queue in self.queues.items():
+            if not queue:
+                continue
+            bucket = self.buckets.get(priority)
+            if bucket is None or bucket.consume():
+                return queue.popleft(), None
+            delay = bucket.delay()
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def execute(self, job: DispatchJob):
+        stats = self.stats[job.priority]
+        stats.wait_time += self.clock() - job.queued_at
+        if not job.future.set_running_or_notify_cancel():
+            return
+        try:
+            job.future.set_result(job.func(*job.args))
+            stats.sent += 1
+        except Exception as e:
+            stats.failed += 1
+            logger.exception(f"dispatch {job.priority.name} {job.func} failed")
+            job.future.set_exception(e)
+
+    def run_pending(self) -> int:
+        """send every job the budgets allow right now, in priority order"""
+        sent = 0
+        while True:
+            with self.cond:
+                job, _ = self.next_job()
+            if job is None:
+                return sent
+            self.execute(job)
+            sent += 1
+
+    def run(self):
+        while True:
+            with self.cond:
+                job, wait = self.next_job()
+                while job is None:
+                    if self.stopped:
+                        return
+                    self.cond.wait(wait)
+                    job, wait = self.next_job()
+            self.execute(job)
+
+    def start(self):
+        if self.thread is None:
+            with self.cond:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, daemon=True)
+                    self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def depth(self) -> Dict[str, int]:
+        with self.cond:
+            return {priority.name: len(queue) for priority, queue in self.queues.items()}
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self.cond:
+            return {
+                priority.name: dict(stats.as_dict(), depth=len(self.queues[priority]))
+                for priority, stats in self.stats.items()
+            }
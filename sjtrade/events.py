@@ -0,0 +1,254 @@
+"""local event bus for external monitors
+
+the trader publish (kind, ts, fields) onto a bounded deque, a background
+thread serialize them, msgpack when installed and json otherwise, and send
+one datagram per event over a unix socket to every subscriber. sends never
+block, a subscriber whose socket buffer is full miss that event and a full
+queue drop the oldest, so slow consumers cost the trading threads nothing.
+"""
+
+import os
+import json
+import time
+import socket
+import datetime
+import threading
+import dataclasses
+from enum import Enum
+from decimal import Decimal
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+SUBSCRIBE = b"sub"
+UNSUBSCRIBE = b"unsub"
+FORMAT_MSGPACK = b"m"
+FORMAT_JSON = b"j"
+
+
+class EventKind(str, Enum):
+    Decision = "Decision"
+    Order = "Order"
+    Deal = "Deal"
+    Phase = "Phase"
+    Status = "Status"
+    Heartbeat = "Heartbeat"
+
+
+def plain(v: Any) -> Any:
+    """shioaji enums, decimals and dataclasses down to msgpack/json types"""
+    if isinstance(v, Enum):
+        return v.value
+    if v is None or isinstance(v, (bool, int, float, str, bytes)):
+        return v
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime.datetime, datetime.date, datetime.time)):
+        return v.isoformat()
+    if isinstance(v, dict):
+        return {str(k): plain(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple, set)):
+        return [plain(x) for x in v]
+    if dataclasses.is_dataclass(v):
+        return plain(dataclasses.asdict(v))
+    return str(v)
+
+
+def phase_key(func: Callable, args: tuple) -> Tuple[str, Tuple[Any, ...]]:
+    """(handler name, arg names) naming a scheduled phase across processes"""
+    return (
+        getattr(func, "__name__", str(func)),
+        tuple(getattr(arg, "__name__", arg) for arg in args),
+    )
+
+
+def pack(event: Dict[str, Any]) -> bytes:
+    try:
+        import msgpack
+    except ImportError:
+        return FORMAT_JSON + json.dumps(event, separators=(",", ":")).encode()
+    return FORMAT_MSGPACK + msgpack.packb(event, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Dict[str, Any]:
+    fmt, body = data[:1], data[1:]
+    if fmt == FORMAT_MSGPACK:
+        import msgpack
+
+        return msgpack.unpackb(body, raw=False)
+    if fmt == FORMAT_JSON:
+        return json.loads(body)
+    raise ValueError(f"unknown event format: {fmt!r}")
+
+
+class EventStats:
+    __slots__ = ("published", "sent", "dropped", "overflow")
+
+    def __init__(self):
+        self.published = 0
+        self.sent = 0
+        # per subscriber, socket buffer full
+        self.dropped = 0
+        # queue full, oldest event discarded
+        self.overflow = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class EventBus:
+    """unix datagram publisher, subscribers register by sending SUBSCRIBE"""
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        maxlen: int = 65536,
+        interval: float = 0.005,
+        clock: Callable[[], float] = time.time,
+        autostart: bool = True,
+    ):
+        self.path = str(path)
+        self.maxlen = maxlen
+        self.interval = interval
+        self.clock = clock
+        self.queue: Deque[Tuple[str, float, Dict[str, Any]]] = deque(maxlen=maxlen)
+        self.subscribers: Set[str] = set()
+        self.stats = EventStats()
+        # called on the bus thread for every new subscriber, e.g. to replay a book
+        self.on_subscribe: Optional[Callable[[str], None]] = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        if autostart:
+            self.start()
+
+    def publish(self, kind: EventKind, **fields):
+        # the only work on the trading thread, deque append is atomic
+        queue = self.queue
+        if len(queue) == self.maxlen:
+            self.stats.overflow += 1
+        queue.append((kind.value, self.clock(), fields))
+        self.stats.published += 1
+
+    def accept(self) -> int:
+        """handle pending subscribe and unsubscribe requests"""
+        n = 0
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(64)
+            except (BlockingIOError, InterruptedError):
+                return n
+            if not addr:
+                continue
+            if data == SUBSCRIBE:
+                if addr not in self.subscribers:
+                    self.subscribers.add(addr)
+                    if self.on_subscribe is not None:
+                        self.on_subscribe(addr)
+            elif data == UNSUBSCRIBE:
+                self.subscribers.discard(addr)
+            n += 1
+
+    def send(self, data: bytes):
+        for addr in list(self.subscribers):
+            try:
+                self.sock.sendto(data, addr)
+                self.stats.sent += 1
+            except (BlockingIOError, InterruptedError):
+                self.stats.dropped += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # subscriber went away without unsubscribing
+                self.subscribers.discard(addr)
+            except OSError as e:
+                logger.warning(f"event bus | drop subscriber {addr}: {e}")
+                self.subscribers.discard(addr)
+
+    def flush(self) -> int:
+        self.accept()
+        n = 0
+        queue = self.queue
+        while queue:
+            try:
+                kind, ts, fields = queue.popleft()
+            except IndexError:
+                break
+            if self.subscribers:
+                event = plain(fields)
+                event["kind"] = kind
+                event["ts"] = ts
+                self.send(pack(event))
+            n += 1
+        return n
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("event bus flush failed")
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class EventSubscriber:
+    """bind path and receive the events published on bus_path"""
+
+    def __init__(self, bus_path: Union[Path, str], path: Union[Path, str]):
+        self.bus_path = str(bus_path)
+        self.path = str(path)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        # large enough for bursts, the publisher drop rather than wait
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.subscribe()
+
+    def subscribe(self) -> bool:
+        """False while the bus is not up yet, sending it again is harmless"""
+        try:
+            self.sock.sendto(SUBSCRIBE, self.bus_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        return True
+
+    def recv(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(1 << 20)
+        except (socket.timeout, BlockingIOError):
+            return None
+        return unpack(data)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            event = self.recv()
+            if event is not None:
+                yield event
+
+    def close(self):
+        try:
+            self.sock.sendto(UNSUBSCRIBE, self.bus_path)
+        except OSError:
+            pass
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,63 @@
+from enum import Enum
+from typing import TYPE_CHECKING, Optional
+from dataclasses import dataclass
+import shioaji as sj
+from shioaji.constant import Action
+
+from .data import Snapshot
+from .utils import price_limit, price_move
+
+if TYPE_CHECKING:
+    from .registry import TradeRecord
+
+
+class CoverMode(str, Enum):
+    Market = "MKT"
+    Peg = "PEG"
+
+
+@dataclass
+class PegConfig:
+    ticks: int = 2
+    timeout: float = 3.0
+    max_reprice: int = 2
+
+
+class PegOrder:
+    __slots__ = ("trade", "price", "placed_at", "reprice_count", "escalating", "record")
+
+    def __init__(
+        self,
+        trade: sj.order.Trade,
+        price: float,
+        placed_at: float,
+        record: Optional["TradeRecord"] = None,
+    ):
+        self.trade = trade
+        self.price = price
+        self.placed_at = placed_at
+        # the registry drop record.trade once done, match escalations on the record
+        self.record = record
+        self.reprice_count = 0
+        self.escalating = False
+
+
+def peg_price(
+    contract: sj.contracts.Contract,
+    snapshot: Optional[Snapshot],
+    action: Action,
+    ticks: int,
+) -> Optional[float]:
+    if snapshot is None:
+        return None
+    if action == Action.Buy:
+        quote = snapshot.ask or snapshot.price
+        move = ticks
+    else:
+        quote = snapshot.bid or snapshot.price
+        move = -ticks
+    if not quote:
+        return None
+    return price_limit(
+        price_move(float(quote), move), contract.limit_up, contract.limit_down
+    )
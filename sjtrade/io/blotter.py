@@ -0,0 +1,176 @@
+""" columnar trade blotter of the session order and deal callbacks
+
+rows are appended column by column while trading and written in one bulk
+write at session end, Arrow IPC or Parquet when pyarrow is installed and
+csv otherwise. load_blotter concatenates many days with memory mapped reads.
+"""
+import csv
+import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Union
+
+from loguru import logger
+
+SCHEMA = (
+    ("date", str),
+    ("kind", str),
+    ("op_type", str),
+    ("order_id", str),
+    ("seqno", str),
+    ("code", str),
+    ("action", str),
+    ("role", str),
+    ("price_type", str),
+    ("price", float),
+    ("quantity", int),
+    ("exchange_ts", float),
+    ("placed_ts", float),
+    ("recv_ts", float),
+    ("latency", float),
+)
+COLUMNS = tuple(name for name, _ in SCHEMA)
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    types = {str: pa.string(), float: pa.float64(), int: pa.int64()}
+    return pa.schema([(name, types[t]) for name, t in SCHEMA])
+
+
+def _enum_value(v) -> str:
+    return str(getattr(v, "value", v) or "")
+
+
+class Blotter:
+    def __init__(self, date: Optional[datetime.date] = None):
+        self.date = (date or datetime.date.today()).isoformat()
+        self.columns: Dict[str, list] = {name: [] for name in COLUMNS}
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.columns["kind"])
+
+    def set_date(self, date: datetime.date):
+        """stamp rows with the trading date, rows already appended included"""
+        with self.lock:
+            self.date = date.isoformat()
+            dates = self.columns["date"]
+            dates[:] = [self.date] * len(dates)
+
+    def append(
+        self,
+        kind: str,
+        op_type: str,
+        order_id: str,
+        seqno: str,
+        code: str,
+        action,
+        role,
+        price_type,
+        price: float,
+        quantity: int,
+        exchange_ts: float,
+        placed_ts: float,
+        recv_ts: float,
+    ):
+        row = (
+            self.date,
+            kind,
+            op_type,
+            order_id or "",
+            seqno or "",
+            code,
+            _enum_value(action),
+            _enum_value(role),
+            _enum_value(price_type),
+            float(price or 0),
+            int(quantity or 0),
+            float(exchange_ts or 0),
+            float(placed_ts or 0),
+            recv_ts,
+            recv_ts - placed_ts if placed_ts else 0.0,
+        )
+        with self.lock:
+            for column, value in zip(self.columns.values(), row):
+                column.append(value)
+
+    def write(self, path: Union[Path, str]) -> Path:
+        with self.lock:
+            columns = {name: list(values) for name, values in self.columns.items()}
+        return write_blotter(columns, path)
+
+
+def write_blotter(columns: Dict[str, list], path: Union[Path, str]) -> Path:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    if p.suffix != ".csv":
+        try:
+            import pyarrow as pa
+        except ImportError:
+            p = p.with_suffix(".csv")
+            logger.warning(f"pyarrow not installed, write blotter as csv: {p}")
+        else:
+            table = pa.table(columns, schema=arrow_schema())
+            if p.suffix == ".parquet":
+                import pyarrow.parquet as pq
+
+                pq.write_table(table, p)
+            else:
+                with pa.OSFile(str(p), "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            return p
+    with p.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*(columns[name] for name in COLUMNS)))
+    return p
+
+
+def _read_csv(p: Path) -> Dict[str, list]:
+    columns: Dict[str, list] = {name: [] for name in COLUMNS}
+    casts = dict(SCHEMA)
+    with p.open(newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        for row in reader:
+            for name, value in zip(header, row):
+                columns[name].append(casts[name](value))
+    return columns
+
+
+def load_blotter(paths: Sequence[Union[Path, str]]):
+    """concatenate blotter files of many days
+
+    return a pyarrow.Table when pyarrow is installed, dict of column lists otherwise.
+    """
+    paths = [Path(p) for p in paths]
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+    if pa is None:
+        columns: Dict[str, list] = {name: [] for name in COLUMNS}
+        for p in paths:
+            if p.suffix != ".csv":
+                raise ImportError(f"pyarrow is required to load {p}")
+            for name, values in _read_csv(p).items():
+                columns[name].extend(values)
+        return columns
+    tables: List["pa.Table"] = []
+    for p in paths:
+        if p.suffix in ARROW_SUFFIXES:
+            # zero copy, buffers stay backed by the mapped file
+            tables.append(pa.ipc.open_file(pa.memory_map(str(p), "r")).read_all())
+        elif p.suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            tables.append(pq.read_table(p, memory_map=True))
+        else:
+            tables.append(pa.table(_read_csv(p), schema=arrow_schema()))
+    if not tables:
+        return arrow_schema().empty_table()
+    return pa.concat_tables(tables)
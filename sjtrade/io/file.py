@@ -1,4 +1,4 @@
-from typing import Union, Dict
+from typing import Union, Dict, Iterator, Tuple
 from pathlib import Path
 
 
@@ -14,6 +14,23 @@ def read_position(filepath: Union[Path, str]) -> Dict[str, int]:
         raise FileNotFoundError(f"filepath: '{filepath}' not exist.")
 
 
+def iter_position(filepath: Union[Path, str]) -> Iterator[Tuple[str, int]]:
+    """(code, pos) line by line, so entries can start before the file is read"""
+    p = Path(filepath)
+    if not (p.exists() and p.is_file()):
+        raise FileNotFoundError(f"filepath: '{filepath}' not exist.")
+
+    def rows():
+        with p.open() as f:
+            for l in f:
+                l = l.rstrip("\n")
+                if l:
+                    r = l.split("\t")
+                    yield r[0], int(float(r[1]))
+
+    return rows()
+
+
 def read_csv_position(
     filepath: Union[Path, str], with_header: bool = True
 ) -> Dict[str, int]:
@@ -0,0 +1,235 @@
+""" multi day backtest orchestration
+
+every (day x strategy config) pair is an independent BacktestJob, jobs are
+sharded over a process pool and results streamed back as they finish.
+
+results are cached on disk keyed by a hash of:
+
+- the strategy class and its parameters
+- the position file contents
+- the day contract table (reference, limits)
+- the tick data version, size and mtime of the tick file unless given
+
+so a re-run after tweaking one percentage only compute the jobs it changed.
+a job that raise is yielded as a failed DayResult (error set, never cached)
+and the rest of the run carry on.
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import dataclasses
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from loguru import logger
+
+from .backtest import BacktestConfig, Fill, TickTable, run_backtest
+from .contracts import ContractTable
+from .position import PositionStatus
+from .strategy import StrategyBasic
+
+
+@dataclass
+class BacktestJob:
+    day: str
+    position_filepath: str
+    ticks_filepath: str
+    contracts: ContractTable
+    params: Dict[str, Any] = field(default_factory=dict)
+    strategy_cls: type = StrategyBasic
+    config: Optional[BacktestConfig] = None
+    data_version: Optional[str] = None
+
+    def tick_data_version(self) -> str:
+        if self.data_version is not None:
+            return self.data_version
+        stat = os.stat(self.ticks_filepath)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def key(self) -> str:
+        cls = self.strategy_cls
+        config = dataclasses.asdict(self.config or BacktestConfig())
+        payload = json.dumps(
+            {
+                "strategy": f"{cls.__module__}.{cls.__qualname__}",
+                "params": self.params,
+                "config": config,
+                "contracts": sorted(repr(c) for c in self.contracts),
+                "ticks": self.tick_data_version(),
+            },
+            sort_keys=True,
+            default=str,
+        ).encode()
+        h = hashlib.sha256(payload)
+        h.update(Path(self.position_filepath).read_bytes())
+        return h.hexdigest()
+
+
+@dataclass
+class DayResult:
+    key: str
+    fills: List[Fill]
+    pnl: Dict[str, float]
+    statuses: Dict[str, PositionStatus]
+    ticks: int = 0
+    wall_time: float = 0.0
+    cached: bool = False
+    # repr of the exception when the job failed
+    error: Optional[str] = None
+
+    @classmethod
+    def failed(cls, key: str, e: BaseException) -> "DayResult":
+        return cls(key=key, fills=[], pnl={}, statuses={}, error=repr(e))
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def total_pnl(self) -> float:
+        return sum(self.pnl.values())
+
+    @property
+    def open_positions(self) -> Dict[str, int]:
+        return {
+            code: status.open_quantity
+            for code, status in self.statuses.items()
+            if status.open_quantity
+        }
+
+
+class ResultCache:
+    """one pickle per job key under directory"""
+
+    def __init__(self, directory: Union[Path, str]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[DayResult]:
+        try:
+            with open(self.path(key), "rb") as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        result.cached = True
+        return result
+
+    def put(self, key: str, result: DayResult):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # readers never see a partial file
+        os.replace(tmp, self.path(key))
+
+    def __contains__(self, key: str) -> bool:
+        return self.path(key).exists()
+
+
+def run_job(job: BacktestJob, key: str, fast: bool = True) -> DayResult:
+    start = time.perf_counter()
+    strategy = job.strategy_cls(
+        position_filepath=job.position_filepath, contracts=job.contracts, **job.params
+    )
+    ticks = TickTable.from_csv(job.ticks_filepath)
+    res = run_backtest(strategy, job.contracts, ticks, job.config, fast)
+    return DayResult(
+        key=key,
+        fills=res.fills,
+        pnl=res.pnl(),
+        statuses={code: p.status for code, p in res.positions.items()},
+        ticks=res.ticks,
+        wall_time=time.perf_counter() - start,
+    )
+
+
+def make_jobs(
+    days: Iterable[str],
+    params_grid: Iterable[Dict[str, Any]],
+    position_filepath: str,
+    ticks_filepath: str,
+    contracts: ContractTable,
+    **kwargs,
+) -> List[BacktestJob]:
+    """day x params jobs, paths and contracts may be callables of the day"""
+    jobs = []
+    for day in days:
+        day_contracts = contracts(day) if callable(contracts) else contracts
+        for params in params_grid:
+            jobs.append(
+                BacktestJob(
+                    day=day,
+                    position_filepath=position_filepath.format(day=day),
+                    ticks_filepath=ticks_filepath.format(day=day),
+                    contracts=day_contracts,
+                    params=dict(params),
+                    **kwargs,
+                )
+            )
+    return jobs
+
+
+def run_jobs(
+    jobs: Iterable[BacktestJob],
+    cache: Optional[ResultCache] = None,
+    max_workers: Optional[int] = None,
+    fast: bool = True,
+) -> Iterator[Tuple[BacktestJob, DayResult]]:
+    """yield (job, result) as soon as each is available, cache hits first
+
+    jobs sharing a key are computed once. max_workers=1 run in this process.
+    """
+    pending: Dict[str, List[BacktestJob]] = {}
+    for job in jobs:
+        try:
+            key = job.key()
+        except Exception as e:
+            logger.error(f"backtest {job.day} {job.params} | can not key job: {e!r}")
+            yield job, DayResult.failed("", e)
+            continue
+        if key in pending:
+            pending[key].append(job)
+            continue
+        result = cache.get(key) if cache is not None else None
+        if result is not None:
+            yield job, result
+            continue
+        pending[key] = [job]
+
+    def done(key: str, result: DayResult):
+        if cache is not None and result.ok:
+            cache.put(key, result)
+        for job in pending[key]:
+            yield job, result
+
+    def failed(key: str, e: BaseException) -> DayResult:
+        job = pending[key][0]
+        logger.error(f"backtest {job.day} {job.params} | failed: {e!r}")
+        return DayResult.failed(key, e)
+
+    if max_workers == 1:
+        for key, same in pending.items():
+            try:
+                result = run_job(same[0], key, fast)
+            except Exception as e:
+                result = failed(key, e)
+            yield from done(key, result)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_job, same[0], key, fast): key
+            for key, same in pending.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = failed(key, e)
+            yield from done(key, result)
@@ -1,11 +1,19 @@
 import shioaji as sj
-from typing import List
+from enum import Enum
+from typing import TYPE_CHECKING, List, Optional
 from threading import Lock
 from dataclasses import dataclass, field
 from shioaji.constant import (
     StockPriceType,
 )
 
+if TYPE_CHECKING:
+    from .registry import TradeRecord
+
+
+# striped locks, a claim only serialize with claims on price sets in the same stripe
+_CLAIM_LOCKS = [Lock() for _ in range(64)]
+
 
 @dataclass
 class PriceSet:
@@ -16,6 +24,31 @@ class PriceSet:
     # time: datetime.time
     # time_cond: TimeCond
 
+    def _claim_lock(self) -> Lock:
+        return _CLAIM_LOCKS[(id(self) >> 4) % len(_CLAIM_LOCKS)]
+
+    def claim(self, quantity: Optional[int] = None) -> int:
+        """atomically reserve up to quantity (default all) of the untransited part
+
+        return the signed quantity reserved, 0 when another caller got there first.
+        """
+        with self._claim_lock():
+            free = self.quantity - self.in_transit_quantity
+            if quantity is not None and abs(quantity) < abs(free):
+                free = quantity
+            if not free or (free > 0) != (self.quantity > 0):
+                return 0
+            self.in_transit_quantity += free
+            return free
+
+    def reserve(self, quantity: int):
+        with self._claim_lock():
+            self.in_transit_quantity += quantity
+
+    def release(self, quantity: int):
+        with self._claim_lock():
+            self.in_transit_quantity -= quantity
+
 
 @dataclass
 class PositionCond:
@@ -26,6 +59,18 @@ class PositionCond:
     cover_price: List[PriceSet] = field(default_factory=list)
 
 
+class PositionState(str, Enum):
+    PendingEntry = "PENDING_ENTRY"
+    Partial = "PARTIAL"
+    Open = "OPEN"
+    Covering = "COVERING"
+    Flat = "FLAT"
+    Cancelled = "CANCELLED"
+
+
+DONE_STATES = (PositionState.Flat, PositionState.Cancelled)
+
+
 @dataclass
 class PositionStatus:
     cancel_preorder: bool = False
@@ -35,6 +80,58 @@ class PositionStatus:
     open_quantity: int = 0
     cover_order_quantity: int = 0
     cover_quantity: int = 0
+    # maintained by TradeRegistry as records enter and leave the working status
+    working_orders: int = field(default=0, compare=False)
+    # derived, refreshed on every counter write so handlers read them in O(1)
+    state: PositionState = field(
+        default=PositionState.PendingEntry, init=False, compare=False
+    )
+    cover_remaining: int = field(default=0, init=False, compare=False)
+
+    def __setattr__(self, name: str, value):
+        object.__setattr__(self, name, value)
+        if name in _STATUS_COUNTERS:
+            self.refresh()
+
+    def refresh(self):
+        open_quantity = self.open_quantity
+        cover_working = self.cover_order_quantity - self.cover_quantity
+        entry_working = self.entry_order_quantity != self.entry_quantity
+        if open_quantity:
+            if cover_working:
+                state = PositionState.Covering
+            elif entry_working:
+                state = PositionState.Partial
+            else:
+                state = PositionState.Open
+        elif entry_working or self.working_orders:
+            state = PositionState.PendingEntry
+        elif self.entry_quantity:
+            state = PositionState.Flat
+        elif self.cancel_preorder or self.cancel_quantity:
+            state = PositionState.Cancelled
+        else:
+            state = PositionState.PendingEntry
+        object.__setattr__(self, "state", state)
+        object.__setattr__(self, "cover_remaining", open_quantity + cover_working)
+
+    @property
+    def done(self) -> bool:
+        return self.state in DONE_STATES
+
+
+_STATUS_COUNTERS = frozenset(
+    (
+        "cancel_preorder",
+        "cancel_quantity",
+        "entry_order_quantity",
+        "entry_quantity",
+        "open_quantity",
+        "cover_order_quantity",
+        "cover_quantity",
+        "working_orders",
+    )
+)
 
 
 @dataclass
@@ -42,6 +139,6 @@ class Position:
     contract: sj.contracts.Contract
     cond: PositionCond
     status: PositionStatus = field(default_factory=PositionStatus)
-    entry_trades: List[sj.order.Trade] = field(default_factory=list)
-    cover_trades: List[sj.order.Trade] = field(default_factory=list)
+    entry_trades: List["TradeRecord"] = field(default_factory=list)
+    cover_trades: List["TradeRecord"] = field(default_factory=list)
     lock: Lock = field(default_factory=Lock)
@@ -0,0 +1,51 @@
+from threading import Lock
+from typing import Dict, List, Optional
+import shioaji as sj
+
+from .position import Position
+
+
+class LimitLockMonitor:
+    """pre-open trial match watcher for short positions locked at limit up
+
+    the watch table is built once from the entried positions, each tick is a
+    single dict lookup and a position is reported once, again only after
+    rewatch when its cancel failed.
+    """
+
+    def __init__(self, positions: Dict[str, Position]):
+        self.positions = positions
+        self.watch: Dict[str, float] = {
+            code: position.contract.limit_up
+            for code, position in positions.items()
+            if position.cond.quantity < 0
+        }
+        self.pending: List[Position] = []
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.watch)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.watch
+
+    def check(self, tick: sj.TickSTKv1) -> Optional[Position]:
+        limit_up = self.watch.get(tick.code)
+        if limit_up is None or float(tick.close) != limit_up:
+            return None
+        with self.lock:
+            if self.watch.pop(tick.code, None) is None:
+                return None
+            position = self.positions[tick.code]
+            self.pending.append(position)
+            return position
+
+    def rewatch(self, position: Position):
+        """report the position again on its next locked tick, a cancel failed"""
+        with self.lock:
+            self.watch[position.contract.code] = position.contract.limit_up
+
+    def drain(self) -> List[Position]:
+        with self.lock:
+            pending, self.pending = self.pending, []
+        return pending
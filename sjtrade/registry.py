@@ -0,0 +1,262 @@
+import time
+from enum import Enum
+from threading import Lock
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Set
+import shioaji as sj
+from shioaji.constant import Action
+
+from .position import Position, PriceSet
+
+
+class TradeRole(str, Enum):
+    Entry = "Entry"
+    Cover = "Cover"
+
+
+WORKING_STATUS = (
+    sj.order.Status.PendingSubmit,
+    sj.order.Status.PreSubmitted,
+    sj.order.Status.Submitted,
+    sj.order.Status.PartFilled,
+)
+
+
+class TradeRecord:
+    """compact order record kept all session
+
+    the shioaji Trade is only held while the order is working and a cancel
+    or price update may still need it, it is dropped once the order is done.
+    """
+
+    __slots__ = (
+        "trade",
+        "position",
+        "role",
+        "price_set",
+        "order_id",
+        "seqno",
+        "action",
+        "price",
+        "price_type",
+        "quantity",
+        "filled",
+        "cancelled",
+        "status",
+        "placed_at",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        trade: sj.order.Trade,
+        position: Position,
+        role: TradeRole,
+        price_set: Optional[PriceSet] = None,
+    ):
+        order = trade.order
+        self.trade: Optional[sj.order.Trade] = trade
+        self.position = position
+        self.role = role
+        self.price_set = price_set
+        self.order_id = order.id
+        self.seqno = order.seqno
+        self.action = order.action
+        self.price = order.price
+        self.price_type = order.price_type
+        self.quantity = order.quantity
+        # an order recovered from the broker may already be part filled
+        self.filled = trade.status.deal_quantity
+        self.cancelled = trade.status.cancel_quantity
+        self.status = trade.status.status
+        self.placed_at = self.updated_at = time.time()
+
+    @property
+    def code(self) -> str:
+        return self.position.contract.code
+
+    @property
+    def remaining(self) -> int:
+        return self.quantity - self.filled - self.cancelled
+
+    def __repr__(self) -> str:
+        return (
+            f"TradeRecord({self.code}, {self.role.value}, id={self.order_id}, "
+            f"{self.action.value} {self.price_type.value} {self.price}, "
+            f"quantity={self.quantity}, filled={self.filled}, "
+            f"cancelled={self.cancelled}, status={self.status.value})"
+        )
+
+
+class TradeRegistry:
+    def __init__(self):
+        self.by_id: Dict[str, TradeRecord] = {}
+        self.by_seqno: Dict[str, TradeRecord] = {}
+        self.pending: Dict[str, Deque[TradeRecord]] = {}
+        self.working: Dict[sj.order.Status, Set[TradeRecord]] = {
+            status: set() for status in WORKING_STATUS
+        }
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.by_id) + sum(len(q) for q in self.pending.values())
+
+    def register(
+        self,
+        trade: sj.order.Trade,
+        position: Position,
+        role: TradeRole,
+        price_set: Optional[PriceSet] = None,
+    ) -> TradeRecord:
+        record = TradeRecord(trade, position, role, price_set)
+        with self.lock:
+            if trade.order.id:
+                self.bind(record, trade.order.id, trade.order.seqno)
+            else:
+                self.pending.setdefault(record.code, deque()).append(record)
+            if record.status in self.working:
+                self.working[record.status].add(record)
+                position.status.working_orders += 1
+            else:
+                record.trade = None
+        return record
+
+    def hold(self, position: Position, n: int = 1):
+        """count an order queued but not sent yet as working, -n when it leave the queue"""
+        with self.lock:
+            position.status.working_orders += n
+
+    def bind(self, record: TradeRecord, order_id: str, seqno: str = ""):
+        record.order_id = order_id
+        self.by_id[order_id] = record
+        if seqno:
+            record.seqno = seqno
+            self.by_seqno[seqno] = record
+
+    def resolve(
+        self, order_id: str, seqno: str, code: str, action: Action, quantity: int
+    ) -> Optional[TradeRecord]:
+        record = self.by_id.get(order_id) or self.by_seqno.get(seqno)
+        if record is not None and record.action == action:
+            return record
+        # non-blocking place_order return trade before id assigned,
+        # bind the first callback to the oldest pending trade with same action and quantity
+        pending = self.pending.get(code)
+        if not pending:
+            return None
+        for record in pending:
+            if record.action == action and record.quantity == quantity:
+                pending.remove(record)
+                if not pending:
+                    self.pending.pop(code)
+                if order_id:
+                    self.bind(record, order_id, seqno)
+                return record
+        return None
+
+    def set_status(self, record: TradeRecord, status: sj.order.Status):
+        if record.status == status:
+            return
+        was_working = record.status in self.working
+        if was_working:
+            self.working[record.status].discard(record)
+        if status in self.working:
+            self.working[status].add(record)
+            if not was_working:
+                record.position.status.working_orders += 1
+        elif was_working:
+            record.position.status.working_orders -= 1
+        record.status = status
+        record.updated_at = time.time()
+        trade = record.trade
+        if trade is not None:
+            trade.status.status = status
+            if status not in self.working:
+                # done, nothing will cancel or update it anymore
+                record.trade = None
+
+    def on_order(self, msg: Dict) -> Optional[TradeRecord]:
+        order = msg["order"]
+        with self.lock:
+            record = self.resolve(
+                order["id"],
+                order.get("seqno", ""),
+                msg["contract"]["code"],
+                order["action"],
+                order["quantity"],
+            )
+            if record is None:
+                return None
+            op_type = msg["operation"]["op_type"]
+            if msg["operation"]["op_code"] != "00":
+                if op_type == "New":
+                    self.set_status(record, sj.order.Status.Failed)
+                return record
+            if op_type == "New":
+                if record.status in (
+                    sj.order.Status.PendingSubmit,
+                    sj.order.Status.PreSubmitted,
+                ):
+                    self.set_status(record, sj.order.Status.Submitted)
+            elif op_type == "UpdatePrice":
+                record.price = order.get("price", record.price)
+                if record.trade is not None:
+                    record.trade.order.price = record.price
+            else:
+                cancel_quantity = msg["status"].get("cancel_quantity", 0)
+                record.cancelled += cancel_quantity
+                if record.trade is not None:
+                    record.trade.status.cancel_quantity = record.cancelled
+                if record.price_set is not None and cancel_quantity:
+                    record.price_set.release(
+                        cancel_quantity
+                        if record.price_set.quantity > 0
+                        else -cancel_quantity
+                    )
+                if record.remaining <= 0:
+                    self.set_status(
+                        record,
+                        (
+                            sj.order.Status.Filled
+                            if record.filled == record.quantity
+                            else sj.order.Status.Cancelled
+                        ),
+                    )
+        return record
+
+    def on_deal(self, msg: Dict) -> Optional[TradeRecord]:
+        with self.lock:
+            record = self.by_id.get(msg.get("trade_id", "")) or self.by_seqno.get(
+                msg.get("seqno", "")
+            )
+            if record is None:
+                return None
+            record.filled += msg["quantity"]
+            if record.trade is not None:
+                record.trade.status.deal_quantity = record.filled
+            if record.remaining <= 0:
+                self.set_status(
+                    record,
+                    (
+                        sj.order.Status.Filled
+                        if not record.cancelled
+                        else sj.order.Status.Cancelled
+                    ),
+                )
+            else:
+                self.set_status(record, sj.order.Status.PartFilled)
+        return record
+
+    def working_records(self, role: Optional[TradeRole] = None) -> List[TradeRecord]:
+        with self.lock:
+            return [
+                record
+                for records in self.working.values()
+                for record in records
+                if role is None or record.role == role
+            ]
+
+    def iter_records(self) -> Iterator[TradeRecord]:
+        yield from set(self.by_id.values())
+        for pending in self.pending.values():
+            yield from pending
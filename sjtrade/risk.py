@@ -0,0 +1,208 @@
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional
+from dataclasses import dataclass
+import shioaji as sj
+from loguru import logger
+from shioaji.constant import StockPriceType
+
+
+@dataclass
+class RiskLimit:
+    max_notional_per_code: Optional[float] = None
+    max_gross_exposure: Optional[float] = None
+    max_order_rate: Optional[float] = None  # orders per second
+    max_order_burst: int = 10
+    max_open_orders: Optional[int] = None
+    price_band: bool = True
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "ts", "clock")
+
+    def __init__(
+        self, rate: float, capacity: int, clock: Optional[Callable[[], float]] = None
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.ts = self.now()
+
+    def now(self) -> float:
+        return self.clock() if self.clock is not None else time.monotonic()
+
+    def refill(self):
+        now = self.now()
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def consume(self, n: int = 1) -> bool:
+        self.refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def delay(self, n: int = 1) -> float:
+        """seconds until n tokens are available"""
+        self.refill()
+        return max(0.0, (n - self.tokens) / self.rate)
+
+
+class RiskGate:
+    """pre-trade checks between strategy and api.place_order
+
+    all state is kept as running counters so every check is O(1).
+    risk reducing (cover) orders only go through the price band check.
+    """
+
+    def __init__(self, limit: Optional[RiskLimit] = None):
+        self.limit = limit or RiskLimit()
+        self.notional: Dict[str, float] = {}
+        self.gross_exposure = 0.0
+        self.open_orders = 0
+        self.code_open_orders: Dict[str, int] = {}
+        self.code_working_quantity: Dict[str, int] = {}
+        self.bucket = (
+            TokenBucket(self.limit.max_order_rate, self.limit.max_order_burst)
+            if self.limit.max_order_rate
+            else None
+        )
+        self.lock = Lock()
+
+    def order_notional(self, contract: sj.contracts.Contract, quantity: int) -> float:
+        return abs(quantity) * contract.unit * contract.reference
+
+    def check(
+        self,
+        contract: sj.contracts.Contract,
+        order: sj.order.StockOrder,
+        reduce_only: bool = False,
+    ) -> bool:
+        limit = self.limit
+        code = contract.code
+        if limit.price_band and order.price_type == StockPriceType.LMT:
+            if not (contract.limit_down <= order.price <= contract.limit_up):
+                logger.warning(
+                    f"{code} | risk reject: price {order.price} out of band "
+                    f"[{contract.limit_down}, {contract.limit_up}]"
+                )
+                return False
+        with self.lock:
+            if not reduce_only:
+                notional = self.order_notional(contract, order.quantity)
+                if (
+                    limit.max_notional_per_code is not None
+                    and self.notional.get(code, 0.0) + notional
+                    > limit.max_notional_per_code
+                ):
+                    logger.warning(
+                        f"{code} | risk reject: notional {self.notional.get(code, 0.0) + notional} "
+                        f"over {limit.max_notional_per_code}"
+                    )
+                    return False
+                if (
+                    limit.max_gross_exposure is not None
+                    and self.gross_exposure + notional > limit.max_gross_exposure
+                ):
+                    logger.warning(
+                        f"{code} | risk reject: gross exposure {self.gross_exposure + notional} "
+                        f"over {limit.max_gross_exposure}"
+                    )
+                    return False
+                if (
+                    limit.max_open_orders is not None
+                    and self.open_orders >= limit.max_open_orders
+                ):
+                    logger.warning(
+                        f"{code} | risk reject: open orders {self.open_orders} "
+                        f"reach {limit.max_open_orders}"
+                    )
+                    return False
+                if self.bucket is not None and not self.bucket.consume():
+                    logger.warning(
+                        f"{code} | risk reject: order rate over {limit.max_order_rate}/s"
+                    )
+                    return False
+                self.notional[code] = self.notional.get(code, 0.0) + notional
+                self.gross_exposure += notional
+            self.open_orders += 1
+            self.code_open_orders[code] = self.code_open_orders.get(code, 0) + 1
+            self.code_working_quantity[code] = (
+                self.code_working_quantity.get(code, 0) + order.quantity
+            )
+        return True
+
+    def release_exposure(self, contract: sj.contracts.Contract, quantity: int):
+        code = contract.code
+        notional = min(
+            self.order_notional(contract, quantity), self.notional.get(code, 0.0)
+        )
+        self.notional[code] = self.notional.get(code, 0.0) - notional
+        self.gross_exposure = max(self.gross_exposure - notional, 0.0)
+
+    def release_working(self, code: str, quantity: int, done: Optional[bool] = None):
+        """done tell whether the order finished, None when it is not known
+
+        without it the orders of a code are only released once the working
+        quantity of the whole code reach 0.
+        """
+        working = self.code_working_quantity.get(code, 0) - quantity
+        open_orders = self.code_open_orders.get(code, 0)
+        if working <= 0:
+            working = 0
+            done_orders = open_orders
+        elif done is None:
+            done_orders = 0
+        else:
+            done_orders = min(int(done), open_orders)
+        self.code_working_quantity[code] = working
+        self.code_open_orders[code] = open_orders - done_orders
+        self.open_orders -= done_orders
+
+    def on_cancel(
+        self,
+        contract: sj.contracts.Contract,
+        quantity: int,
+        reduce_only: bool,
+        done: Optional[bool] = True,
+    ):
+        with self.lock:
+            if not reduce_only:
+                self.release_exposure(contract, quantity)
+            self.release_working(contract.code, quantity, done)
+
+    def on_deal(
+        self,
+        contract: sj.contracts.Contract,
+        quantity: int,
+        reduce_only: bool,
+        done: Optional[bool] = None,
+    ):
+        with self.lock:
+            if reduce_only:
+                self.release_exposure(contract, quantity)
+            self.release_working(contract.code, quantity, done)
+
+    def on_recover(
+        self, contract: sj.contracts.Contract, quantity: int, reduce_only: bool
+    ):
+        """book a working order placed by another process, without any check"""
+        code = contract.code
+        with self.lock:
+            if not reduce_only:
+                notional = self.order_notional(contract, quantity)
+                self.notional[code] = self.notional.get(code, 0.0) + notional
+                self.gross_exposure += notional
+            self.open_orders += 1
+            self.code_open_orders[code] = self.code_open_orders.get(code, 0) + 1
+            self.code_working_quantity[code] = (
+                self.code_working_quantity.get(code, 0) + quantity
+            )
+
+    def on_reject(
+        self, contract: sj.contracts.Contract, quantity: int, reduce_only: bool
+    ):
+        """the exchange refused the order, give back all it reserved"""
+        self.on_cancel(contract, quantity, reduce_only, done=True)
@@ -0,0 +1,224 @@
+""" session calendar and phase plan
+
+a plan is a calendar plus a list of phases, each phase either call a trader
+method or swap the tick handler, e.g. in toml:
+
+    [calendar]
+    utc_offset = 8
+    holidays = ["2022-06-03"]
+
+    [calendar.overrides."2022-01-31"]
+    cover = "11:55:59"
+
+    [[phases]]
+    name = "entry"
+    time = "08:45"
+    handler = "place_entry_positions"
+
+    [[phases]]
+    name = "intraday"
+    time = "08:59:55"
+    tick_handler = "intraday_handler"
+
+overrides replace the time of phases by name on that date, a phase set to
+"skip" is dropped. the schedule of a day is computed once at startup.
+"""
+import json
+import datetime
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+
+def parse_time(v: Union[str, int, datetime.time]) -> datetime.time:
+    if isinstance(v, datetime.time):
+        return v
+    if isinstance(v, int):
+        # yaml 1.1 read an unquoted 8:45 as sexagesimal minutes and
+        # 13:25:59 as seconds, a day has fewer minutes than 1:00:00 seconds
+        if v < 24 * 60:
+            return datetime.time(*divmod(v, 60))
+        hour, rem = divmod(v, 3600)
+        return datetime.time(hour, *divmod(rem, 60))
+    return datetime.time.fromisoformat(v)
+
+
+def parse_date(v: Union[str, datetime.date]) -> datetime.date:
+    if isinstance(v, datetime.date):
+        return v
+    return datetime.date.fromisoformat(v)
+
+
+@dataclass
+class Phase:
+    name: str
+    time: datetime.time
+    handler: str = ""
+    tick_handler: str = ""
+    args: tuple = ()
+
+    def __post_init__(self):
+        if bool(self.handler) == bool(self.tick_handler):
+            raise ValueError(
+                f"phase {self.name!r} needs exactly one of handler or tick_handler"
+            )
+
+    def bind(self, trader: Any) -> Tuple[Callable, tuple]:
+        if self.tick_handler:
+            # a single callback swap, ticks see either the old or the new handler
+            return trader.set_on_tick_handler, (getattr(trader, self.tick_handler),)
+        return getattr(trader, self.handler), tuple(self.args)
+
+
+@dataclass
+class ScheduledPhase:
+    at: datetime.datetime
+    phase: Phase
+
+    def __str__(self) -> str:
+        target = self.phase.tick_handler or self.phase.handler
+        return f"{self.at.isoformat()} {self.phase.name}: {target}{self.phase.args or ''}"
+
+
+@dataclass
+class SessionCalendar:
+    utc_offset: float = 8.0
+    weekdays: Tuple[int, ...] = (0, 1, 2, 3, 4)
+    holidays: Set[datetime.date] = field(default_factory=set)
+    # extra trading days, e.g. make up saturdays
+    trading_days: Set[datetime.date] = field(default_factory=set)
+    # date -> phase name -> time or "skip"
+    overrides: Dict[datetime.date, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def tz(self) -> datetime.timezone:
+        return datetime.timezone(datetime.timedelta(hours=self.utc_offset))
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(self.tz)
+
+    def is_trading_day(self, day: datetime.date) -> bool:
+        if day in self.trading_days:
+            return True
+        return day.weekday() in self.weekdays and day not in self.holidays
+
+    def next_trading_day(self, day: datetime.date) -> datetime.date:
+        for _ in range(366):
+            if self.is_trading_day(day):
+                return day
+            day += datetime.timedelta(days=1)
+        raise ValueError("no trading day within a year")
+
+
+@dataclass
+class SessionPlan:
+    phases: List[Phase]
+    calendar: SessionCalendar = field(default_factory=SessionCalendar)
+
+    def schedule(self, day: Optional[datetime.date] = None) -> List[ScheduledPhase]:
+        """phases of day sorted by time, the coming session when day is None"""
+        if day is None:
+            return self.next_schedule()
+        overrides = self.calendar.overrides.get(day, {})
+        res = []
+        for phase in self.phases:
+            t = overrides.get(phase.name, phase.time)
+            if t == "skip":
+                continue
+            at = datetime.datetime.combine(day, parse_time(t), self.calendar.tz)
+            res.append(ScheduledPhase(at, phase))
+        res.sort(key=lambda s: s.at)
+        return res
+
+    def next_schedule(
+        self, now: Optional[datetime.datetime] = None
+    ) -> List[ScheduledPhase]:
+        now = now or self.calendar.now()
+        day = self.calendar.next_trading_day(now.astimezone(self.calendar.tz).date())
+        schedule = self.schedule(day)
+        if schedule and schedule[-1].at <= now:
+            # today session already over
+            schedule = self.schedule(
+                self.calendar.next_trading_day(day + datetime.timedelta(days=1))
+            )
+        return schedule
+
+    def bind(
+        self, trader: Any, schedule: List[ScheduledPhase]
+    ) -> List[Tuple[datetime.datetime, Callable, tuple]]:
+        return [(s.at, *s.phase.bind(trader)) for s in schedule]
+
+    @classmethod
+    def default(
+        cls,
+        entry_time: datetime.time = datetime.time(8, 45),
+        cancel_preorder_time: datetime.time = datetime.time(8, 54, 59),
+        intraday_handler_time: datetime.time = datetime.time(8, 59, 55),
+        cover_time: datetime.time = datetime.time(13, 25, 59),
+        calendar: Optional[SessionCalendar] = None,
+    ) -> "SessionPlan":
+        return cls(
+            phases=[
+                Phase("entry", entry_time, handler="place_entry_positions"),
+                Phase(
+                    "cancel_preorder",
+                    cancel_preorder_time,
+                    tick_handler="cancel_preorder_handler",
+                ),
+                Phase(
+                    "intraday", intraday_handler_time, tick_handler="intraday_handler"
+                ),
+                Phase("cover", cover_time, handler="open_position_cover"),
+            ],
+            calendar=calendar or SessionCalendar(),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionPlan":
+        cal = dict(data.get("calendar", {}))
+        calendar = SessionCalendar(
+            utc_offset=float(cal.get("utc_offset", 8.0)),
+            weekdays=tuple(cal.get("weekdays", (0, 1, 2, 3, 4))),
+            holidays={parse_date(d) for d in cal.get("holidays", ())},
+            trading_days={parse_date(d) for d in cal.get("trading_days", ())},
+            overrides={
+                parse_date(d): dict(times)
+                for d, times in cal.get("overrides", {}).items()
+            },
+        )
+        phases = [
+            Phase(
+                name=p["name"],
+                time=parse_time(p["time"]),
+                handler=p.get("handler", ""),
+                tick_handler=p.get("tick_handler", ""),
+                args=tuple(p.get("args", ())),
+            )
+            for p in data.get("phases", ())
+        ]
+        if not phases:
+            return cls.default(calendar=calendar)
+        return cls(phases=phases, calendar=calendar)
+
+
+def load_session_plan(filepath: Union[Path, str]) -> SessionPlan:
+    """read a plan from .toml, .yaml/.yml or .json"""
+    p = Path(filepath)
+    if not (p.exists() and p.is_file()):
+        raise FileNotFoundError(f"filepath: '{filepath}' not exist.")
+    suffix = p.suffix.lower()
+    if suffix == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        data = tomllib.loads(p.read_text())
+    elif suffix in (".yaml", ".yml"):
+        import yaml
+
+        data = yaml.safe_load(p.read_text())
+    elif suffix == ".json":
+        data = json.loads(p.read_text())
+    else:
+        raise ValueError(f"unsupported session plan format: {suffix}")
+    return SessionPlan.from_dict(data or {})
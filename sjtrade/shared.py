@@ -0,0 +1,203 @@
+""" shared memory market state for multi-process strategy workers
+
+the quote owning process writes per-code Snapshot fields into a shared
+array guarded by a per-slot sequence number (seqlock), the seqlock allow a
+single writer only, so writes of the tick and bidask callbacks are
+serialized by a lock local to the owning process. workers read it
+without copying and send order intents back through single producer
+single consumer ring buffers.
+"""
+import time
+import threading
+import multiprocessing as mp
+from multiprocessing.sharedctypes import RawArray
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .data import Snapshot
+
+FIELDS = ("seq",) + Snapshot.__slots__
+FIELD_INDEX = {name: idx for idx, name in enumerate(FIELDS)}
+
+INTENT_WIDTH = 4
+PRICE_TYPE_LMT = 0
+PRICE_TYPE_MKT = 1
+
+
+class SharedMarketState:
+    def __init__(self, codes: Sequence[str]):
+        self.codes = list(codes)
+        self.slots: Dict[str, int] = {code: idx for idx, code in enumerate(self.codes)}
+        self.width = len(FIELDS)
+        self.buffer = RawArray("d", len(self.codes) * self.width)
+        self.view = self.make_view()
+        # writer side only, readers never take it
+        self.write_lock = threading.Lock()
+
+    def make_view(self) -> memoryview:
+        return (
+            memoryview(self.buffer).cast("B").cast("d", [len(self.codes), self.width])
+        )
+
+    def __getstate__(self):
+        return {"codes": self.codes, "slots": self.slots, "buffer": self.buffer}
+
+    def __setstate__(self, state: dict):
+        self.codes = state["codes"]
+        self.slots = state["slots"]
+        self.buffer = state["buffer"]
+        self.width = len(FIELDS)
+        self.view = self.make_view()
+        self.write_lock = threading.Lock()
+
+    def write(self, code: str, snapshot: Snapshot):
+        slot = self.slots.get(code)
+        if slot is None:
+            return
+        buffer = self.buffer
+        base = slot * self.width
+        with self.write_lock:
+            seq = buffer[base] + 1
+            # odd sequence mark the slot as being written
+            buffer[base] = seq
+            buffer[base + 1] = snapshot.price
+            buffer[base + 2] = snapshot.bid
+            buffer[base + 3] = snapshot.ask
+            buffer[base + 4] = snapshot.bid_volume
+            buffer[base + 5] = snapshot.ask_volume
+            buffer[base + 6] = snapshot.volume
+            buffer[base + 7] = snapshot.amount
+            buffer[base + 8] = snapshot.vwap
+            buffer[base + 9] = snapshot.open
+            buffer[base + 10] = snapshot.high
+            buffer[base + 11] = snapshot.low
+            buffer[base] = seq + 1
+
+    def seq(self, slot: int) -> int:
+        return int(self.buffer[slot * self.width])
+
+    def read(self, slot: int) -> Tuple[float, ...]:
+        base = slot * self.width
+        buffer = self.buffer
+        while True:
+            seq = buffer[base]
+            if seq % 2:
+                continue
+            values = tuple(buffer[base : base + self.width])
+            if buffer[base] == seq:
+                return values
+
+    def read_snapshot(self, slot: int, snapshot: Optional[Snapshot] = None) -> Snapshot:
+        values = self.read(slot)
+        snapshot = snapshot or Snapshot()
+        for name, value in zip(Snapshot.__slots__, values[1:]):
+            setattr(snapshot, name, value)
+        return snapshot
+
+    def changed(self, last_seqs: List[int]) -> List[int]:
+        slots = []
+        buffer = self.buffer
+        width = self.width
+        for slot, last in enumerate(last_seqs):
+            seq = int(buffer[slot * width])
+            if seq != last and not seq % 2:
+                last_seqs[slot] = seq
+                slots.append(slot)
+        return slots
+
+
+class IntentQueue:
+    """single producer single consumer ring of (slot, quantity, price, price_type)
+
+    quantity > 0 buy and < 0 sell, SJTrader.place_intent only act on covers.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.buffer = RawArray("d", capacity * INTENT_WIDTH)
+        # [head, tail], head only written by consumer, tail only by producer
+        self.index = RawArray("q", 2)
+
+    def __len__(self) -> int:
+        return self.index[1] - self.index[0]
+
+    def push(
+        self, slot: int, quantity: int, price: float, price_type: int = PRICE_TYPE_LMT
+    ) -> bool:
+        head, tail = self.index[0], self.index[1]
+        if tail - head >= self.capacity:
+            return False
+        base = (tail % self.capacity) * INTENT_WIDTH
+        buffer = self.buffer
+        buffer[base] = slot
+        buffer[base + 1] = quantity
+        buffer[base + 2] = price
+        buffer[base + 3] = price_type
+        # publish after the record is written
+        self.index[1] = tail + 1
+        return True
+
+    def pop(self) -> Optional[Tuple[int, int, float, int]]:
+        head = self.index[0]
+        if head == self.index[1]:
+            return None
+        base = (head % self.capacity) * INTENT_WIDTH
+        buffer = self.buffer
+        intent = (
+            int(buffer[base]),
+            int(buffer[base + 1]),
+            buffer[base + 2],
+            int(buffer[base + 3]),
+        )
+        self.index[0] = head + 1
+        return intent
+
+    def drain(self) -> List[Tuple[int, int, float, int]]:
+        intents = []
+        intent = self.pop()
+        while intent is not None:
+            intents.append(intent)
+            intent = self.pop()
+        return intents
+
+
+def start_worker(
+    target: Callable[[SharedMarketState, IntentQueue], None],
+    state: SharedMarketState,
+    queue: IntentQueue,
+    *args,
+) -> mp.Process:
+    process = mp.Process(target=target, args=(state, queue) + args, daemon=True)
+    process.start()
+    return process
+
+
+class IntentConsumer(threading.Thread):
+    def __init__(
+        self,
+        dispatch: Callable[[str, int, float, int], None],
+        state: SharedMarketState,
+        queues: List[IntentQueue],
+        idle: float = 0.0005,
+    ):
+        super().__init__(daemon=True)
+        self.dispatch = dispatch
+        self.state = state
+        self.queues = queues
+        self.idle = idle
+        self.stop_event = threading.Event()
+
+    def poll(self) -> int:
+        num = 0
+        for queue in self.queues:
+            for slot, quantity, price, price_type in queue.drain():
+                self.dispatch(self.state.codes[slot], quantity, price, price_type)
+                num += 1
+        return num
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if not self.poll():
+                time.sleep(self.idle)
+
+    def stop(self):
+        self.stop_event.set()
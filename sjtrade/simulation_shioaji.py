@@ -1,10 +1,10 @@
 import time
 import random
 import datetime
-from typing import Callable, Dict
+from typing import Callable, Dict, Optional
 from dataclasses import dataclass
 from threading import Lock
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Executor, ThreadPoolExecutor
 import xxhash
 import shioaji as sj
 from shioaji.constant import OrderState, Exchange, Action, StockPriceType
@@ -13,9 +13,21 @@ from .data import Snapshot
 
 
 class SimulationShioaji:
-    def __init__(self, order_deal_handler: Callable[[OrderState, Dict], None]):
+    def __init__(
+        self,
+        order_deal_handler: Callable[[OrderState, Dict], None],
+        order_latency: float = 0.5,
+        deal_latency: float = 0.1,
+        executor: Optional[Executor] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        seed: Optional[int] = None,
+    ):
         self.order_callback = order_deal_handler
-        self.executor = ThreadPoolExecutor(max_workers=24)
+        self.order_latency = order_latency
+        self.deal_latency = deal_latency
+        self.executor = executor or ThreadPoolExecutor(max_workers=24)
+        self.sleep = sleep
+        self.random = random.Random(seed)
         self.use_chars = (
             "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
         )
@@ -26,11 +38,9 @@ class SimulationShioaji:
 
     def quote_callback(self, exchange: Exchange, tick: sj.TickSTKv1):
         if not tick.simtrade:
-            if tick.code in self.snapshots:
-                s = self.snapshots[tick.code]
-                s.price = tick.close
-            else:
-                self.snapshots[tick.code] = Snapshot(tick.close)
+            if tick.code not in self.snapshots:
+                self.snapshots[tick.code] = Snapshot()
+            self.snapshots[tick.code].update_tick(tick)
             with self.lock:
                 if tick.code in self.lmt_price_trades:
                     lmt_price_trades = self.lmt_price_trades[tick.code]
@@ -75,6 +85,18 @@ class SimulationShioaji:
         future.result()
         return trade
 
+    def update_order(
+        self,
+        trade: sj.order.Trade,
+        price: float = None,
+        qty: int = None,
+        timeout: int = 5000,
+    ):
+        if price is not None:
+            trade.order.price = price
+        future = self.executor.submit(self.call_order_callback, trade, "UpdatePrice")
+        return trade
+
     def update_status(
         self,
         account: sj.Account = None,
@@ -88,7 +110,7 @@ class SimulationShioaji:
             self.seqno_counter += 1
             trade.order.seqno = f"{self.seqno_counter:0>6}"
             trade.order.id = xxhash.xxh32_hexdigest(trade.order.seqno)
-            trade.order.ordno = ("").join(random.sample(self.use_chars, 5))
+            trade.order.ordno = ("").join(self.random.sample(self.use_chars, 5))
             trade.status.status = sj.order.Status.Submitted
             op_code = "00"
         elif op_type == "Cancel":
@@ -105,6 +127,8 @@ class SimulationShioaji:
                     if not trades:
                         self.lmt_price_trades.pop(trade.contract.code)
                 trade.status.status = sj.order.Status.Cancelled
+        else:
+            op_code = "00"
         return {
             "operation": {"op_type": op_type, "op_code": op_code, "op_msg": ""},
             "order": {
@@ -146,7 +170,9 @@ class SimulationShioaji:
             else sj.order.Status.PartFilled
         )
         return {
-            "trade_id": "12ab3456",
+            "trade_id": trade.order.id,
+            "seqno": trade.order.seqno,
+            "ordno": trade.order.ordno,
             "exchange_seq": "123456",
             "broker_id": "your_broker_id",
             "account_id": "your_account_id",
@@ -162,10 +188,12 @@ class SimulationShioaji:
         }
 
     def call_order_callback(self, trade: sj.order.Trade, op_type: str):
-        time.sleep(0.5)
+        self.sleep(self.order_latency)
         order_msg = self.gen_order_msg(trade, op_type)
         self.order_callback(OrderState.StockOrder, order_msg)
-        time.sleep(0.1)
+        self.sleep(self.deal_latency)
+        if op_type == "UpdatePrice":
+            return
         if trade.order.price_type == StockPriceType.MKT:
             if trade.status.status != sj.order.Status.Cancelled:
                 s = self.snapshots.get(trade.contract.code)
@@ -0,0 +1,164 @@
+import math
+from enum import Enum
+from threading import Lock
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .position import PriceSet
+from .registry import TradeRole
+from .timer import Timer, TimerWheel
+from .utils import quantity_num_split
+
+
+class SliceMode(str, Enum):
+    Immediate = "Immediate"
+    TWAP = "TWAP"
+    VWAP = "VWAP"
+
+
+@dataclass
+class SliceConfig:
+    mode: SliceMode = SliceMode.Immediate
+    max_quantity: int = 499  # broker per order limit of common lot
+    participation: Optional[float] = None  # child size as ratio of recent volume
+    window: float = 60.0
+    interval: float = 5.0
+    volume_profile: Optional[List[float]] = None
+
+
+class RecentVolume:
+    """exponentially decayed traded volume, half of it fades every halflife seconds"""
+
+    __slots__ = ("value", "halflife", "last")
+
+    def __init__(self, halflife: float = 60.0):
+        self.value = 0.0
+        self.halflife = halflife
+        self.last = 0.0
+
+    def update(self, volume: float, now: float) -> float:
+        if self.last:
+            self.value *= 0.5 ** ((now - self.last) / self.halflife)
+        self.value += volume
+        self.last = now
+        return self.value
+
+
+def allocate(quantity: int, weights: List[float]) -> List[int]:
+    total = sum(weights)
+    if not total:
+        weights, total = [1] * len(weights), len(weights)
+    raw = [quantity * w / total for w in weights]
+    res = [int(r) for r in raw]
+    remain = quantity - sum(res)
+    for idx in sorted(range(len(raw)), key=lambda i: res[i] - raw[i])[:remain]:
+        res[idx] += 1
+    return res
+
+
+def plan_slices(
+    quantity: int, config: SliceConfig, recent_volume: Optional[float] = None
+) -> List[Tuple[float, int]]:
+    if not quantity:
+        return []
+    neg = 1 if quantity > 0 else -1
+    child = config.max_quantity
+    if config.participation and recent_volume:
+        child = max(1, min(child, int(recent_volume * config.participation)))
+    if config.mode == SliceMode.Immediate:
+        num = math.ceil(abs(quantity) / child)
+        return [(0.0, q) for q in quantity_num_split(quantity, num)]
+    if config.mode == SliceMode.VWAP and config.volume_profile:
+        weights = config.volume_profile
+        step = config.window / len(weights)
+    else:
+        weights = [1] * max(1, int(config.window // config.interval))
+        step = config.interval
+    plan = []
+    for idx, q in enumerate(allocate(abs(quantity), weights)):
+        if not q:
+            continue
+        for child_q in quantity_num_split(q, math.ceil(q / child)):
+            plan.append((idx * step, child_q * neg))
+    return plan
+
+
+class SliceSchedule:
+    __slots__ = ("code", "role", "price_set", "timers", "pending", "active")
+
+    def __init__(self, code: str, role: TradeRole, price_set: PriceSet):
+        self.code = code
+        self.role = role
+        self.price_set = price_set
+        self.timers: List[Timer] = []
+        self.pending = 0
+        self.active = True
+
+
+class OrderSlicer:
+    def __init__(self, wheel: Optional[TimerWheel] = None):
+        self.wheel = TimerWheel() if wheel is None else wheel
+        self.schedules: Dict[str, List[SliceSchedule]] = {}
+        self.lock = Lock()
+
+    def submit(
+        self,
+        code: str,
+        role: TradeRole,
+        price_set: PriceSet,
+        plan: List[Tuple[float, int]],
+        send: Callable[[int, bool], None],
+        reserved: bool = False,
+    ) -> SliceSchedule:
+        """reserved means the caller already claimed the whole plan on price_set"""
+        schedule = SliceSchedule(code, role, price_set)
+        delayed = [(delay, q) for delay, q in plan if delay > 0]
+        if delayed:
+            with self.lock:
+                # reserve scheduled quantity so stop checks see it as in transit
+                for delay, q in delayed:
+                    if not reserved:
+                        price_set.reserve(q)
+                    schedule.pending += q
+                    schedule.timers.append(
+                        self.wheel.schedule(delay, self.fire, schedule, q, send)
+                    )
+                self.schedules.setdefault(code, []).append(schedule)
+        for delay, q in plan:
+            if delay <= 0:
+                send(q, reserved)
+        return schedule
+
+    def fire(self, schedule: SliceSchedule, quantity: int, send: Callable):
+        with self.lock:
+            if not schedule.active:
+                return
+            schedule.pending -= quantity
+            if not schedule.pending:
+                self.remove(schedule)
+        send(quantity, True)
+
+    def remove(self, schedule: SliceSchedule):
+        schedule.active = False
+        schedules = self.schedules.get(schedule.code, [])
+        if schedule in schedules:
+            schedules.remove(schedule)
+        if not schedules:
+            self.schedules.pop(schedule.code, None)
+
+    def cancel(self, code: str, role: Optional[TradeRole] = None) -> int:
+        cancelled = 0
+        with self.lock:
+            for schedule in list(self.schedules.get(code, [])):
+                if role is not None and schedule.role != role:
+                    continue
+                for timer in schedule.timers:
+                    self.wheel.cancel(timer)
+                schedule.price_set.release(schedule.pending)
+                cancelled += schedule.pending
+                schedule.pending = 0
+                self.remove(schedule)
+        return cancelled
+
+    def cancel_all(self) -> int:
+        return sum(self.cancel(code) for code in list(self.schedules))
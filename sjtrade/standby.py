@@ -0,0 +1,298 @@
+"""hot standby for a primary SJTrader
+
+the standby process keep its own logged in SJTrader idle and mirror the
+primary book from the primary event bus, every Status event carry the full
+status and cond of a position. once heartbeats stop for timeout seconds it
+take over the order and quote callbacks, recover the working orders from the
+broker and carry on with the phases the primary did not finish.
+"""
+
+import time
+import threading
+import dataclasses
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from shioaji.constant import QuoteType, QuoteVersion, StockPriceType
+
+from .data import Snapshot
+from .events import EventKind, EventSubscriber, phase_key
+from .execution import CoverMode
+from .position import Position, PositionCond, PositionStatus, PriceSet
+from .registry import WORKING_STATUS, TradeRole
+from .trader import SJTrader, is_cover_action
+
+STATUS_FIELDS = tuple(f.name for f in dataclasses.fields(PositionStatus) if f.init)
+
+# phases talking to the broker, never repeated once the primary finished them
+PRIMARY_ONLY = ("place_entry_positions", "open_position_cover", "export_blotter")
+
+Phase = Tuple[Any, Callable, tuple]
+
+
+def price_set_of(d: Dict[str, Any]) -> PriceSet:
+    return PriceSet(
+        price=d["price"],
+        quantity=d["quantity"],
+        price_type=StockPriceType(d["price_type"]),
+        in_transit_quantity=d["in_transit_quantity"],
+    )
+
+
+def cond_of(d: Dict[str, Any]) -> PositionCond:
+    return PositionCond(
+        quantity=d["quantity"],
+        entry_price=[price_set_of(p) for p in d["entry_price"]],
+        stop_loss_price=[price_set_of(p) for p in d["stop_loss_price"]],
+        stop_profit_price=[price_set_of(p) for p in d["stop_profit_price"]],
+        cover_price=[price_set_of(p) for p in d["cover_price"]],
+    )
+
+
+class StandbyTrader:
+    """mirror a primary SJTrader, take over when its heartbeat is lost
+
+    failover is armed by the first heartbeat, so a standby started before
+    the primary never trade on its own. after takeover the primary must be
+    gone, a heartbeat seen then is logged as an error.
+    """
+
+    def __init__(
+        self,
+        trader: SJTrader,
+        subscriber: EventSubscriber,
+        timeout: float = 3.0,
+        plan: Optional[List[Phase]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.trader = trader
+        self.subscriber = subscriber
+        self.timeout = timeout
+        # failover happen within timeout + poll
+        self.poll = timeout / 4
+        self.plan = plan
+        self.clock = clock
+        self.primary: Optional[str] = None
+        self.seq = 0
+        self.last_heartbeat: Optional[float] = None
+        self.phases: Dict[Tuple[str, tuple], bool] = {}
+        self.active = False
+        self.futures: List[Future] = []
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            EventKind.Heartbeat.value: self.on_heartbeat,
+            EventKind.Phase.value: self.on_phase,
+            EventKind.Status.value: self.on_status,
+        }
+        # order state come from the primary stream until takeover
+        trader.api.set_order_callback(self.ignore_order_deal)
+
+    def ignore_order_deal(self, *_):
+        pass
+
+    def apply(self, event: Dict[str, Any]):
+        handler = self.handlers.get(event.get("kind"))
+        if handler is not None:
+            handler(event)
+
+    def on_heartbeat(self, event: Dict[str, Any]):
+        if self.active:
+            logger.error(
+                f"standby | heartbeat {event['seq']} from {event['name']} after takeover"
+            )
+            return
+        self.primary = event["name"]
+        self.seq = event["seq"]
+        self.last_heartbeat = self.clock()
+
+    def on_phase(self, event: Dict[str, Any]):
+        if not self.active:
+            self.phases[(event["handler"], tuple(event["args"]))] = event["done"]
+
+    def on_status(self, event: Dict[str, Any]):
+        if not self.active:
+            self.mirror(
+                event["code"], event["status"], event["cond"], event.get("open_price")
+            )
+
+    def mirror(
+        self,
+        code: str,
+        status: Dict[str, Any],
+        cond: Dict[str, Any],
+        open_price: Optional[float] = None,
+    ) -> Optional[Position]:
+        trader = self.trader
+        position = trader.positions.get(code)
+        if position is None:
+            contract = trader.contract_of(code)
+            if contract is None:
+                logger.warning(f"standby | {code} not exist in TW Stock.")
+                return None
+            position = trader.positions[code] = Position(
+                contract=contract, cond=cond_of(cond)
+            )
+            trader.snapshots[code] = Snapshot(price=0.0)
+        with position.lock:
+            position.cond = cond_of(cond)
+            for name in STATUS_FIELDS:
+                setattr(position.status, name, status[name])
+        if open_price is not None:
+            # the first tick already ran re_entry_order on the primary
+            trader.open_price.setdefault(code, open_price)
+        return position
+
+    def drain(self, timeout: float = 0.0) -> int:
+        """apply every event already received, wait up to timeout for the first"""
+        n = 0
+        event = self.subscriber.recv(timeout)
+        while event is not None:
+            self.apply(event)
+            n += 1
+            event = self.subscriber.recv(0.0)
+        return n
+
+    def check(self) -> bool:
+        if self.active or self.last_heartbeat is None:
+            return False
+        silent = self.clock() - self.last_heartbeat
+        if silent < self.timeout:
+            return False
+        logger.warning(
+            f"standby | {self.primary} silent for {silent:.1f}s after heartbeat "
+            f"{self.seq}, take over {len(self.trader.positions)} positions"
+        )
+        self.takeover()
+        return True
+
+    def takeover(self):
+        self.active = True
+        trader = self.trader
+        api = trader.api
+        started = self.clock()
+        # callbacks first, a deal in between is counted rather than lost
+        api.set_order_callback(trader.order_deal_handler)
+        self.recover_trades()
+        # the bus drop events under load, the broker hold the true size
+        with logger.catch():
+            trader.sync_open_quantity(api)
+        self.seed_open_price()
+        for code, position in trader.positions.items():
+            if position.status.done:
+                continue
+            api.quote.subscribe(position.contract, version=QuoteVersion.v1)
+            if trader.subscribe_bidask or trader.cover_mode == CoverMode.Peg:
+                api.quote.subscribe(
+                    position.contract,
+                    quote_type=QuoteType.BidAsk,
+                    version=QuoteVersion.v1,
+                )
+        self.futures = self.resume_phases()
+        logger.info(f"standby | took over in {self.clock() - started:.3f}s")
+
+    def seed_open_price(self) -> List[str]:
+        """codes whose re-entry is already at the broker count as opened
+
+        covers a primary lost between its first tick and the Status event
+        carrying open_price, re_entry_order would send it a second time.
+        """
+        trader = self.trader
+        seeded = []
+        for code, position in trader.positions.items():
+            status = position.status
+            if code in trader.open_price or not status.cancel_preorder:
+                continue
+            if status.working_orders or status.open_quantity:
+                trader.open_price[code] = trader.snapshots[code].price
+                seeded.append(code)
+        if seeded:
+            logger.info(f"standby | re-entry already sent for {seeded}")
+        return seeded
+
+    def recover_trades(self) -> int:
+        """register the working orders of the primary from the broker"""
+        trader = self.trader
+        api = trader.api
+        api.update_status()
+        for position in trader.positions.values():
+            position.status.working_orders = 0
+        n = 0
+        for trade in api.list_trades():
+            order = trade.order
+            if (
+                order.custom_field != trader.name
+                or trade.status.status not in WORKING_STATUS
+            ):
+                continue
+            position = trader.positions.get(trade.contract.code)
+            if position is None:
+                logger.error(f"standby | working order {order.id} of unknown position")
+                continue
+            cond = position.cond
+            if is_cover_action(order.action, cond.quantity):
+                role = TradeRole.Cover
+                price_sets = (
+                    cond.cover_price + cond.stop_loss_price + cond.stop_profit_price
+                )
+            else:
+                role = TradeRole.Entry
+                price_sets = cond.entry_price
+            # a cancel has to release the reservation made by the primary
+            price_set = next((p for p in price_sets if p.in_transit_quantity), None)
+            with position.lock:
+                record = trader.registry.register(trade, position, role, price_set)
+                trader.risk_gate.on_recover(
+                    position.contract,
+                    record.remaining,
+                    reduce_only=role == TradeRole.Cover,
+                )
+            if role == TradeRole.Cover:
+                position.cover_trades.append(record)
+            else:
+                position.entry_trades.append(record)
+            n += 1
+        logger.info(f"standby | recovered {n} working orders")
+        return n
+
+    def resume_phases(self) -> List[Future]:
+        """replay started phases in order now, schedule the rest"""
+        trader = self.trader
+        plan = self.plan if self.plan is not None else trader.phase_plan()
+        futures = []
+        for t, func, args in plan:
+            key = phase_key(func, args)
+            done = self.phases.get(key)
+            if done is None:
+                futures.append(trader.executor_on_time(t, func, *args))
+            elif key[0] in PRIMARY_ONLY:
+                if not done:
+                    if key[0] == "place_entry_positions":
+                        logger.error(
+                            "standby | primary died placing entries, check the book"
+                        )
+                        continue
+                    func(*args)
+            else:
+                # local state such as the tick handler, rebuild in plan order
+                func(*args)
+        return futures
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if not self.drain(self.poll) and self.last_heartbeat is None:
+                # primary bus may come up after the standby
+                self.subscriber.subscribe()
+            if self.check():
+                return
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
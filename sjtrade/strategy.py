@@ -1,20 +1,38 @@
+import math
 import shioaji as sj
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple
 from loguru import logger
 from shioaji.constant import StockPriceType
 
-from .io.file import read_position
+from .io.file import iter_position
 from .utils import price_round, price_limit
 from .position import Position, PriceSet
 from .data import Snapshot
+from .batch import OrderIntents, TickBatch
 
 
 class StrategyBase:
     name: str
+    # decisions fully described by entry, stop and on close price sets
+    pure_threshold: bool = False
+    # > 0 feed intraday ticks to on_ticks in batches of this many microseconds
+    batch_window_us: int = 0
 
     def entry_positions(self):
         raise NotImplementedError()
 
+    def iter_entry_positions(self) -> Iterator[Dict[str, Any]]:
+        """entry plans one at a time, the trader send each as soon as it come"""
+        return iter(self.entry_positions())
+
+    def on_ticks(self, batch: TickBatch) -> Optional[OrderIntents]:
+        """intents only cover open positions, quantity > 0 buy and < 0 sell
+
+        an intent in the direction of the position is skipped, the size is
+        capped at the open quantity not already covered by working orders.
+        """
+        return None
+
     def cover_price_set(self, position: Position, snapshot: Optional[Snapshot] = None):
         raise NotImplementedError()
 
@@ -42,80 +60,111 @@ class StrategyBase:
         return positions
 
 
+def largest_notional_first(contract, pos: int) -> float:
+    return -contract.reference * contract.unit * abs(pos)
+
+
 class StrategyBasic(StrategyBase):
+    pure_threshold = True
+
     def __init__(
         self,
         entry_pct: float = 0.05,
         stop_loss_pct: float = 0.09,
         stop_profit_pct: float = 0.09,
         position_filepath: str = "position.txt",
-        contracts: sj.contracts.Contracts = sj.contracts.Contracts(),
+        contracts: Optional[sj.contracts.Contracts] = None,
     ) -> None:
         self.position_filepath = position_filepath
         self.entry_pct = entry_pct
         self.stop_loss_pct = stop_loss_pct
         self.stop_profit_pct = stop_profit_pct
-        self.contracts = contracts
+        self.contracts = (
+            contracts if contracts is not None else sj.contracts.Contracts()
+        )
         self.name = "dt1"
-        self.read_position_func = read_position
+        self.read_position_func = iter_position
+        # key of (contract, pos), smaller send first, e.g. largest_notional_first
+        self.entry_priority: Optional[Callable[[Any, int], float]] = None
 
     def entry_positions(self):
+        return list(self.iter_entry_positions())
+
+    def iter_entry_positions(self) -> Iterator[Dict[str, Any]]:
         positions = self.read_position_func(self.position_filepath)
-        entry_args = []
-        for code, pos in positions.items():
-            contract = self.contracts.Stocks[code]
-            if not contract:
-                logger.warning(f"Code: {code} not exist in TW Stock.")
+        rows = positions.items() if isinstance(positions, Mapping) else positions
+        rows = self.unique_rows(rows)
+        if self.entry_priority is not None:
+            # ranking need every row, pricing and sending still go one by one
+            rows = sorted(rows, key=self.entry_rank)
+        for code, pos in rows:
+            entry_arg = self.entry_plan(code, pos)
+            if entry_arg is not None:
+                yield entry_arg
+
+    def unique_rows(self, rows: Iterable[Tuple[str, int]]) -> Iterator[Tuple[str, int]]:
+        seen = set()
+        for code, pos in rows:
+            if code in seen:
+                # the first row may already be priced and sent, it is not replaced
+                logger.warning(f"Code: {code} listed again with {pos}, skipped.")
                 continue
-            stop_loss_price = contract.reference * (
-                1 + (-1 if pos > 0 else 1) * (self.stop_loss_pct)
-            )
-            stop_loss_price = price_round(stop_loss_price, pos > 0)
-            stop_loss_price = price_limit(
-                stop_loss_price, contract.limit_up, contract.limit_down
-            )
-            stop_profit_price = contract.reference * (
-                1 + (1 if pos > 0 else -1) * (self.stop_profit_pct)
-            )
-            stop_profit_price = price_round(stop_profit_price, pos < 0)
-            stop_profit_price = price_limit(
-                stop_profit_price, contract.limit_up, contract.limit_down
-            )
-            entry_price = contract.reference * (
-                1 + (-1 if pos > 0 else 1) * self.entry_pct
-            )
-            entry_price = price_round(entry_price, pos > 0)
-            entry_price = price_limit(
-                entry_price, contract.limit_up, contract.limit_down
-            )
-            entry_args.append(
-                {
-                    "code": code,
-                    "pos": pos,
-                    "entry_price": [
-                        PriceSet(
-                            price=entry_price,
-                            quantity=pos,
-                            price_type=StockPriceType.LMT,
-                        )
-                    ],
-                    "stop_profit_price": [
-                        PriceSet(
-                            price=stop_profit_price,
-                            quantity=pos,
-                            price_type=StockPriceType.MKT,
-                        )
-                    ],
-                    "stop_loss_price": [
-                        PriceSet(
-                            price=stop_loss_price,
-                            quantity=pos,
-                            price_type=StockPriceType.MKT,
-                        )
-                    ],
-                }
-            )
-        return entry_args
+            seen.add(code)
+            yield code, pos
+
+    def entry_rank(self, row) -> float:
+        contract = self.contracts.Stocks[row[0]]
+        if not contract:
+            return math.inf
+        return self.entry_priority(contract, row[1])
+
+    def entry_plan(self, code: str, pos: int) -> Optional[Dict[str, Any]]:
+        contract = self.contracts.Stocks[code]
+        if not contract:
+            logger.warning(f"Code: {code} not exist in TW Stock.")
+            return None
+        stop_loss_price = contract.reference * (
+            1 + (-1 if pos > 0 else 1) * (self.stop_loss_pct)
+        )
+        stop_loss_price = price_round(stop_loss_price, pos > 0)
+        stop_loss_price = price_limit(
+            stop_loss_price, contract.limit_up, contract.limit_down
+        )
+        stop_profit_price = contract.reference * (
+            1 + (1 if pos > 0 else -1) * (self.stop_profit_pct)
+        )
+        stop_profit_price = price_round(stop_profit_price, pos < 0)
+        stop_profit_price = price_limit(
+            stop_profit_price, contract.limit_up, contract.limit_down
+        )
+        entry_price = contract.reference * (1 + (-1 if pos > 0 else 1) * self.entry_pct)
+        entry_price = price_round(entry_price, pos > 0)
+        entry_price = price_limit(entry_price, contract.limit_up, contract.limit_down)
+        return {
+            "code": code,
+            "pos": pos,
+            "entry_price": [
+                PriceSet(
+                    price=entry_price,
+                    quantity=pos,
+                    price_type=StockPriceType.LMT,
+                )
+            ],
+            "stop_profit_price": [
+                PriceSet(
+                    price=stop_profit_price,
+                    quantity=pos,
+                    price_type=StockPriceType.MKT,
+                )
+            ],
+            "stop_loss_price": [
+                PriceSet(
+                    price=stop_loss_price,
+                    quantity=pos,
+                    price_type=StockPriceType.MKT,
+                )
+            ],
+        }
 
     def cover_price_set(self, position: Position, snapshot: Optional[Snapshot] = None):
         return self.cover_price_set_onclose(position)
@@ -0,0 +1,396 @@
+""" deterministic full-book stress harness
+
+drive SJTrader with SimulationShioaji on a virtual clock, no real sleep.
+
+    python -m sjtrade.stress --positions 5000 --tick-rate 0.05
+"""
+import heapq
+import time
+import random
+import argparse
+import datetime
+import itertools
+from typing import Callable, Dict, List, Optional
+from dataclasses import dataclass, field
+import shioaji as sj
+from loguru import logger
+from shioaji.constant import Exchange, OrderState
+
+from .trader import SJTrader
+from .strategy import StrategyBasic
+from .position import Position
+from .simulation_shioaji import SimulationShioaji
+from .utils import price_ceil, price_floor, price_limit, price_move, price_round
+
+
+def seconds_of(t: datetime.time) -> float:
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+
+class VirtualFuture:
+    __slots__ = ("fn", "args", "kwargs", "done", "value")
+
+    def __init__(self, fn: Callable, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.done = False
+        self.value = None
+
+    def run(self):
+        if not self.done:
+            self.done = True
+            self.value = self.fn(*self.args, **self.kwargs)
+        return self.value
+
+    def result(self, timeout: Optional[float] = None):
+        return self.run()
+
+
+class EventLoop:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+        self.queue: list = []
+        self.counter = itertools.count()
+
+    def call_at(self, ts: float, fn: Callable, *args, **kwargs) -> VirtualFuture:
+        future = VirtualFuture(fn, *args, **kwargs)
+        heapq.heappush(self.queue, (ts, next(self.counter), future))
+        return future
+
+    def call_later(self, delay: float, fn: Callable, *args, **kwargs) -> VirtualFuture:
+        return self.call_at(self.now + delay, fn, *args, **kwargs)
+
+    def run_until(self, ts: float):
+        while self.queue and self.queue[0][0] <= ts:
+            event_ts, _, future = heapq.heappop(self.queue)
+            self.now = max(self.now, event_ts)
+            future.run()
+        self.now = max(self.now, ts)
+
+
+class VirtualExecutor:
+    def __init__(self, loop: EventLoop, delay: float = 0.0):
+        self.loop = loop
+        self.delay = delay
+
+    def submit(self, fn: Callable, *args, **kwargs) -> VirtualFuture:
+        return self.loop.call_later(self.delay, fn, *args, **kwargs)
+
+
+@dataclass
+class SyntheticTick:
+    code: str
+    datetime: datetime.datetime
+    close: float
+    simtrade: bool
+    volume: int = 1
+
+
+class StubQuote:
+    def __init__(self):
+        self.on_tick: Optional[Callable] = None
+        self.on_bidask: Optional[Callable] = None
+        self.subscribed: Dict[str, int] = {}
+
+    def subscribe(self, contract: sj.contracts.Contract, *args, **kwargs):
+        self.subscribed[contract.code] = self.subscribed.get(contract.code, 0) + 1
+
+    def unsubscribe(self, contract: sj.contracts.Contract, *args, **kwargs):
+        self.subscribed.pop(contract.code, None)
+
+    def set_on_tick_stk_v1_callback(self, func: Callable):
+        self.on_tick = func
+
+    def set_on_bidask_stk_v1_callback(self, func: Callable):
+        self.on_bidask = func
+
+    def set_event_callback(self, func: Callable):
+        pass
+
+
+class StubApi:
+    def __init__(self, contracts: sj.contracts.Contracts):
+        self.Contracts = contracts
+        self.quote = StubQuote()
+
+    def set_order_callback(self, func: Callable):
+        pass
+
+    def update_status(self, *args, **kwargs):
+        pass
+
+
+def gen_contracts_raw(num: int, rng: random.Random) -> List[dict]:
+    contracts_raw = []
+    for i in range(num):
+        reference = price_round(rng.uniform(10, 500))
+        contracts_raw.append(
+            {
+                "security_type": "STK",
+                "exchange": "TSE",
+                "code": f"S{i:05d}",
+                "symbol": f"TSES{i:05d}",
+                "name": f"S{i:05d}",
+                "currency": "TWD",
+                "unit": 1000,
+                "limit_up": price_floor(reference * 1.1),
+                "limit_down": price_ceil(reference * 0.9),
+                "reference": reference,
+                "update_date": "2022/05/19",
+                "day_trade": "Yes",
+            }
+        )
+    return contracts_raw
+
+
+def build_contracts(contracts_raw: List[dict]) -> sj.contracts.Contracts:
+    contracts = sj.contracts.Contracts()
+    contracts.Stocks.append(sj.contracts.StreamStockContracts(contracts_raw))
+    contracts.Indexs.set_status_fetched()
+    contracts.Stocks.set_status_fetched()
+    contracts.Futures.set_status_fetched()
+    contracts.Options.set_status_fetched()
+    contracts.status = sj.contracts.FetchStatus.Fetched
+    return contracts
+
+
+class TickGenerator:
+    def __init__(
+        self,
+        contracts_raw: List[dict],
+        rng: random.Random,
+        max_move: int = 2,
+        limit_prob: float = 0.001,
+    ):
+        self.rng = rng
+        self.max_move = max_move
+        self.limit_prob = limit_prob
+        self.prices: Dict[str, float] = {}
+        self.limits: Dict[str, tuple] = {}
+        for c in contracts_raw:
+            self.prices[c["code"]] = c["reference"]
+            self.limits[c["code"]] = (c["limit_up"], c["limit_down"])
+
+    def next_interval(self, rate: float) -> float:
+        return self.rng.expovariate(rate)
+
+    def next_tick(
+        self, code: str, dt: datetime.datetime, simtrade: bool
+    ) -> SyntheticTick:
+        up, down = self.limits[code]
+        if self.rng.random() < self.limit_prob:
+            price = up if self.rng.random() < 0.5 else down
+        else:
+            move = self.rng.randint(-self.max_move, self.max_move)
+            price = price_limit(price_move(self.prices[code], move), up, down)
+        self.prices[code] = price
+        return SyntheticTick(
+            code=code,
+            datetime=dt,
+            close=price,
+            simtrade=simtrade,
+            volume=self.rng.randint(1, 20),
+        )
+
+
+def position_violations(position: Position) -> List[str]:
+    code = position.contract.code
+    status = position.status
+    target = position.cond.quantity
+    violations = []
+    if (target > 0 and status.open_quantity < 0) or (
+        target < 0 and status.open_quantity > 0
+    ):
+        violations.append(f"{code} | open_quantity {status.open_quantity} cross zero")
+    if abs(status.open_quantity) > abs(target):
+        violations.append(
+            f"{code} | open_quantity {status.open_quantity} over target {target}"
+        )
+    if abs(status.cover_quantity) > abs(status.entry_quantity):
+        violations.append(
+            f"{code} | over cover {status.cover_quantity} with entry {status.entry_quantity}"
+        )
+    for price_set in position.cond.stop_loss_price + position.cond.stop_profit_price:
+        if abs(price_set.in_transit_quantity) > abs(price_set.quantity):
+            violations.append(
+                f"{code} | in transit {price_set.in_transit_quantity} over {price_set.quantity}"
+            )
+    return violations
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        name: samples[min(int(n * q), n - 1)] * 1e6
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+    }
+
+
+@dataclass
+class StressReport:
+    positions: int
+    ticks: int = 0
+    orders: int = 0
+    deals: int = 0
+    wall_time: float = 0.0
+    latency_us: Dict[str, float] = field(default_factory=dict)
+    violations: List[str] = field(default_factory=list)
+    open_positions: int = 0
+
+    @property
+    def throughput(self) -> float:
+        return self.ticks / self.wall_time if self.wall_time else 0.0
+
+    def __str__(self) -> str:
+        latency = " ".join(f"{k}: {v:.1f}us" for k, v in self.latency_us.items())
+        return (
+            f"positions: {self.positions} | ticks: {self.ticks} | orders: {self.orders} "
+            f"| deals: {self.deals} | wall: {self.wall_time:.2f}s "
+            f"| throughput: {self.throughput:.0f} ticks/s | latency {latency} "
+            f"| open positions: {self.open_positions} | violations: {len(self.violations)}"
+        )
+
+
+class StressHarness:
+    def __init__(
+        self,
+        num_positions: int = 1000,
+        tick_rate: float = 0.05,
+        trial_rate: float = 0.1,
+        limit_prob: float = 0.001,
+        max_lots: int = 1500,
+        order_latency: float = 0.5,
+        end_time: datetime.time = datetime.time(13, 30),
+        seed: int = 0,
+        max_violations: int = 1000,
+    ):
+        self.rng = random.Random(seed)
+        self.tick_rate = tick_rate
+        self.trial_rate = trial_rate
+        self.end_time = end_time
+        self.max_violations = max_violations
+        self.contracts_raw = gen_contracts_raw(num_positions, self.rng)
+        self.positions = {
+            c["code"]: self.rng.choice((-1, 1)) * self.rng.randint(1, max_lots)
+            for c in self.contracts_raw
+        }
+        self.ticks = TickGenerator(self.contracts_raw, self.rng, limit_prob=limit_prob)
+        self.loop = EventLoop()
+        self.date = datetime.date(2022, 5, 25)
+        self.api = StubApi(build_contracts(self.contracts_raw))
+        self.trader = SJTrader(self.api, simulation=True)
+        self.trader.sleep = lambda sec: None
+        self.trader.simulation_api = SimulationShioaji(
+            self.order_deal_handler,
+            order_latency=0,
+            deal_latency=0,
+            executor=VirtualExecutor(self.loop, order_latency),
+            sleep=lambda sec: None,
+            seed=seed,
+        )
+        self.trader.stratagy = StrategyBasic(contracts=self.api.Contracts)
+        self.trader.stratagy.read_position_func = lambda filepath: self.positions
+        self.report = StressReport(positions=num_positions)
+        self.latency: List[float] = []
+
+    def record(self, violations: List[str]):
+        if len(self.report.violations) < self.max_violations:
+            self.report.violations.extend(violations)
+
+    def order_deal_handler(self, order_stats: OrderState, msg: Dict):
+        if order_stats == OrderState.StockOrder:
+            code = msg["contract"]["code"]
+            if msg["operation"]["op_type"] == "New":
+                self.report.orders += 1
+        else:
+            code = msg["code"]
+            self.report.deals += 1
+        self.trader.order_deal_handler(order_stats, msg)
+        position = self.trader.positions.get(code)
+        if position is not None:
+            self.record(position_violations(position))
+
+    def dispatch_tick(self, code: str, simtrade: bool, until: float):
+        ts = self.loop.now
+        tick = self.ticks.next_tick(
+            code,
+            datetime.datetime.combine(self.date, datetime.time())
+            + datetime.timedelta(seconds=ts),
+            simtrade,
+        )
+        handler = self.api.quote.on_tick
+        start = time.perf_counter()
+        try:
+            handler(Exchange.TSE, tick)
+        except Exception as e:
+            self.record([f"{code} | {type(e).__name__}: {e} at {tick}"])
+        self.latency.append(time.perf_counter() - start)
+        self.report.ticks += 1
+        position = self.trader.positions.get(code)
+        if position is not None:
+            self.record(position_violations(position))
+        rate = self.trial_rate if simtrade else self.tick_rate
+        next_ts = ts + self.ticks.next_interval(rate)
+        if next_ts < until:
+            self.loop.call_at(next_ts, self.dispatch_tick, code, simtrade, until)
+
+    def schedule_ticks(self, start: datetime.time, end: datetime.time, simtrade: bool):
+        rate = self.trial_rate if simtrade else self.tick_rate
+        start_ts, end_ts = seconds_of(start), seconds_of(end)
+        for code in self.positions:
+            ts = start_ts + self.ticks.next_interval(rate)
+            if ts < end_ts:
+                self.loop.call_at(ts, self.dispatch_tick, code, simtrade, end_ts)
+
+    def run(self) -> StressReport:
+        self.trader.set_on_tick_handler(self.trader.update_snapshot)
+        for t, func, args in self.trader.phase_plan():
+            self.loop.call_at(seconds_of(t), func, *args)
+        self.schedule_ticks(datetime.time(8, 55), datetime.time(8, 59, 59), True)
+        self.schedule_ticks(datetime.time(9, 0), self.end_time, False)
+        logger.disable("sjtrade")
+        start = time.perf_counter()
+        try:
+            self.loop.run_until(seconds_of(self.end_time))
+        finally:
+            logger.enable("sjtrade")
+        self.report.wall_time = time.perf_counter() - start
+        self.report.latency_us = percentiles(self.latency)
+        for position in self.trader.positions.values():
+            self.record(position_violations(position))
+            if position.status.open_quantity:
+                self.report.open_positions += 1
+        return self.report
+
+
+def run_stress(**kwargs) -> StressReport:
+    return StressHarness(**kwargs).run()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="sjtrade full-book stress harness")
+    parser.add_argument("--positions", type=int, default=1000)
+    parser.add_argument("--tick-rate", type=float, default=0.05)
+    parser.add_argument("--trial-rate", type=float, default=0.1)
+    parser.add_argument("--limit-prob", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    report = run_stress(
+        num_positions=args.positions,
+        tick_rate=args.tick_rate,
+        trial_rate=args.trial_rate,
+        limit_prob=args.limit_prob,
+        seed=args.seed,
+    )
+    print(report)
+    for violation in report.violations[:20]:
+        print(violation)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import math
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+from loguru import logger
+
+
+class Timer:
+    __slots__ = ("slot", "rounds", "func", "args", "cancelled")
+
+    def __init__(self, slot: int, rounds: int, func: Callable, args: tuple):
+        self.slot = slot
+        self.rounds = rounds
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    """hashed timer wheel, a single thread drives every scheduled callback
+
+    schedule and cancel are O(1), each tick only touches its own slot.
+    """
+
+    def __init__(
+        self,
+        resolution: float = 0.05,
+        slots: int = 512,
+        clock: Callable[[], float] = time.monotonic,
+        autostart: bool = True,
+    ):
+        self.resolution = resolution
+        self.slots = slots
+        self.clock = clock
+        self.autostart = autostart
+        self.buckets: List[Dict[Timer, None]] = [dict() for _ in range(slots)]
+        self.current = 0
+        self.last = clock()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def schedule(self, delay: float, func: Callable, *args) -> Timer:
+        ticks = max(1, math.ceil(delay / self.resolution))
+        with self.lock:
+            slot = (self.current + ticks) % self.slots
+            timer = Timer(slot, (ticks - 1) // self.slots, func, args)
+            self.buckets[slot][timer] = None
+        if self.autostart:
+            self.start()
+        return timer
+
+    def cancel(self, timer: Timer) -> bool:
+        with self.lock:
+            timer.cancelled = True
+            bucket = self.buckets[timer.slot]
+            if timer in bucket:
+                del bucket[timer]
+                return True
+            return False
+
+    def advance(self, now: Optional[float] = None) -> int:
+        now = self.clock() if now is None else now
+        fired = 0
+        while now - self.last >= self.resolution:
+            self.last += self.resolution
+            expired = []
+            with self.lock:
+                self.current = (self.current + 1) % self.slots
+                bucket = self.buckets[self.current]
+                for timer in list(bucket):
+                    if timer.rounds:
+                        timer.rounds -= 1
+                    else:
+                        bucket.pop(timer)
+                        expired.append(timer)
+            for timer in expired:
+                try:
+                    timer.func(*timer.args)
+                except Exception:
+                    logger.exception(f"timer callback {timer.func} failed")
+                fired += 1
+        return fired
+
+    def run(self):
+        while not self.stop_event.wait(self.resolution):
+            self.advance()
+
+    def start(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.last = self.clock()
+                    self.thread = threading.Thread(target=self.run, daemon=True)
+                    self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
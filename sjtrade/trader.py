@@ -1,31 +1,68 @@
 import time
 import datetime
+import functools
+import dataclasses
 import operator
-from typing import Callable, Dict, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
 from concurrent.futures import Future, ThreadPoolExecutor
 import shioaji as sj
 
-from .utils import quantity_split, sleep_until
+from .utils import session_date, sleep_until
 from .data import Snapshot
-from .simulation_shioaji import SimulationShioaji
 from .strategy import StrategyBasic
 from .position import Position, PositionCond, PriceSet, PositionStatus
+from .risk import RiskGate
+from .execution import CoverMode, PegConfig, PegOrder, peg_price
+from .registry import TradeRecord, TradeRegistry, TradeRole
+from .shared import PRICE_TYPE_MKT, SharedMarketState
+from .slicing import OrderSlicer, RecentVolume, SliceConfig, plan_slices
+from .timer import TimerWheel
+from .preopen import LimitLockMonitor
+from .dispatch import OrderDispatcher, OrderPriority
+from .batch import TickBatch, TickBatcher
+from .trailing import TrailingStop
+from .watchdog import QuoteWatchdog
+from .events import EventBus, EventKind, phase_key
+from .session import ScheduledPhase, SessionPlan
+from .contracts import ContractCache, ContractTable
+from .io.blotter import Blotter
 from loguru import logger
 from shioaji.constant import (
     Action,
     StockPriceType,
     OrderType,
     QuoteVersion,
+    QuoteType,
     Exchange,
     OrderState,
 )
 
 
-logger.add("sjtrader.log", rotation="1 days")
+_log_sink_id: Optional[int] = None
+
+
+def add_file_sink(path: str = "sjtrader.log") -> int:
+    global _log_sink_id
+    if _log_sink_id is None:
+        _log_sink_id = logger.add(path, rotation="1 days")
+    return _log_sink_id
+
+
+def __getattr__(name: str):
+    if name == "SimulationShioaji":
+        from .simulation_shioaji import SimulationShioaji
+
+        return SimulationShioaji
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def is_cover_action(action: Action, quantity: int) -> bool:
+    return (action == Action.Sell) == (quantity > 0)
 
 
 class SJTrader:
     def __init__(self, api: sj.Shioaji, simulation: bool = False):
+        add_file_sink()
         self.api = api
         self.positions: Dict[str, Position] = {}
         self.snapshots: Dict[str, Snapshot] = {}
@@ -37,11 +74,64 @@ class SJTrader:
         self.name = "dt1"
         self.executor = ThreadPoolExecutor()
         self.simulation = simulation
+        self.sleep = time.sleep
+        self.subscribe_bidask = False
+        self.cover_mode = CoverMode.Market
+        self.peg_config = PegConfig()
+        self.peg_orders: Dict[str, List[PegOrder]] = {}
+        self.market_state: Optional[SharedMarketState] = None
+        self.timer_wheel = TimerWheel()
+        self.slicer = OrderSlicer(self.timer_wheel)
+        self.entry_slicing = SliceConfig()
+        self.cover_slicing = SliceConfig()
+        self.recent_volume: Dict[str, RecentVolume] = {}
+        self.preopen_monitor: Optional[LimitLockMonitor] = None
+        self.preopen_batch_delay = 0.0
+        self.preopen_flush_scheduled = False
+        self.blotter = Blotter()
+        self.blotter_path: Optional[str] = None
+        # single sender queue putting covers ahead of cancels and entries, None send inline
+        self.dispatcher: Optional[OrderDispatcher] = None
+        # set at entry when the strategy asks for on_ticks batches
+        self.tick_batcher: Optional[TickBatcher] = None
+        # when set, start follow its calendar and phases instead of the fixed times
+        self.session_plan: Optional[SessionPlan] = None
+        self.schedule: List[ScheduledPhase] = []
+        # flat or cancelled codes dropped from the intraday tick path
+        self.retired_codes: Set[str] = set()
+        self.retire_flat = True
+        self.unsubscribe_flat = False
+        # codes whose snapshot is still needed after they are retired
+        self.watch_codes: Set[str] = set()
         if simulation:
+            from .simulation_shioaji import SimulationShioaji
+
             self.simulation_api = SimulationShioaji(self.order_deal_handler)
         self.api.set_order_callback(self.order_deal_handler)
         self.api.quote.set_event_callback(self.sj_event_handel)
+        self.api.quote.set_on_bidask_stk_v1_callback(self.update_bidask)
         self.stratagy = StrategyBasic(contracts=self.api.Contracts)
+        # per trading date contract files, entry plan from them before the download finish
+        self.contract_cache: Optional[ContractCache] = None
+        self.contract_table: Optional[ContractTable] = None
+        self.risk_gate = RiskGate()
+        self.registry = TradeRegistry()
+        self.stop_enabled = True
+        # trail the stop loss this many ladder ticks behind the best price, 0 keep it fixed
+        self.trailing_ticks = 0
+        self.trailing_stops: Dict[str, TrailingStop] = {}
+        # > 0 resubscribe open positions without a tick for this many seconds
+        self.stale_quote_seconds = 0.0
+        # also cover them at market
+        self.stale_quote_cover = False
+        self.quote_watchdog: Optional[QuoteWatchdog] = None
+        # structured events for external monitors, None publish nothing
+        self.event_bus: Optional[EventBus] = None
+        # heartbeat on the event bus for a standby process, 0 send none
+        self.heartbeat_interval = 0.0
+        self.heartbeat_seq = 0
+        # (handler, arg names) -> finished, replayed to late subscribers
+        self.phases: Dict[Tuple[str, tuple], bool] = {}
         # self.account = api.stock_account
         # self.entry_trades: Dict[str, sj.order.Trade] = {}
 
@@ -51,31 +141,198 @@ class SJTrader:
         cancel_preorder_time: datetime.time = datetime.time(8, 54, 59),
         intraday_handler_time: datetime.time = datetime.time(8, 59, 55),
         cover_time: datetime.time = datetime.time(13, 25, 59),
+        blotter_time: datetime.time = datetime.time(13, 35),
     ):
         self.set_on_tick_handler(self.update_snapshot)
-        entry_future = self.executor_on_time(entry_time, self.place_entry_positions)
-        self.executor_on_time(
+        plan = self.phase_plan(
+            entry_time,
             cancel_preorder_time,
-            self.set_on_tick_handler,
-            self.cancel_preorder_handler,
-        )
-        self.executor_on_time(
             intraday_handler_time,
-            self.set_on_tick_handler,
-            self.intraday_handler,
+            cover_time,
+            blotter_time,
         )
-        self.executor_on_time(cover_time, self.open_position_cover)
-        return entry_future
+        # started in the evening the session is the next day, not today
+        self.blotter.set_date(self.trading_day())
+        if self.contract_cache is not None:
+            self.load_contract_cache()
+            self.executor.submit(self.sync_contract_cache)
+        if self.event_bus is not None and self.heartbeat_interval > 0:
+            self.serve_standby()
+        futures = [self.executor_on_time(t, func, *args) for t, func, args in plan]
+        return futures[0]
 
-    def run_at(self, t: Union[datetime.time, tuple], func: Callable, *args, **kwargs):
+    def phase_plan(
+        self,
+        entry_time: datetime.time = datetime.time(8, 45),
+        cancel_preorder_time: datetime.time = datetime.time(8, 54, 59),
+        intraday_handler_time: datetime.time = datetime.time(8, 59, 55),
+        cover_time: datetime.time = datetime.time(13, 25, 59),
+        blotter_time: datetime.time = datetime.time(13, 35),
+    ) -> List[Tuple[Union[datetime.time, datetime.datetime], Callable, tuple]]:
+        if self.session_plan is not None:
+            self.schedule = self.session_plan.schedule()
+            for scheduled in self.schedule:
+                logger.info(f"session plan | {scheduled}")
+            plan = self.session_plan.bind(self, self.schedule)
+            # configured ones, a phase skipped for the day stay skipped
+            listed = {phase.handler for phase in self.session_plan.phases}
+            intraday_at = next(
+                (
+                    scheduled.at
+                    for scheduled in self.schedule
+                    if scheduled.phase.tick_handler == "intraday_handler"
+                ),
+                None,
+            )
+            blotter_at = None
+            if self.schedule:
+                last = self.schedule[-1].at
+                blotter_at = max(
+                    last,
+                    datetime.datetime.combine(last.date(), blotter_time, last.tzinfo),
+                )
+        else:
+            plan = [
+                (entry_time, self.place_entry_positions, ()),
+                (
+                    cancel_preorder_time,
+                    self.set_on_tick_handler,
+                    (self.cancel_preorder_handler,),
+                ),
+                (
+                    intraday_handler_time,
+                    self.set_on_tick_handler,
+                    (self.intraday_handler,),
+                ),
+                (cover_time, self.open_position_cover, ()),
+            ]
+            listed = set()
+            intraday_at, blotter_at = intraday_handler_time, blotter_time
+        # a session plan may list them as phases itself
+        if (
+            self.stale_quote_seconds > 0
+            and intraday_at is not None
+            and "start_quote_watchdog" not in listed
+        ):
+            plan.append((intraday_at, self.start_quote_watchdog, ()))
+        if self.blotter_path and blotter_at is not None and "export_blotter" not in listed:
+            # after the close auction deals are back
+            plan.append((blotter_at, self.export_blotter, ()))
+        return plan
+
+    def run_at(
+        self,
+        t: Union[datetime.time, datetime.datetime, tuple],
+        func: Callable,
+        *args,
+        **kwargs,
+    ):
         sleep_until(t)
-        return func(*args, **kwargs)
+        key = phase_key(func, args)
+        self.phases[key] = False
+        self.emit(EventKind.Phase, handler=key[0], args=list(key[1]), done=False)
+        result = func(*args, **kwargs)
+        self.phases[key] = True
+        self.emit(EventKind.Phase, handler=key[0], args=list(key[1]), done=True)
+        return result
 
     def executor_on_time(
-        self, t: Union[datetime.time, tuple], func: Callable, *args, **kwargs
+        self,
+        t: Union[datetime.time, datetime.datetime, tuple],
+        func: Callable,
+        *args,
+        **kwargs,
     ) -> Future:
         return self.executor.submit(self.run_at, t, func, *args, **kwargs)
 
+    def trading_day(self) -> datetime.date:
+        if self.schedule:
+            return self.schedule[0].at.date()
+        return session_date()
+
+    def load_contract_cache(self, day: Optional[datetime.date] = None) -> bool:
+        day = day or self.trading_day()
+        start = time.perf_counter()
+        table = self.contract_cache.load(day)
+        if table is None:
+            logger.info(f"contract cache | no usable file for {day}")
+            return False
+        self.contract_table = table
+        self.stratagy.contracts = table
+        logger.info(
+            f"contract cache | {len(table)} contracts of {day} loaded in "
+            f"{(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return True
+
+    def sync_contract_cache(self, day: Optional[datetime.date] = None) -> List[str]:
+        """check the cached table against the live download and save it for day"""
+        day = day or self.trading_day()
+        contracts = self.api.Contracts
+        if not contracts:
+            self.api.fetch_contracts(contract_download=True)
+        live = ContractTable.from_contracts(contracts)
+        changed = []
+        if self.contract_table is not None:
+            changed = self.contract_table.diff(live)
+            for code in changed:
+                logger.warning(
+                    f"contract cache | {code} cached {self.contract_table[code]} "
+                    f"live {live[code]}"
+                    + (" used by a position" if code in self.positions else "")
+                )
+            # in place, the strategy hold the same table
+            self.contract_table.update(live)
+        self.contract_cache.save(live, day)
+        logger.info(f"contract cache | {len(live)} contracts of {day} saved")
+        return changed
+
+    def contract_of(self, code: str) -> Optional[sj.contracts.Contract]:
+        # Stocks[code] block until fetched, the cached ref is enough to trade
+        if self.contract_table is not None and not self.api.Contracts:
+            ref = self.contract_table[code]
+            return ref.to_contract() if ref is not None else None
+        return self.api.Contracts.Stocks[code]
+
+    def emit(self, kind: EventKind, **fields):
+        if self.event_bus is not None:
+            self.event_bus.publish(kind, **fields)
+
+    def emit_status(self, position: Position):
+        if self.event_bus is not None:
+            # copied under the position lock, serialized later off thread
+            self.emit(
+                EventKind.Status,
+                code=position.contract.code,
+                status=dataclasses.asdict(position.status),
+                cond=dataclasses.asdict(position.cond),
+                open_price=self.open_price.get(position.contract.code),
+            )
+
+    def emit_book(self, *_):
+        """phases run so far and every position, enough to rebuild the book"""
+        for (handler, args), done in list(self.phases.items()):
+            self.emit(EventKind.Phase, handler=handler, args=list(args), done=done)
+        for position in list(self.positions.values()):
+            with position.lock:
+                self.emit_status(position)
+
+    def serve_standby(self):
+        # a standby joining late get the whole book replayed
+        self.event_bus.on_subscribe = self.emit_book
+        self.timer_wheel.schedule(self.heartbeat_interval, self.heartbeat)
+
+    def heartbeat(self):
+        self.heartbeat_seq += 1
+        self.emit(
+            EventKind.Heartbeat,
+            name=self.name,
+            seq=self.heartbeat_seq,
+            positions=len(self.positions),
+        )
+        if self.heartbeat_interval > 0:
+            self.timer_wheel.schedule(self.heartbeat_interval, self.heartbeat)
+
     def set_on_tick_handler(self, func: Callable[[Exchange, sj.TickSTKv1], None]):
         self.api.quote.set_on_tick_stk_v1_callback(func)
 
@@ -128,10 +385,12 @@ class SJTrader:
         stop_profit_price: List[PriceSet],
         stop_loss_price: List[PriceSet],
     ):
-        api = self.simulation_api if self.simulation else self.api
-        contract = self.api.Contracts.Stocks[code]
+        contract = self.contract_of(code)
         if not contract:
             logger.warning(f"Code: {code} not exist in TW Stock.")
+        elif code in self.positions:
+            # a second plan would orphan the trades of the first position
+            logger.warning(f"{code} | already has a position, entry skipped.")
         else:
             position = self.positions[code] = Position(
                 contract=contract,
@@ -144,118 +403,367 @@ class SJTrader:
                 ),
             )
             self.snapshots[code] = Snapshot(price=0.0)
-            self.api.quote.subscribe(contract, version=QuoteVersion.v1)
             for price_set in position.cond.entry_price:
-                if abs(price_set.quantity) == abs(price_set.in_transit_quantity):
+                q = price_set.claim()
+                if not q:
                     continue
-                price, price_quantity = price_set.price, price_set.quantity
-                quantity_s = quantity_split(price_quantity, threshold=499)
-                with position.lock:
-                    for q in quantity_s:
-                        trade = api.place_order(
-                            contract=contract,
-                            order=sj.Order(
-                                price=price,
-                                quantity=abs(q),
-                                action=Action.Buy if pos > 0 else Action.Sell,
-                                price_type=price_set.price_type,
-                                order_type=OrderType.ROD,
-                                daytrade_short=False if pos > 0 else True,
-                                custom_field=self.name,
-                            ),
-                            timeout=0,
-                        )
-                        price_set.in_transit_quantity += q
-                        # position.status.entry_order_in_transit += q
-                        position.entry_trades.append(trade)
-                        logger.info(f"{code} | {trade.order}")
+                plan = plan_slices(
+                    q,
+                    self.entry_slicing,
+                    self.recent_volume_of(code),
+                )
+                self.slicer.submit(
+                    code,
+                    TradeRole.Entry,
+                    price_set,
+                    plan,
+                    functools.partial(
+                        self.dispatch_slice,
+                        OrderPriority.Entry,
+                        self.send_entry_slice,
+                        position,
+                        price_set,
+                    ),
+                    reserved=True,
+                )
+            # quotes are only needed from the preopen on, the order go out first
+            self.api.quote.subscribe(contract, version=QuoteVersion.v1)
+            if self.subscribe_bidask or self.cover_mode == CoverMode.Peg:
+                self.api.quote.subscribe(
+                    contract, quote_type=QuoteType.BidAsk, version=QuoteVersion.v1
+                )
+
+    def dispatch(self, priority: OrderPriority, func: Callable, *args):
+        if self.dispatcher is None:
+            return func(*args)
+        return self.dispatcher.submit(priority, func, *args)
+
+    def dispatch_slice(
+        self,
+        priority: OrderPriority,
+        send: Callable,
+        position: Position,
+        price_set: PriceSet,
+        q: int,
+        reserved: bool = False,
+    ):
+        if self.dispatcher is None:
+            return send(position, price_set, q, reserved)
+        if not reserved:
+            # reserve while queued so stop checks see it as in transit
+            price_set.reserve(q)
+        return self.dispatcher.submit(priority, send, position, price_set, q, True)
+
+    def drop_queued_entries(self, position: Optional[Position] = None) -> int:
+        if self.dispatcher is None:
+            return 0
+        dropped = self.dispatcher.cancel(
+            OrderPriority.Entry,
+            lambda job: job.func in (self.send_entry_slice, self.send_re_entry_order)
+            and (position is None or job.args[0] is position),
+        )
+        for job in dropped:
+            if job.func == self.send_re_entry_order:
+                self.registry.hold(job.args[0], -1)
+                continue
+            _, price_set, q, _ = job.args
+            price_set.release(q)
+        return len(dropped)
+
+    def send_entry_slice(
+        self, position: Position, price_set: PriceSet, q: int, reserved: bool = False
+    ):
+        api = self.simulation_api if self.simulation else self.api
+        contract = position.contract
+        with position.lock:
+            order = sj.Order(
+                price=price_set.price,
+                quantity=abs(q),
+                action=Action.Buy if position.cond.quantity > 0 else Action.Sell,
+                price_type=price_set.price_type,
+                order_type=OrderType.ROD,
+                daytrade_short=False if position.cond.quantity > 0 else True,
+                custom_field=self.name,
+            )
+            if not self.risk_gate.check(contract, order):
+                if reserved:
+                    price_set.release(q)
+                return
+            trade = api.place_order(
+                contract=contract,
+                order=order,
+                timeout=0,
+            )
+            if not reserved:
+                price_set.reserve(q)
+            # position.status.entry_order_in_transit += q
+            position.entry_trades.append(
+                self.registry.register(trade, position, TradeRole.Entry, price_set)
+            )
+            logger.info(f"{contract.code} | {trade.order}")
 
     def place_entry_positions(self) -> Dict[str, Position]:
         api = self.simulation_api if self.simulation else self.api
-        for entry_kwarg in self.stratagy.entry_positions():
+        # each plan is sent as soon as the strategy yield it
+        self.blotter.set_date(self.trading_day())
+        for entry_kwarg in self.stratagy.iter_entry_positions():
             self.place_entry_order(**entry_kwarg)
         api.update_status()
+        self.preopen_monitor = LimitLockMonitor(self.positions)
+        window = getattr(self.stratagy, "batch_window_us", 0)
+        if window > 0:
+            self.tick_batcher = TickBatcher(
+                list(self.positions), window, self.on_tick_batch, self.timer_wheel
+            )
         return self.positions
 
     def update_snapshot(self, exchange: Exchange, tick: sj.TickSTKv1):
-        self.snapshots[tick.code].price = tick.close
+        snapshot = self.snapshots[tick.code]
+        snapshot.update_tick(tick)
+        if self.quote_watchdog is not None:
+            self.quote_watchdog.touch(tick.code)
+        if self.market_state is not None:
+            self.market_state.write(tick.code, snapshot)
+        if not tick.simtrade and tick.volume:
+            recent = self.recent_volume.get(tick.code)
+            if recent is None:
+                recent = self.recent_volume[tick.code] = RecentVolume()
+            recent.update(tick.volume, time.monotonic())
+
+    def recent_volume_of(self, code: str) -> Optional[float]:
+        recent = self.recent_volume.get(code)
+        return recent.value if recent is not None else None
+
+    def update_bidask(self, exchange: Exchange, bidask: sj.BidAskSTKv1):
+        snapshot = self.snapshots.get(bidask.code)
+        if snapshot is not None:
+            snapshot.update_bidask(bidask)
+            if self.market_state is not None:
+                self.market_state.write(bidask.code, snapshot)
+            if bidask.code in self.peg_orders:
+                self.reprice_peg_orders(self.positions[bidask.code], snapshot)
 
     def cancel_preorder_handler(self, exchange: Exchange, tick: sj.TickSTKv1):
-        position = self.positions[tick.code]
-        if self.simulation:
-            api = self.simulation_api
-        else:
-            api = self.api
         # 8:55 - 8:59:55
-        if tick.simtrade:
-            if (
-                position.cond.quantity < 0
-                and float(tick.close) == position.contract.limit_up
-            ):
-                with position.lock:
-                    position.status.cancel_preorder = True
-                for trade in self.positions[tick.code].entry_trades:
-                    if trade.status.status != sj.order.Status.Cancelled:
-                        api.cancel_order(trade)
-                        logger.info(f"{trade.contract.code} | {trade.order}")
-                        api.update_status(trade=trade)
-                        # check handle
-                        # self.update_status(trade)
-                        # if trade.status.status == sj.order.Status.Cancelled:
-                        #     position.cancel_preorder = True
-                        # else:
-                        #     logger.warning("position {} not cancel....")
-                        # TODO handel it
+        if not tick.simtrade:
+            return
+        monitor = self.preopen_monitor
+        if monitor is None:
+            monitor = self.preopen_monitor = LimitLockMonitor(self.positions)
+        if monitor.check(tick) is None:
+            return
+        if self.preopen_batch_delay <= 0:
+            self.flush_preorder_cancel()
+        elif not self.preopen_flush_scheduled:
+            # coalesce positions locking within the delay into one batch
+            self.preopen_flush_scheduled = True
+            self.timer_wheel.schedule(
+                self.preopen_batch_delay, self.flush_preorder_cancel
+            )
+
+    def flush_preorder_cancel(self) -> int:
+        self.preopen_flush_scheduled = False
+        if self.preopen_monitor is None:
+            return 0
+        positions = self.preopen_monitor.drain()
+        if not positions:
+            return 0
+        api = self.simulation_api if self.simulation else self.api
+        trades = []
+        for position in positions:
+            with position.lock:
+                position.status.cancel_preorder = True
+            self.slicer.cancel(position.contract.code, TradeRole.Entry)
+            self.drop_queued_entries(position)
+            for record in position.entry_trades:
+                # only working orders still hold their trade
+                trade = record.trade
+                if (
+                    trade is not None
+                    and trade.status.status != sj.order.Status.Cancelled
+                ):
+                    trades.append((position, trade))
+        if self.dispatcher is not None:
+            futures = [
+                (
+                    position,
+                    trade,
+                    self.dispatcher.submit(OrderPriority.Cancel, api.cancel_order, trade),
+                )
+                for position, trade in trades
+            ]
+        else:
+            futures = [
+                (position, trade, self.executor.submit(api.cancel_order, trade))
+                for position, trade in trades
+            ]
+        for position, trade, future in futures:
+            err = future.exception()
+            if err is not None:
+                logger.error(f"{trade.contract.code} | cancel failed: {err}")
+                # retried on the next locked tick
+                self.preopen_monitor.rewatch(position)
+            else:
+                logger.info(f"{trade.contract.code} | {trade.order}")
+        # one refresh for the whole batch instead of a round trip per trade
+        api.update_status()
+        return len(trades)
 
     def re_entry_order(self, position: Position, tick: sj.TickSTKv1):
         # 9:00 -> first
-        if self.simulation:
-            api = self.simulation_api
-        else:
-            api = self.api
         if not tick.simtrade:
             if tick.code not in self.open_price:
                 self.open_price[tick.code] = tick.close
+                if self.event_bus is not None:
+                    # a standby must not take this first tick again
+                    with position.lock:
+                        self.emit_status(position)
                 if (
                     position.status.cancel_preorder
                     and float(tick.close) < position.cond.stop_loss_price[0].price
                 ):  # TODO check min or max
-                    trade = api.place_order(
-                        contract=position.contract,
-                        order=sj.order.StockOrder(
-                            price=0,
-                            quantity=abs(position.cond.quantity),
-                            action=Action.Buy
-                            if position.cond.quantity > 0
-                            else Action.Sell,
-                            price_type=StockPriceType.MKT,
-                            order_type=OrderType.ROD,
-                            daytrade_short=False
-                            if position.cond.quantity > 0
-                            else True,
-                            custom_field=self.name,
-                        ),
-                        timeout=0,
+                    self.emit(
+                        EventKind.Decision,
+                        code=tick.code,
+                        reason="re_entry",
+                        price=tick.close,
+                        trigger=position.cond.stop_loss_price[0].price,
+                        quantity=position.cond.quantity,
+                    )
+                    # pending until sent, a queued re-entry must not retire the code
+                    self.registry.hold(position)
+                    self.dispatch(
+                        OrderPriority.Entry, self.send_re_entry_order, position
                     )
-                    logger.info(f"{trade.contract.code} | {trade.order}")
-                    api.update_status(trade=trade)
+
+    def send_re_entry_order(self, position: Position):
+        if self.simulation:
+            api = self.simulation_api
+        else:
+            api = self.api
+        order = sj.order.StockOrder(
+            price=0,
+            quantity=abs(position.cond.quantity),
+            action=Action.Buy if position.cond.quantity > 0 else Action.Sell,
+            price_type=StockPriceType.MKT,
+            order_type=OrderType.ROD,
+            daytrade_short=False if position.cond.quantity > 0 else True,
+            custom_field=self.name,
+        )
+        try:
+            if not self.risk_gate.check(position.contract, order):
+                return
+            trade = api.place_order(
+                contract=position.contract,
+                order=order,
+                timeout=0,
+            )
+            position.entry_trades.append(
+                self.registry.register(trade, position, TradeRole.Entry)
+            )
+        finally:
+            # released after register, the position never look done in between
+            self.registry.hold(position, -1)
+        logger.info(f"{trade.contract.code} | {trade.order}")
+        api.update_status(trade=trade)
 
     def intraday_handler(self, exchange: Exchange, tick: sj.TickSTKv1):
+        if tick.code in self.retired_codes:
+            if tick.code in self.watch_codes:
+                self.update_snapshot(exchange, tick)
+            return
         if self.simulation:
             self.simulation_api.quote_callback(exchange, tick)
         position = self.positions[tick.code]
         self.re_entry_order(position, tick)
         self.update_snapshot(exchange, tick)
+        if self.tick_batcher is not None:
+            self.tick_batcher.append(tick)
+        if position.status.done:
+            if (
+                self.retire_flat
+                and not position.status.working_orders
+                and tick.code in self.open_price
+            ):
+                self.retire_position(position)
+            return
+        if self.trailing_ticks and not tick.simtrade:
+            self.trail_stop(position, float(tick.close))
         # 9:00 -> 13:24:49 stop loss stop profit
         self.stop_loss(position, tick)
         self.stop_profit(position, tick)
 
-    def stop_profit(self, position: Position, tick: sj.TickSTKv1):
-        if not tick.simtrade:
-            cover_quantity = position.status.open_quantity + (
-                position.status.cover_order_quantity - position.status.cover_quantity
+    def on_tick_batch(self, batch: TickBatch):
+        with logger.catch():
+            intents = self.stratagy.on_ticks(batch)
+            if not intents:
+                return
+            for slot, quantity, price, price_type in intents:
+                self.place_intent(batch.codes[slot], quantity, price, price_type)
+
+    def retire_position(self, position: Position):
+        code = position.contract.code
+        self.retired_codes.add(code)
+        logger.info(f"{code} | {position.status.state.value}, retire from tick handler")
+        if self.quote_watchdog is not None:
+            self.quote_watchdog.unwatch(code)
+        if self.unsubscribe_flat and code not in self.watch_codes:
+            self.api.quote.unsubscribe(position.contract, version=QuoteVersion.v1)
+            if self.subscribe_bidask or self.cover_mode == CoverMode.Peg:
+                self.api.quote.unsubscribe(
+                    position.contract,
+                    quote_type=QuoteType.BidAsk,
+                    version=QuoteVersion.v1,
+                )
+
+    def start_quote_watchdog(self) -> QuoteWatchdog:
+        if self.quote_watchdog is None:
+            self.quote_watchdog = QuoteWatchdog(
+                list(self.positions),
+                self.stale_quote_seconds,
+                self.on_stale_quote,
+                self.timer_wheel,
             )
-            if cover_quantity == 0:
+        self.quote_watchdog.watch(
+            code for code in self.positions if code not in self.retired_codes
+        )
+        return self.quote_watchdog
+
+    def on_stale_quote(self, code: str, age: float):
+        position = self.positions.get(code)
+        if position is None or not position.status.open_quantity:
+            return
+        logger.warning(f"{code} | no tick for {age:.1f}s, resubscribe")
+        self.api.quote.unsubscribe(position.contract, version=QuoteVersion.v1)
+        self.api.quote.subscribe(position.contract, version=QuoteVersion.v1)
+        if self.stale_quote_cover:
+            # stops can not trigger without ticks, cover the whole position
+            self.place_intent(code, -position.status.open_quantity, 0, PRICE_TYPE_MKT)
+
+    def trail_stop(self, position: Position, price: float):
+        code = position.contract.code
+        trailing = self.trailing_stops.get(code)
+        if trailing is None:
+            open_quantity = position.status.open_quantity
+            if not open_quantity or not position.cond.stop_loss_price:
+                return
+            trailing = self.trailing_stops[code] = TrailingStop(
+                position.cond.stop_loss_price[0],
+                open_quantity > 0,
+                self.trailing_ticks,
+                price,
+                position.contract.limit_up,
+                position.contract.limit_down,
+            )
+        if trailing.update(price):
+            logger.info(
+                f"{code} | mark {trailing.mark} trail stop loss to {trailing.price_set.price}"
+            )
+            self.emit_status(position)
+
+    def stop_profit(self, position: Position, tick: sj.TickSTKv1):
+        if not tick.simtrade and self.stop_enabled:
+            if position.status.cover_remaining == 0:
                 return
             if position.status.open_quantity > 0:
                 op = operator.ge
@@ -267,6 +775,14 @@ class SJTrader:
                 if op(float(tick.close), price_set.price):
                     if abs(price_set.quantity) == abs(price_set.in_transit_quantity):
                         continue
+                    self.emit(
+                        EventKind.Decision,
+                        code=position.contract.code,
+                        reason="stop_profit",
+                        price=tick.close,
+                        trigger=price_set.price,
+                        quantity=price_set.quantity,
+                    )
                     self.place_cover_order(position, [price_set])
                     logger.info(
                         f"{position.contract.code} | price: {tick.close} cross {cross} {price_set.price} "
@@ -274,11 +790,8 @@ class SJTrader:
                     )
 
     def stop_loss(self, position: Position, tick: sj.TickSTKv1):
-        if not tick.simtrade:
-            cover_quantity = position.status.open_quantity + (
-                position.status.cover_order_quantity - position.status.cover_quantity
-            )
-            if cover_quantity == 0:
+        if not tick.simtrade and self.stop_enabled:
+            if position.status.cover_remaining == 0:
                 return
             if position.status.open_quantity > 0:
                 op = operator.le
@@ -290,6 +803,14 @@ class SJTrader:
                 if op(float(tick.close), price_set.price):
                     if abs(price_set.quantity) == abs(price_set.in_transit_quantity):
                         continue
+                    self.emit(
+                        EventKind.Decision,
+                        code=position.contract.code,
+                        reason="stop_loss",
+                        price=tick.close,
+                        trigger=price_set.price,
+                        quantity=price_set.quantity,
+                    )
                     self.place_cover_order(position, [price_set])
                     logger.info(
                         f"{position.contract.code} | price: {tick.close} cross {cross} {price_set.price} "
@@ -299,44 +820,248 @@ class SJTrader:
     def place_cover_order(
         self, position: Position, price_sets: List[PriceSet] = []
     ):  # TODO with price quantity
-        if self.simulation:
-            api = self.simulation_api
-        else:
-            api = self.api
-        cover_quantity = position.status.open_quantity + (
-            position.status.cover_order_quantity - position.status.cover_quantity
-        )
         if not price_sets:
             price_sets = self.stratagy.cover_price_set(
                 position, self.snapshots[position.contract.code]
             )
             position.cond.cover_price += price_sets
-        if cover_quantity == 0:
+        if position.status.cover_remaining == 0:
             return
+        code = position.contract.code
         for price_set in price_sets:
-            if abs(price_set.quantity) == abs(price_set.in_transit_quantity):
+            # claim before sending, a concurrent tick on the same price set get 0
+            q = price_set.claim()
+            if not q:
                 continue
-            if price_set.quantity:
-                quantity_s = quantity_split(price_set.quantity, threshold=499)
-                for q in quantity_s:
-                    trade = api.place_order(
-                        contract=position.contract,
-                        order=sj.order.StockOrder(
-                            price=price_set.price,
-                            quantity=abs(q),
-                            action=Action.Buy
-                            if position.cond.quantity < 0
-                            else Action.Sell,
-                            price_type=price_set.price_type,
-                            order_type=OrderType.ROD,
-                            custom_field=self.name,
-                        ),
-                        timeout=0,
+            plan = plan_slices(
+                q,
+                self.cover_slicing,
+                self.recent_volume_of(code),
+            )
+            self.slicer.submit(
+                code,
+                TradeRole.Cover,
+                price_set,
+                plan,
+                functools.partial(
+                    self.dispatch_slice,
+                    OrderPriority.Cover,
+                    self.send_cover_slice,
+                    position,
+                    price_set,
+                ),
+                reserved=True,
+            )
+
+    def send_cover_slice(
+        self, position: Position, price_set: PriceSet, q: int, reserved: bool = False
+    ):
+        api = self.simulation_api if self.simulation else self.api
+        action = Action.Buy if position.cond.quantity < 0 else Action.Sell
+        price, price_type = price_set.price, price_set.price_type
+        pegged = self.cover_mode == CoverMode.Peg and price_type == StockPriceType.MKT
+        if pegged:
+            pegged_price = peg_price(
+                position.contract,
+                self.snapshots.get(position.contract.code),
+                action,
+                self.peg_config.ticks,
+            )
+            if pegged_price:
+                price, price_type = pegged_price, StockPriceType.LMT
+            else:
+                pegged = False
+        order = sj.order.StockOrder(
+            price=price,
+            quantity=abs(q),
+            action=action,
+            price_type=price_type,
+            order_type=OrderType.ROD,
+            custom_field=self.name,
+        )
+        if not self.risk_gate.check(position.contract, order, reduce_only=True):
+            if reserved:
+                price_set.release(q)
+            return
+        trade = api.place_order(
+            contract=position.contract,
+            order=order,
+            timeout=0,
+        )
+        logger.info(f"{trade.contract.code} | {trade.order}")
+        if not reserved:
+            price_set.reserve(q)
+        record = self.registry.register(trade, position, TradeRole.Cover, price_set)
+        position.cover_trades.append(record)
+        if pegged:
+            self.peg_orders.setdefault(position.contract.code, []).append(
+                PegOrder(trade, price, time.monotonic(), record)
+            )
+        # api.update_status(trade=trade)
+
+    def reprice_peg_orders(self, position: Position, snapshot: Snapshot):
+        api = self.simulation_api if self.simulation else self.api
+        code = position.contract.code
+        peg_orders = self.peg_orders[code]
+        if position.status.open_quantity == 0:
+            self.peg_orders.pop(code, None)
+            return
+        now = time.monotonic()
+        for peg in list(peg_orders):
+            if peg.trade.status.status in (
+                sj.order.Status.Filled,
+                sj.order.Status.Cancelled,
+            ):
+                if not peg.escalating:
+                    peg_orders.remove(peg)
+                continue
+            if peg.escalating or now - peg.placed_at < self.peg_config.timeout:
+                continue
+            peg.reprice_count += 1
+            peg.placed_at = now
+            if peg.reprice_count > self.peg_config.max_reprice:
+                peg.escalating = True
+                self.dispatch(
+                    OrderPriority.Cancel,
+                    functools.partial(api.cancel_order, timeout=0),
+                    peg.trade,
+                )
+                logger.info(f"{code} | escalate peg cover order to MKT {peg.trade.order}")
+                continue
+            price = peg_price(
+                position.contract, snapshot, peg.trade.order.action, self.peg_config.ticks
+            )
+            if price and price != peg.price:
+                self.dispatch(
+                    OrderPriority.Cancel,
+                    functools.partial(api.update_order, price=price, timeout=0),
+                    peg.trade,
+                )
+                logger.info(f"{code} | reprice peg cover order {peg.price} -> {price}")
+                peg.price = price
+        if not peg_orders:
+            self.peg_orders.pop(code, None)
+
+    def escalate_peg_order(
+        self,
+        position: Position,
+        record: Optional[TradeRecord],
+        cancel_quantity: int,
+    ):
+        api = self.simulation_api if self.simulation else self.api
+        peg_orders = self.peg_orders.get(position.contract.code, [])
+        escalating = [peg for peg in peg_orders if peg.escalating]
+        if not escalating:
+            return
+        peg = next(
+            (p for p in escalating if record and p.record is record),
+            escalating[0],
+        )
+        peg_orders.remove(peg)
+        if not peg_orders:
+            self.peg_orders.pop(position.contract.code, None)
+        if not cancel_quantity:
+            return
+        self.dispatch(
+            OrderPriority.Cover,
+            self.send_escalate_order,
+            position,
+            peg,
+            record,
+            cancel_quantity,
+        )
+
+    def send_escalate_order(
+        self,
+        position: Position,
+        peg: PegOrder,
+        record: Optional[TradeRecord],
+        cancel_quantity: int,
+    ):
+        api = self.simulation_api if self.simulation else self.api
+        price_set = record.price_set if record else None
+        claimed = 0
+        if price_set is not None:
+            claimed = price_set.claim(
+                cancel_quantity if price_set.quantity > 0 else -cancel_quantity
+            )
+            if not claimed:
+                return
+            cancel_quantity = abs(claimed)
+        order = sj.order.StockOrder(
+            price=0,
+            quantity=cancel_quantity,
+            action=peg.trade.order.action,
+            price_type=StockPriceType.MKT,
+            order_type=OrderType.ROD,
+            custom_field=self.name,
+        )
+        if not self.risk_gate.check(position.contract, order, reduce_only=True):
+            if claimed:
+                price_set.release(claimed)
+            return
+        trade = api.place_order(contract=position.contract, order=order, timeout=0)
+        position.cover_trades.append(
+            self.registry.register(trade, position, TradeRole.Cover, price_set)
+        )
+        logger.info(f"{position.contract.code} | {trade.order}")
+
+    def share_market_state(self) -> SharedMarketState:
+        self.market_state = SharedMarketState(list(self.positions))
+        for code, snapshot in self.snapshots.items():
+            self.market_state.write(code, snapshot)
+        return self.market_state
+
+    def place_intent(self, code: str, quantity: int, price: float, price_type: int):
+        """cover intent, quantity > 0 buy and < 0 sell against the open position"""
+        position = self.positions.get(code)
+        if position is None or not self.stop_enabled:
+            return
+        if not quantity or quantity * position.status.open_quantity > 0:
+            logger.warning(
+                f"{code} | skip intent {quantity}, not a cover of "
+                f"open quantity {position.status.open_quantity}"
+            )
+            return
+        working = sum(
+            record.remaining
+            for record in self.registry.working_records(TradeRole.Cover)
+            if record.code == code
+        )
+        quantity = min(abs(quantity), abs(position.status.open_quantity) - working)
+        if quantity <= 0:
+            logger.info(f"{code} | skip intent, nothing left to cover")
+            return
+        price_set = PriceSet(
+            price=price,
+            quantity=quantity if position.cond.quantity > 0 else -quantity,
+            price_type=StockPriceType.MKT
+            if price_type == PRICE_TYPE_MKT
+            else StockPriceType.LMT,
+        )
+        position.cond.cover_price.append(price_set)
+        self.place_cover_order(position, [price_set])
+
+    def sync_open_quantity(self, api=None) -> List[str]:
+        """set open_quantity from the broker positions, return the codes corrected"""
+        if api is None:
+            api = self.simulation_api if self.simulation else self.api
+        positions = {pos.code: pos for pos in api.list_positions(timeout=10000)}
+        corrected = []
+        for code, position in self.positions.items():
+            p = positions.get(code)
+            quantity = (
+                (p.quantity if p.direction == Action.Buy else -p.quantity) if p else 0
+            )
+            with position.lock:
+                if position.status.open_quantity != quantity:
+                    logger.warning(
+                        f"{code} | open quantity {position.status.open_quantity} "
+                        f"corrected to {quantity} from broker"
                     )
-                    logger.info(f"{trade.contract.code} | {trade.order}")
-                    price_set.in_transit_quantity += q
-                    position.cover_trades.append(trade)
-                    # api.update_status(trade=trade)
+                    position.status.open_quantity = quantity
+                    corrected.append(code)
+        return corrected
 
     def open_position_cover(self, onclose: bool = True, fetch: bool = False):
         if self.simulation:
@@ -345,31 +1070,26 @@ class SJTrader:
             api = self.api
         api.update_status()
         logger.info(f"start place cover order. onclose: {onclose}")
-        for code, position in self.positions.items():
-            if position.status.cover_order_quantity and (
-                position.status.cover_order_quantity != position.status.cover_quantity
-            ):
-                for trade in position.cover_trades:
-                    if trade.status.status in [
-                        sj.order.Status.Submitted,
-                        sj.order.Status.PreSubmitted,
-                        sj.order.Status.PartFilled,
-                    ]:
-                        if not onclose and trade.order.price_type == StockPriceType.MKT:
-                            continue
-                        api.cancel_order(trade, timeout=0)
-
-            if position.status.entry_order_quantity and (
-                position.status.entry_order_quantity != position.status.entry_quantity
+        self.stop_enabled = False
+        self.peg_orders.clear()
+        self.slicer.cancel_all()
+        self.drop_queued_entries()
+        for record in self.registry.working_records():
+            if (
+                not onclose
+                and record.role == TradeRole.Cover
+                and record.price_type == StockPriceType.MKT
             ):
-                for trade in position.entry_trades:
-                    if trade.status.status in [
-                        sj.order.Status.Submitted,
-                        sj.order.Status.PreSubmitted,
-                        sj.order.Status.PartFilled,
-                    ]:
-                        api.cancel_order(trade, timeout=0)
-            # event wait cancel
+                continue
+            trade = record.trade
+            if trade is None:
+                continue
+            self.dispatch(
+                OrderPriority.Cancel,
+                functools.partial(api.cancel_order, timeout=0),
+                trade,
+            )
+        # event wait cancel
         if not fetch:
             for code, position in self.positions.items():
                 for _ in range(10):
@@ -377,7 +1097,7 @@ class SJTrader:
                         position.status.cover_quantity
                         != position.status.cover_order_quantity
                     ):
-                        time.sleep(1)
+                        self.sleep(1)
                 if position.status.cover_quantity != position.status.cover_order_quantity:
                     logger.error(
                         f"{code} | cancel not work, position cover order "
@@ -386,17 +1106,7 @@ class SJTrader:
         if onclose:
             if fetch:
                 with logger.catch():
-                    positions = {pos.code: pos for pos in api.list_positions(timeout=10000)}
-                    for code, pos in self.positions.items():
-                        p = positions.get(code)
-                        if p:
-                            pos.status.open_quantity = p.quantity if p.direction == Action.Buy else -p.quantity
-                            # pos.status.entry_order_quantity = pos.status.entry_quantity = (
-                            #     p.quantity if p.direction == Action.Buy else -p.quantity
-                            # )
-                        else:
-                            pos.status.open_quantity = 0
-                            # pos.status.entry_order_quantity = pos.status.entry_quantity = 0
+                    self.sync_open_quantity(api)
 
             self.positions = self.stratagy.cover_positions_onclose(self.positions)
         else:
@@ -416,9 +1126,61 @@ class SJTrader:
         elif order_stats == OrderState.StockDeal and msg["custom_field"] == self.name:
             self.deal_handler(msg, self.positions[msg["code"]])
 
+    def record_order(self, msg: Dict, record: Optional[TradeRecord]):
+        order = msg["order"]
+        self.blotter.append(
+            "order",
+            msg["operation"]["op_type"],
+            order["id"],
+            order.get("seqno", ""),
+            msg["contract"]["code"],
+            order["action"],
+            record.role if record is not None else "",
+            order.get("price_type", ""),
+            order.get("price", 0),
+            order["quantity"],
+            msg["status"].get("exchange_ts", 0),
+            record.placed_at if record is not None else 0,
+            time.time(),
+        )
+
+    def record_deal(self, msg: Dict, record: Optional[TradeRecord]):
+        self.blotter.append(
+            "deal",
+            "Deal",
+            msg.get("trade_id", ""),
+            msg.get("seqno", ""),
+            msg["code"],
+            msg["action"],
+            record.role if record is not None else "",
+            record.price_type if record is not None else "",
+            msg["price"],
+            msg["quantity"],
+            msg.get("ts", 0),
+            record.placed_at if record is not None else 0,
+            time.time(),
+        )
+
+    def export_blotter(self, path: Optional[str] = None):
+        path = path or self.blotter_path
+        if not path:
+            return None
+        with logger.catch():
+            p = self.blotter.write(path.format(date=self.blotter.date))
+            logger.info(f"blotter | {len(self.blotter)} rows write to {p}")
+            return p
+
     def order_handler(self, msg: Dict, position: Position):
         if msg["operation"]["op_code"] == "00":
             with position.lock:
+                record = self.registry.on_order(msg)
+                self.record_order(msg, record)
+                self.emit(
+                    EventKind.Order,
+                    code=position.contract.code,
+                    role=record.role if record is not None else None,
+                    msg=msg,
+                )
                 if msg["operation"]["op_type"] == "New":
                     order_quantity = msg["status"].get("order_quantity", 0)
                     order_pirce = msg["order"].get("price", 0)
@@ -456,6 +1218,10 @@ class SJTrader:
                             logger.debug(
                                 f"{position.contract.code} | {position.status}"
                             )
+                elif msg["operation"]["op_type"] == "UpdatePrice":
+                    logger.info(
+                        f"{position.contract.code} | update order price to {msg['order'].get('price', 0)}"
+                    )
                 else:
                     cancel_quantity = msg["status"].get("cancel_quantity", 0)
                     if msg["order"]["action"] == Action.Sell:
@@ -493,13 +1259,50 @@ class SJTrader:
                                 f"{position.contract.code} | {position.status}"
                             )
                     position.status.cancel_quantity += cancel_quantity
+                    is_cover = is_cover_action(
+                        msg["order"]["action"], position.cond.quantity
+                    )
+                    self.risk_gate.on_cancel(
+                        position.contract,
+                        cancel_quantity,
+                        reduce_only=is_cover,
+                        done=record.remaining <= 0 if record is not None else True,
+                    )
+                    if is_cover and position.contract.code in self.peg_orders:
+                        self.escalate_peg_order(position, record, cancel_quantity)
+                self.emit_status(position)
         else:
             logger.error(f"Please Check: {msg}")
+            if msg["operation"]["op_type"] == "New":
+                with position.lock:
+                    # marks the record failed and drop it from the working set
+                    self.registry.on_order(msg)
+                    self.risk_gate.on_reject(
+                        position.contract,
+                        msg["order"]["quantity"],
+                        reduce_only=is_cover_action(
+                            msg["order"]["action"], position.cond.quantity
+                        ),
+                    )
 
     def deal_handler(self, msg: Dict, position: Position):
         with position.lock:
             deal_quantity = msg["quantity"]
             deal_price = msg["price"]
+            record = self.registry.on_deal(msg)
+            self.record_deal(msg, record)
+            self.emit(
+                EventKind.Deal,
+                code=position.contract.code,
+                role=record.role if record is not None else None,
+                msg=msg,
+            )
+            self.risk_gate.on_deal(
+                position.contract,
+                deal_quantity,
+                reduce_only=is_cover_action(msg["action"], position.cond.quantity),
+                done=record.remaining <= 0 if record is not None else None,
+            )
             if msg["action"] == Action.Sell:
                 position.status.open_quantity -= deal_quantity
                 if position.cond.quantity < 0:
@@ -528,3 +1331,7 @@ class SJTrader:
                         f"{position.contract.code} | long entry order deal with {deal_quantity}, price: {deal_price}"
                     )
                     logger.debug(f"{position.contract.code} | {position.status}")
+            if position.status.cover_quantity and not position.status.open_quantity:
+                # parent flat, drop cover slices still waiting on the wheel
+                self.slicer.cancel(position.contract.code, TradeRole.Cover)
+            self.emit_status(position)
@@ -0,0 +1,65 @@
+from .position import PriceSet
+from .utils import price_limit, price_move
+
+
+class TrailingStop:
+    """high (long) or low (short) water mark dragging a stop PriceSet along
+
+    a tick only compare against the next ladder price of the mark, the stop
+    is recomputed when the mark cross into a new tick and written into the
+    same PriceSet, it only ever tighten.
+    """
+
+    __slots__ = (
+        "price_set",
+        "long",
+        "ticks",
+        "mark",
+        "next_mark",
+        "limit_up",
+        "limit_down",
+    )
+
+    def __init__(
+        self,
+        price_set: PriceSet,
+        long: bool,
+        ticks: int,
+        mark: float,
+        limit_up: float,
+        limit_down: float,
+    ):
+        self.price_set = price_set
+        self.long = long
+        self.ticks = ticks
+        self.limit_up = limit_up
+        self.limit_down = limit_down
+        self.mark = mark
+        # the first update at the seed price already place the stop
+        self.next_mark = mark
+
+    def step(self, price: float) -> float:
+        return price_move(price, 1 if self.long else -1)
+
+    def update(self, price: float) -> bool:
+        """feed a real deal price, True when the stop moved"""
+        if self.long:
+            if price < self.next_mark:
+                return False
+        elif price > self.next_mark:
+            return False
+        self.mark = price
+        self.next_mark = self.step(price)
+        price_set = self.price_set
+        if price_set.in_transit_quantity:
+            # already triggered, the order carry the old price
+            return False
+        stop = price_limit(
+            price_move(price, -self.ticks if self.long else self.ticks),
+            self.limit_up,
+            self.limit_down,
+        )
+        if stop > price_set.price if self.long else stop < price_set.price:
+            price_set.price = stop
+            return True
+        return False
@@ -1,9 +1,8 @@
 import math
 import time
-import rs2py
 import datetime
 from decimal import Decimal
-from typing import List, Union
+from typing import List, Optional, Union
 
 
 def price_ceil(price: float) -> float:
@@ -42,10 +41,14 @@ def price_limit(price: float, up: float, down: float):
 
 
 def price_move(price: float, tick: int) -> float:
+    import rs2py
+
     return rs2py.get_price_tick_move(price, tick)
 
 
 def price_between_tick(p0: float, p1: float) -> int:
+    import rs2py
+
     return rs2py.get_price_between_tick(p0, p1)
 
 
@@ -64,20 +67,34 @@ def quantity_num_split(quantity: int, num: int) -> List[int]:
 
 
 def quantity_split(quantity: float, threshold: int) -> List[int]:
-    return [threshold if quantity > 0 else -threshold] * (
-        abs(quantity) // threshold
-    ) + [
-        (abs(quantity) % threshold) * (1 if quantity > 0 else -1),
-    ]
+    neg = 1 if quantity > 0 else -1
+    num, remain = divmod(abs(quantity), threshold)
+    return [threshold * neg] * num + ([remain * neg] if remain else [])
+
+
+def taipei_now() -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(hours=8)
 
 
-def sleep_until(t: Union[datetime.time, tuple]) -> None:
+def session_date(now: Optional[datetime.datetime] = None) -> datetime.date:
+    """date of the session sleep_until aim at, started after 13:59 it is the next day"""
+    now = taipei_now() if now is None else now
+    d = datetime.timedelta(days=1) if now.hour > 13 else datetime.timedelta(days=0)
+    return now.date() + d
+
+
+def sleep_until(t: Union[datetime.time, datetime.datetime, tuple]) -> None:
+    if isinstance(t, datetime.datetime):
+        # timezone aware instant, e.g. from a SessionPlan schedule
+        delta_sec = (t - datetime.datetime.now(t.tzinfo)).total_seconds()
+        if delta_sec > 0:
+            time.sleep(delta_sec)
+        return
     if isinstance(t, tuple):
         t = datetime.time(*t)
-    now = datetime.datetime.utcnow() + datetime.timedelta(hours=8)
-    d = datetime.timedelta(days=1) if now.hour > 13 else datetime.timedelta(days=0)
-    until_time = (
-        datetime.datetime(now.year, now.month, now.day, t.hour, t.minute, t.second) + d
+    now = taipei_now()
+    until_time = datetime.datetime.combine(
+        session_date(now), datetime.time(t.hour, t.minute, t.second)
     )
     delta = until_time - now
     delta_sec = delta.total_seconds()
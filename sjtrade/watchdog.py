@@ -0,0 +1,106 @@
+from array import array
+from threading import Lock
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+from loguru import logger
+
+from .timer import Timer, TimerWheel
+
+
+class QuoteWatchdog:
+    """flag watched codes whose tick feed went quiet for threshold seconds
+
+    a tick only store its monotonic time into an array slot. each watched
+    code hold a single timer due at last tick + threshold, when it fire and
+    a newer tick came in it is re-armed for the remaining time, so the wheel
+    only touch codes about to expire instead of scanning every position.
+    """
+
+    def __init__(
+        self,
+        codes: Sequence[str],
+        threshold: float,
+        on_stale: Callable[[str, float], None],
+        wheel: Optional[TimerWheel] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        self.codes = list(codes)
+        self.slots = {code: idx for idx, code in enumerate(self.codes)}
+        self.threshold = threshold
+        self.on_stale = on_stale
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        # same time base as the wheel unless told otherwise
+        self.clock = clock or self.wheel.clock
+        self.last = array("d", [self.clock()]) * len(self.codes)
+        self.timers: Dict[int, Timer] = {}
+        # code -> feed age when last flagged, cleared once ticks come back
+        self.stale: Dict[str, float] = {}
+        self.flagged = 0
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, code: str) -> bool:
+        return self.slots.get(code) in self.timers
+
+    def touch(self, code: str):
+        idx = self.slots.get(code)
+        if idx is not None:
+            self.last[idx] = self.clock()
+
+    def watch(self, codes: Optional[Iterable[str]] = None):
+        """start watching, the feed get a full threshold of grace"""
+        now = self.clock()
+        with self.lock:
+            for code in self.codes if codes is None else codes:
+                idx = self.slots.get(code)
+                if idx is None or idx in self.timers:
+                    continue
+                self.last[idx] = now
+                self.timers[idx] = self.wheel.schedule(self.threshold, self.check, idx)
+
+    def unwatch(self, code: str):
+        idx = self.slots.get(code)
+        with self.lock:
+            timer = self.timers.pop(idx, None)
+            self.stale.pop(code, None)
+        if timer is not None:
+            self.wheel.cancel(timer)
+
+    def check(self, idx: int):
+        code = self.codes[idx]
+        with self.lock:
+            if idx not in self.timers:
+                return
+            age = self.clock() - self.last[idx]
+            if age < self.threshold:
+                recovered = self.stale.pop(code, None)
+                self.timers[idx] = self.wheel.schedule(
+                    self.threshold - age, self.check, idx
+                )
+            else:
+                recovered = None
+                self.stale[code] = age
+                self.flagged += 1
+                # keep flagging every threshold until the feed come back
+                self.timers[idx] = self.wheel.schedule(self.threshold, self.check, idx)
+        if recovered is not None:
+            logger.info(f"{code} | quote feed back after {recovered:.1f}s stale")
+        elif age >= self.threshold:
+            self.on_stale(code, age)
+
+    def ages(self) -> Dict[str, float]:
+        now = self.clock()
+        with self.lock:
+            return {self.codes[idx]: now - self.last[idx] for idx in self.timers}
+
+    def metrics(self) -> Dict[str, float]:
+        ages = self.ages()
+        with self.lock:
+            return {
+                "watched": len(self.timers),
+                "stale": len(self.stale),
+                "flagged": self.flagged,
+                "max_age": max(ages.values(), default=0.0),
+            }
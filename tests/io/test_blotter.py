@@ -0,0 +1,62 @@
+import datetime
+import pytest
+from pathlib import Path
+from shioaji.constant import Action, StockPriceType
+
+from sjtrade.io.blotter import COLUMNS, Blotter, load_blotter, write_blotter
+
+
+def make_blotter(day: int) -> Blotter:
+    blotter = Blotter(datetime.date(2022, 5, day))
+    blotter.append(
+        "order", "New", "c21b876d", "429832", "1605", Action.Sell, "Entry",
+        StockPriceType.LMT, 41.35, 1, 1653440700, 1653440699.5, 1653440700.0,
+    )
+    blotter.append(
+        "deal", "Deal", "c21b876d", "429832", "1605", Action.Sell, "Entry",
+        StockPriceType.LMT, 41.35, 1, 1653440800, 0, 1653440800.0,
+    )
+    return blotter
+
+
+def test_blotter_append():
+    blotter = make_blotter(25)
+    assert len(blotter) == 2
+    assert blotter.columns["date"] == ["2022-05-25", "2022-05-25"]
+    assert blotter.columns["action"] == ["Sell", "Sell"]
+    assert blotter.columns["price_type"] == ["LMT", "LMT"]
+    assert blotter.columns["latency"] == [0.5, 0.0]
+
+
+def test_blotter_csv_roundtrip(tmp_path: Path, mocker):
+    paths = [make_blotter(day).write(tmp_path / f"{day}.csv") for day in (25, 26)]
+    mocker.patch.dict("sys.modules", {"pyarrow": None})
+    columns = load_blotter(paths)
+    assert list(columns) == list(COLUMNS)
+    assert columns["date"] == ["2022-05-25"] * 2 + ["2022-05-26"] * 2
+    assert columns["quantity"] == [1, 1, 1, 1]
+    assert columns["price"][0] == 41.35
+
+
+def test_blotter_csv_fallback(tmp_path: Path, mocker):
+    mocker.patch.dict("sys.modules", {"pyarrow": None})
+    p = make_blotter(25).write(tmp_path / "25.arrow")
+    assert p == tmp_path / "25.csv"
+    with pytest.raises(ImportError):
+        load_blotter([tmp_path / "25.arrow"])
+
+
+@pytest.mark.parametrize("suffix", [".arrow", ".parquet"])
+def test_blotter_arrow_roundtrip(tmp_path: Path, suffix: str):
+    pytest.importorskip("pyarrow")
+    paths = [make_blotter(day).write(tmp_path / f"{day}{suffix}") for day in (25, 26)]
+    paths.append(write_blotter(make_blotter(27).columns, tmp_path / "27.csv"))
+    table = load_blotter(paths)
+    assert table.num_rows == 6
+    assert table.column_names == list(COLUMNS)
+    assert table.column("date").to_pylist()[::2] == [
+        "2022-05-25",
+        "2022-05-26",
+        "2022-05-27",
+    ]
+    assert load_blotter([]).num_rows == 0
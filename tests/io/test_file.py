@@ -1,6 +1,6 @@
 import pytest
 from pytest_mock import MockFixture
-from sjtrade.io.file import read_csv_position, read_position
+from sjtrade.io.file import iter_position, read_csv_position, read_position
 
 
 def test_read_position(mocker: MockFixture):
@@ -47,3 +47,14 @@ def test_read_csv_position(mocker: MockFixture):
 def test_read_position_notfile():
     with pytest.raises(FileNotFoundError):
         read_csv_position("")
+
+
+def test_iter_position(tmp_path):
+    p = tmp_path / "position.txt"
+    p.write_text("1524\t18.0\n2359\t-10.0\n\n3141\t2.0\n")
+    rows = iter_position(p)
+    assert next(rows) == ("1524", 18)
+    assert list(rows) == [("2359", -10), ("3141", 2)]
+    assert dict(iter_position(p)) == read_position(p)
+    with pytest.raises(FileNotFoundError):
+        iter_position(tmp_path / "missing.txt")
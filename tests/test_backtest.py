@@ -0,0 +1,165 @@
+import random
+import pytest
+import shioaji as sj
+
+from sjtrade.backtest import (
+    Backtest,
+    BacktestConfig,
+    Fill,
+    TickTable,
+    first_cross,
+    run_backtest,
+    seconds_of,
+)
+from sjtrade.registry import TradeRole
+from sjtrade.strategy import StrategyBasic
+from sjtrade.stress import TickGenerator, build_contracts, gen_contracts_raw
+
+import datetime
+
+
+def make_strategy(contracts: sj.contracts.Contracts, positions: dict) -> StrategyBasic:
+    strategy = StrategyBasic(contracts=contracts)
+    strategy.read_position_func = lambda filepath: positions
+    return strategy
+
+
+def ts_of(h: int, m: int, s: int = 0) -> float:
+    return seconds_of(datetime.time(h, m, s))
+
+
+@pytest.fixture
+def contracts(stock_contracts_raw: list) -> sj.contracts.Contracts:
+    return build_contracts(stock_contracts_raw)
+
+
+def test_tick_table_from_ticks():
+    class Tick:
+        code = "1605"
+        datetime = "2022-05-25 09:00:01.500000"
+        close = 41.0
+        volume = 3
+        simtrade = False
+
+    table = TickTable.from_ticks([Tick()])
+    assert table.ts == [ts_of(9, 0, 1) + 0.5]
+    assert table.price == [41.0]
+    assert table.volume == [3]
+    assert table.group()["1605"].ts == table.ts
+
+
+def test_first_cross():
+    prices = [10, 11, 12, 9, 13]
+    assert first_cross(prices, 0, 5, 9.5, 12.5) == 3
+    assert first_cross(prices, 0, 3, 9.5, 12.5) == 3
+    assert first_cross(prices, 4, 5, 9.5, 12.5) == 4
+
+
+def test_backtest_entry_stop_loss(contracts: sj.contracts.Contracts):
+    # short 1605 @ 41.35, stop loss MKT over 42.95
+    strategy = make_strategy(contracts, {"1605": -2})
+    ticks = TickTable(
+        ts=[ts_of(8, 55), ts_of(9, 0), ts_of(9, 1), ts_of(9, 2), ts_of(9, 3)],
+        code=["1605"] * 5,
+        price=[40.0, 40.5, 41.4, 43.0, 43.1],
+        simtrade=[True, False, False, False, False],
+    )
+    res = Backtest(strategy, contracts).run(ticks)
+    assert res.fills == [
+        Fill(ts_of(9, 1), "1605", TradeRole.Entry, -2, 41.35),
+        Fill(ts_of(9, 3), "1605", TradeRole.Cover, 2, 43.1),
+    ]
+    assert res.open_positions == {}
+    assert res.pnl()["1605"] == pytest.approx((41.35 - 43.1) * 2000)
+    assert res.positions["1605"].status.cover_quantity == 2
+
+
+def test_backtest_auction_open_and_onclose(contracts: sj.contracts.Contracts):
+    strategy = make_strategy(contracts, {"1605": -1, "6290": -1})
+    ticks = TickTable(
+        ts=[ts_of(9, 0), ts_of(9, 0), ts_of(10, 0), ts_of(13, 27), ts_of(13, 30)],
+        code=["1605", "6290", "1605", "1605", "1605"],
+        price=[42.0, 57.3, 41.0, 40.0, 40.5],
+        simtrade=[False, False, False, True, False],
+    )
+    res = Backtest(strategy, contracts).run(ticks)
+    # gap over the entry price fill at the open, 6290 entry never touched
+    assert res.fills == [
+        Fill(ts_of(9, 0), "1605", TradeRole.Entry, -1, 42.0),
+        Fill(ts_of(13, 30), "1605", TradeRole.Cover, 1, 40.5),
+    ]
+    assert res.positions["1605"].cond.cover_price[0].price == 43.3
+    assert res.positions["6290"].status.entry_quantity == 0
+    assert res.positions["6290"].cond.entry_price[0].in_transit_quantity == 0
+
+
+def test_backtest_cancel_preorder_and_re_entry(contracts: sj.contracts.Contracts):
+    strategy = make_strategy(contracts, {"1605": -1})
+    ticks = TickTable(
+        ts=[ts_of(8, 50), ts_of(8, 56), ts_of(9, 0), ts_of(9, 1), ts_of(13, 30)],
+        code=["1605"] * 5,
+        price=[43.3, 43.3, 42.0, 41.9, 41.0],
+        simtrade=[True, True, False, False, False],
+    )
+    res = Backtest(strategy, contracts).run(ticks)
+    assert res.positions["1605"].status.cancel_preorder
+    assert res.fills == [
+        Fill(ts_of(9, 1), "1605", TradeRole.Entry, -1, 41.9),
+        Fill(ts_of(13, 30), "1605", TradeRole.Cover, 1, 41.0),
+    ]
+
+
+def test_backtest_unknown_code_and_no_ticks(contracts: sj.contracts.Contracts):
+    strategy = make_strategy(contracts, {"1605": -1, "0000": 1})
+    res = run_backtest(strategy, contracts, TickTable())
+    assert list(res.positions) == ["1605"]
+    assert res.fills == []
+
+
+def sort_fills(fills):
+    return sorted(fills, key=lambda f: (f.ts, f.code, f.role.value))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_backtest_fast_equal_event(seed: int):
+    rng = random.Random(seed)
+    contracts_raw = gen_contracts_raw(50, rng)
+    contracts = build_contracts(contracts_raw)
+    positions = {c["code"]: rng.choice((-1, 1)) * rng.randint(1, 5) for c in contracts_raw}
+    gen = TickGenerator(contracts_raw, rng, max_move=6, limit_prob=0.01)
+    ticks = TickTable()
+    date = datetime.date(2022, 5, 25)
+    for start, end, simtrade, step in (
+        (ts_of(8, 55), ts_of(9, 0), True, 5.0),
+        (ts_of(9, 0), ts_of(13, 25), False, 20.0),
+        (ts_of(13, 25), ts_of(13, 30), True, 10.0),
+        (ts_of(13, 30), ts_of(13, 30) + 1, False, 10.0),
+    ):
+        ts = start
+        while ts < end:
+            for code in positions:
+                if rng.random() < 0.5:
+                    tick = gen.next_tick(code, date, simtrade)
+                    ticks.append(ts, code, tick.close, tick.volume, simtrade)
+            ts += step
+    event = Backtest(make_strategy(contracts, positions), contracts).run(ticks)
+    fast = Backtest(make_strategy(contracts, positions), contracts).run_fast(ticks)
+    assert len(event.fills) > len(positions)
+    assert sort_fills(fast.fills) == sort_fills(event.fills)
+    assert fast.pnl() == pytest.approx(event.pnl())
+    for code, position in event.positions.items():
+        assert fast.positions[code].status == position.status
+    assert event.open_positions == {}
+
+
+def test_backtest_stop_disabled(contracts: sj.contracts.Contracts):
+    strategy = make_strategy(contracts, {"1605": -1})
+    ticks = TickTable(
+        ts=[ts_of(9, 0), ts_of(9, 1), ts_of(13, 30)],
+        code=["1605"] * 3,
+        price=[41.5, 43.3, 43.0],
+    )
+    res = run_backtest(
+        strategy, contracts, ticks, BacktestConfig(stop_enabled=False), fast=False
+    )
+    assert [f.price for f in res.fills] == [41.5, 43.0]
@@ -0,0 +1,79 @@
+import datetime
+from dataclasses import dataclass
+
+from sjtrade.batch import OrderIntents, TickBatcher, seconds_of_day
+from sjtrade.shared import PRICE_TYPE_LMT, PRICE_TYPE_MKT
+from sjtrade.timer import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@dataclass
+class Tick:
+    code: str
+    datetime: datetime.datetime
+    close: float
+    volume: int = 1
+    simtrade: bool = False
+
+
+def test_tick_batcher_window():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=0.001, slots=64, clock=clock, autostart=False)
+    batches = []
+    batcher = TickBatcher(["1605", "6290"], 5000, batches.append, wheel)
+    dt = datetime.datetime(2022, 5, 25, 9, 0, 1, 500000)
+    assert batcher.append(Tick("6290", dt, 57.3, 3))
+    assert batcher.append(Tick("1605", dt, 41.0))
+    assert not batcher.append(Tick("0000", dt, 10.0))
+    clock.now = 0.004
+    wheel.advance()
+    assert batches == []
+    clock.now = 0.006
+    wheel.advance()
+    assert len(batches) == 1
+    batch = batches[0]
+    assert list(batch.slot) == [1, 0]
+    assert list(batch.price) == [57.3, 41.0]
+    assert list(batch.volume) == [3, 1]
+    assert batch.ts[0] == seconds_of_day(dt) == 9 * 3600 + 1.5
+    assert batch.codes[batch.slot[0]] == "6290"
+    assert batcher.flush() == 0
+
+
+def test_tick_batcher_max_size_and_stale_timer():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=0.001, slots=64, clock=clock, autostart=False)
+    batches = []
+    batcher = TickBatcher(["1605"], 5000, batches.append, wheel, max_size=2)
+    dt = "2022-05-25 09:00:01"
+    batcher.append(Tick("1605", dt, 41.0))
+    batcher.append(Tick("1605", dt, 41.1))
+    assert [len(b) for b in batches] == [2]
+    clock.now = 0.003
+    wheel.advance()
+    batcher.append(Tick("1605", dt, 41.2))
+    # the timer armed by the first batch must not flush the new one early
+    clock.now = 0.006
+    wheel.advance()
+    assert [len(b) for b in batches] == [2]
+    clock.now = 0.012
+    wheel.advance()
+    assert [len(b) for b in batches] == [2, 1]
+
+
+def test_order_intents():
+    intents = OrderIntents.from_arrays([0, 2], [-1.0, 3.0], [41, 57.3])
+    intents.add(1, 2, 0.0, PRICE_TYPE_MKT)
+    assert len(intents) == 3
+    assert list(intents) == [
+        (0, -1, 41.0, PRICE_TYPE_LMT),
+        (2, 3, 57.3, PRICE_TYPE_LMT),
+        (1, 2, 0.0, PRICE_TYPE_MKT),
+    ]
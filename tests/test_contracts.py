@@ -0,0 +1,73 @@
+import datetime
+
+import pytest
+import shioaji as sj
+
+from sjtrade.contracts import (
+    ContractCache,
+    ContractRef,
+    ContractTable,
+    load_contract_table,
+    save_contract_table,
+)
+
+
+@pytest.fixture
+def table(api: sj.Shioaji) -> ContractTable:
+    return ContractTable.from_contracts(api.Contracts)
+
+
+def test_contract_table_from_contracts(table: ContractTable):
+    assert len(table) == 2
+    assert table.Stocks["1605"] == ContractRef(
+        "1605", "TSE", 39.4, 43.3, 35.5, 1000, "Yes"
+    )
+    assert table["6290"].exchange == "OTC"
+    assert table["0000"] is None
+
+
+def test_contract_ref_to_contract(api: sj.Shioaji, table: ContractTable):
+    contract = table["6290"].to_contract()
+    live = api.Contracts.Stocks["6290"]
+    assert contract.code == live.code
+    assert contract.exchange == live.exchange
+    assert contract.security_type == live.security_type
+    assert contract.reference == live.reference
+    assert contract.day_trade == live.day_trade
+    assert ContractRef.from_contract(contract) == table["6290"]
+
+
+def test_contract_table_save_load(table: ContractTable, tmp_path):
+    day = datetime.date(2022, 5, 20)
+    path = tmp_path / "contracts.bin"
+    save_contract_table(table, path, day)
+    loaded = load_contract_table(path, day)
+    assert list(loaded) == list(table)
+    assert loaded.diff(table) == []
+    with pytest.raises(ValueError):
+        load_contract_table(path, datetime.date(2022, 5, 23))
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        load_contract_table(path)
+
+
+def test_contract_table_diff(table: ContractTable):
+    other = ContractTable(table)
+    other.add(ContractRef("1605", "TSE", 40.0, 44.0, 36.0, 1000, "Yes"))
+    other.contracts.pop("6290")
+    assert sorted(table.diff(other)) == ["1605", "6290"]
+    table.update(other)
+    assert table["1605"].reference == 40.0
+
+
+def test_contract_cache(table: ContractTable, tmp_path):
+    cache = ContractCache(tmp_path / "contracts")
+    day = datetime.date(2022, 5, 20)
+    assert cache.load(day) is None
+    path = cache.save(table, day)
+    assert path.name == "contracts_20220520.bin"
+    assert day in cache
+    assert list(cache.load(day)) == list(table)
+    # a file of another date under the day name is not trusted
+    save_contract_table(table, cache.path(day), datetime.date(2022, 5, 19))
+    assert cache.load(day) is None
@@ -0,0 +1,62 @@
+import datetime
+from decimal import Decimal
+from dataclasses import dataclass
+from typing import List
+
+from sjtrade.data import Snapshot
+
+
+@dataclass
+class TickSTKv1:
+    code: str
+    datetime: datetime.datetime
+    close: Decimal
+    simtrade: bool
+    volume: int = 1
+
+
+@dataclass
+class BidAskSTKv1:
+    code: str
+    datetime: datetime.datetime
+    bid_price: List[Decimal]
+    bid_volume: List[int]
+    ask_price: List[Decimal]
+    ask_volume: List[int]
+
+
+def test_snapshot_update_tick():
+    snapshot = Snapshot()
+    snapshot.update_tick(TickSTKv1("1605", "2022-05-25 08:59:01", Decimal("41"), True))
+    assert snapshot.price == 41
+    assert snapshot.volume == 0
+    assert snapshot.open == 0
+    for close, volume in [("40", 2), ("40.5", 1), ("39.5", 1), ("40", 4)]:
+        snapshot.update_tick(
+            TickSTKv1("1605", "2022-05-25 09:00:01", Decimal(close), False, volume)
+        )
+    assert snapshot.price == 40
+    assert snapshot.open == 40
+    assert snapshot.high == 40.5
+    assert snapshot.low == 39.5
+    assert snapshot.volume == 8
+    assert snapshot.vwap == (40 * 2 + 40.5 + 39.5 + 40 * 4) / 8
+
+
+def test_snapshot_update_bidask():
+    snapshot = Snapshot(price=40.0)
+    snapshot.update_bidask(
+        BidAskSTKv1(
+            "1605",
+            "2022-05-25 09:00:01",
+            [Decimal("39.95"), Decimal("39.9")],
+            [5, 10],
+            [Decimal("40.05"), Decimal("40.1")],
+            [3, 8],
+        )
+    )
+    assert snapshot.bid == 39.95
+    assert snapshot.ask == 40.05
+    assert snapshot.bid_volume == 5
+    assert snapshot.ask_volume == 3
+    assert "bid=39.95" in repr(snapshot)
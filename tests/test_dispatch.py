@@ -0,0 +1,84 @@
+import threading
+
+from sjtrade.dispatch import OrderDispatcher, OrderPriority
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_dispatcher_priority_order():
+    dispatcher = OrderDispatcher(autostart=False)
+    sent = []
+    for i in range(3):
+        dispatcher.submit(OrderPriority.Entry, sent.append, f"entry{i}")
+    dispatcher.submit(OrderPriority.Cancel, sent.append, "cancel")
+    future = dispatcher.submit(OrderPriority.Cover, sent.append, "cover")
+    assert dispatcher.depth() == {"Cover": 1, "Cancel": 1, "Entry": 3}
+    assert dispatcher.run_pending() == 5
+    assert sent == ["cover", "cancel", "entry0", "entry1", "entry2"]
+    assert future.done()
+    metrics = dispatcher.metrics()
+    assert metrics["Entry"]["max_depth"] == 3
+    assert metrics["Entry"]["sent"] == 3
+    assert metrics["Cover"]["depth"] == 0
+
+
+def test_dispatcher_rate_budget():
+    clock = FakeClock()
+    dispatcher = OrderDispatcher(
+        rates={OrderPriority.Entry: 2, OrderPriority.Cover: 1},
+        burst=1,
+        clock=clock,
+        autostart=False,
+    )
+    sent = []
+    for i in range(3):
+        dispatcher.submit(OrderPriority.Entry, sent.append, f"entry{i}")
+        dispatcher.submit(OrderPriority.Cover, sent.append, f"cover{i}")
+    # one token each, the exhausted cover class let an entry through
+    assert dispatcher.run_pending() == 2
+    assert sent == ["cover0", "entry0"]
+    job, wait = dispatcher.next_job()
+    assert job is None and wait == 0.5
+    clock.now = 0.5
+    assert dispatcher.run_pending() == 1
+    assert sent[-1] == "entry1"
+    clock.now = 1.0
+    assert dispatcher.run_pending() == 2
+    assert sent[-2:] == ["cover1", "entry2"]
+
+
+def test_dispatcher_cancel_and_failure():
+    dispatcher = OrderDispatcher(autostart=False)
+    sent = []
+    futures = [
+        dispatcher.submit(OrderPriority.Entry, sent.append, i) for i in range(4)
+    ]
+    dropped = dispatcher.cancel(OrderPriority.Entry, lambda job: job.args[0] % 2)
+    assert [job.args[0] for job in dropped] == [1, 3]
+    assert futures[1].cancelled()
+
+    def fail():
+        raise RuntimeError("throttled")
+
+    failed = dispatcher.submit(OrderPriority.Cover, fail)
+    assert dispatcher.run_pending() == 3
+    assert sent == [0, 2]
+    assert isinstance(failed.exception(), RuntimeError)
+    assert dispatcher.metrics()["Cover"]["failed"] == 1
+
+
+def test_dispatcher_thread():
+    dispatcher = OrderDispatcher()
+    done = threading.Event()
+    future = dispatcher.submit(OrderPriority.Cover, done.set)
+    assert done.wait(1)
+    future.result(timeout=1)
+    dispatcher.stop()
+    dispatcher.thread.join(1)
+    assert not dispatcher.thread.is_alive()
@@ -0,0 +1,108 @@
+import sys
+import time
+import datetime
+from decimal import Decimal
+
+import pytest
+from shioaji.constant import Action
+
+from sjtrade.events import EventBus, EventKind, EventSubscriber, pack, plain, unpack
+from sjtrade.position import PositionState, PositionStatus
+
+
+def test_plain():
+    assert plain(
+        {
+            "action": Action.Buy,
+            "price": Decimal("41.35"),
+            "ts": datetime.datetime(2022, 5, 25, 9, 0, 1),
+            "codes": ("1605",),
+            "status": PositionStatus(open_quantity=-1),
+        }
+    ) == {
+        "action": "Buy",
+        "price": 41.35,
+        "ts": "2022-05-25T09:00:01",
+        "codes": ["1605"],
+        "status": {
+            "cancel_preorder": False,
+            "cancel_quantity": 0,
+            "entry_order_quantity": 0,
+            "entry_quantity": 0,
+            "open_quantity": -1,
+            "cover_order_quantity": 0,
+            "cover_quantity": 0,
+            "working_orders": 0,
+            "state": PositionState.Open.value,
+            "cover_remaining": -1,
+        },
+    }
+
+
+def test_pack_unpack_msgpack():
+    pytest.importorskip("msgpack")
+    event = {"kind": "Deal", "code": "1605", "price": 41.35, "quantity": 1}
+    data = pack(event)
+    assert data[:1] == b"m"
+    assert unpack(data) == event
+
+
+def test_pack_unpack_json(monkeypatch):
+    event = {"kind": "Deal", "code": "1605", "price": 41.35, "quantity": 1}
+    monkeypatch.setitem(sys.modules, "msgpack", None)
+    data = pack(event)
+    assert data[:1] == b"j"
+    assert unpack(data) == event
+    with pytest.raises(ValueError):
+        unpack(b"x{}")
+
+
+def test_event_bus(tmp_path):
+    bus = EventBus(tmp_path / "bus.sock", clock=lambda: 1.5, autostart=False)
+    bus.publish(EventKind.Phase, handler="place_entry_positions")
+    # nobody listening, events are discarded on flush
+    assert bus.flush() == 1
+    subscriber = EventSubscriber(tmp_path / "bus.sock", tmp_path / "sub.sock")
+    bus.publish(EventKind.Deal, code="1605", action=Action.Sell, price=Decimal("41.35"))
+    assert bus.flush() == 1
+    assert subscriber.recv(1) == {
+        "kind": "Deal",
+        "ts": 1.5,
+        "code": "1605",
+        "action": "Sell",
+        "price": 41.35,
+    }
+    subscriber.close()
+    bus.publish(EventKind.Status, code="1605")
+    bus.flush()
+    assert bus.subscribers == set()
+    assert bus.stats.as_dict() == {
+        "published": 3,
+        "sent": 1,
+        "dropped": 0,
+        "overflow": 0,
+    }
+    bus.close()
+
+
+def test_event_bus_drop_slow_consumer(tmp_path):
+    bus = EventBus(tmp_path / "bus.sock", maxlen=4, autostart=False)
+    subscriber = EventSubscriber(tmp_path / "bus.sock", tmp_path / "sub.sock")
+    for i in range(6):
+        bus.publish(EventKind.Decision, seq=i)
+    # bounded queue keep the newest
+    assert [fields["seq"] for _, _, fields in bus.queue] == [2, 3, 4, 5]
+    assert bus.stats.overflow == 2
+    bus.flush()
+    # a subscriber that never read fill its buffer, sends are dropped not blocked
+    start = time.perf_counter()
+    for i in range(20000):
+        bus.publish(EventKind.Decision, seq=i, pad="x" * 512)
+        if len(bus.queue) == bus.maxlen:
+            bus.flush()
+    bus.flush()
+    assert bus.stats.dropped > 0
+    assert time.perf_counter() - start < 10
+    assert subscriber.recv(1)["seq"] == 2
+    subscriber.close()
+    bus.close()
@@ -0,0 +1,25 @@
+import pytest
+import shioaji as sj
+from shioaji.constant import Action
+
+from sjtrade.data import Snapshot
+from sjtrade.execution import peg_price
+
+
+@pytest.mark.parametrize(
+    ("snapshot", "action", "ticks", "expected"),
+    [
+        (Snapshot(price=40.0, bid=39.95, ask=40.05), Action.Buy, 2, 40.15),
+        (Snapshot(price=40.0, bid=39.95, ask=40.05), Action.Sell, 2, 39.85),
+        (Snapshot(price=39.9), Action.Sell, 1, 39.85),
+        (Snapshot(price=43.2, bid=43.2, ask=43.25), Action.Buy, 3, 43.3),
+        (Snapshot(price=35.6, bid=35.55, ask=35.6), Action.Sell, 3, 35.5),
+        (Snapshot(), Action.Buy, 2, None),
+        (None, Action.Buy, 2, None),
+    ],
+)
+def test_peg_price(
+    api: sj.Shioaji, snapshot: Snapshot, action: Action, ticks: int, expected: float
+):
+    contract = api.Contracts.Stocks["1605"]
+    assert peg_price(contract, snapshot, action, ticks) == expected
@@ -0,0 +1,47 @@
+import sys
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_python(code: str, cwd: Path) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        env={"PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_import_without_broker_sdk(tmp_path: Path):
+    out = run_python(
+        "import sys, sjtrade, sjtrade.utils, sjtrade.io.file\n"
+        "print(sjtrade.utils.quantity_split(998, 499))\n"
+        "print(sorted(m for m in ('shioaji', 'loguru', 'rs2py', 'xxhash') if m in sys.modules))",
+        tmp_path,
+    )
+    assert out.split("\n")[:2] == ["[499, 499]", "[]"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lazy_attribute(tmp_path: Path):
+    out = run_python(
+        "import sys, sjtrade\n"
+        "from sjtrade import SJTrader\n"
+        "print(SJTrader.__module__, 'xxhash' in sys.modules)\n"
+        "print(sjtrade.io.file.read_position.__name__)\n"
+        "try:\n"
+        "    sjtrade.not_exist\n"
+        "except AttributeError:\n"
+        "    print('AttributeError')\n",
+        tmp_path,
+    )
+    assert out.split("\n")[:3] == [
+        "sjtrade.trader False",
+        "read_position",
+        "AttributeError",
+    ]
+    assert not (tmp_path / "sjtrader.log").exists()
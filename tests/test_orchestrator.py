@@ -0,0 +1,129 @@
+import random
+import datetime
+
+import pytest
+
+from sjtrade.backtest import TickTable, seconds_of
+from sjtrade.contracts import ContractRef, ContractTable
+from sjtrade.orchestrator import ResultCache, make_jobs, run_jobs
+from sjtrade.stress import TickGenerator, gen_contracts_raw
+
+
+def ts_of(h: int, m: int, s: int = 0) -> float:
+    return seconds_of(datetime.time(h, m, s))
+
+
+@pytest.fixture
+def day_files(tmp_path):
+    rng = random.Random(7)
+    contracts_raw = gen_contracts_raw(20, rng)
+    contracts = ContractTable(
+        ContractRef(**{k: c[k] for k in ContractRef.__slots__}) for c in contracts_raw
+    )
+    date = datetime.date(2022, 5, 25)
+    days = ["20220525", "20220526"]
+    for day in days:
+        positions = {c["code"]: rng.choice((-1, 1)) for c in contracts_raw}
+        (tmp_path / f"position_{day}.txt").write_text(
+            "".join(f"{code}\t{pos}\n" for code, pos in positions.items())
+        )
+        gen = TickGenerator(contracts_raw, rng, max_move=6)
+        ticks = TickTable()
+        ts = ts_of(9, 0)
+        while ts < ts_of(13, 30):
+            for code in positions:
+                tick = gen.next_tick(code, date, False)
+                ticks.append(ts, code, tick.close, tick.volume, False)
+            ts += 120.0
+        ticks.to_csv(tmp_path / f"ticks_{day}.csv")
+    return tmp_path, days, contracts
+
+
+def test_tick_table_csv_roundtrip(tmp_path):
+    table = TickTable([1.5, 2.0], ["1605", "6290"], [41.0, 57.3], [3, 1], [True, False])
+    table.to_csv(tmp_path / "ticks.csv")
+    loaded = TickTable.from_csv(tmp_path / "ticks.csv")
+    for k in TickTable.__slots__:
+        assert getattr(loaded, k) == getattr(table, k)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_run_jobs_cache(day_files, max_workers: int):
+    path, days, contracts = day_files
+    cache = ResultCache(path / "cache")
+    grid = [{"entry_pct": 0.01}, {"entry_pct": 0.02}]
+
+    def jobs(grid):
+        return make_jobs(
+            days,
+            grid,
+            str(path / "position_{day}.txt"),
+            str(path / "ticks_{day}.csv"),
+            contracts,
+        )
+
+    first = list(run_jobs(jobs(grid), cache, max_workers=max_workers))
+    assert len(first) == 4
+    assert not any(res.cached for _, res in first)
+    assert all(res.fills for _, res in first)
+    assert {res.key for _, res in first} == {job.key() for job in jobs(grid)}
+
+    # one tweaked percentage only recompute its own days
+    second = list(run_jobs(jobs(grid + [{"entry_pct": 0.03}]), cache, max_workers))
+    assert sorted(res.cached for _, res in second) == [False, False, True, True, True, True]
+    by_key = {res.key: res for _, res in first}
+    for job, res in second:
+        if res.cached:
+            assert res.fills == by_key[res.key].fills
+            assert res.total_pnl == pytest.approx(by_key[res.key].total_pnl)
+
+    # position file change invalidate that day only
+    (path / f"position_{days[0]}.txt").write_text("S00000\t1\n")
+    third = list(run_jobs(jobs(grid), cache, max_workers))
+    assert sorted((job.day, res.cached) for job, res in third) == [
+        (days[0], False),
+        (days[0], False),
+        (days[1], True),
+        (days[1], True),
+    ]
+
+
+def test_run_jobs_dedupe(day_files):
+    path, days, contracts = day_files
+    jobs = make_jobs(
+        days[:1],
+        [{}, {}],
+        str(path / "position_{day}.txt"),
+        str(path / "ticks_{day}.csv"),
+        contracts,
+    )
+    res = list(run_jobs(jobs, max_workers=1))
+    assert len(res) == 2
+    assert res[0][1] is res[1][1]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_run_jobs_bad_day(day_files, max_workers: int):
+    path, days, contracts = day_files
+    (path / f"ticks_{days[0]}.csv").write_text("ts,code\nnot,a tick file\n")
+    cache = ResultCache(path / "cache")
+    jobs = make_jobs(
+        days,
+        [{"entry_pct": 0.01}, {"entry_pct": 0.02}],
+        str(path / "position_{day}.txt"),
+        str(path / "ticks_{day}.csv"),
+        contracts,
+    )
+    res = list(run_jobs(jobs, cache, max_workers=max_workers))
+    assert len(res) == 4
+    assert sorted((job.day, result.ok) for job, result in res) == [
+        (days[0], False),
+        (days[0], False),
+        (days[1], True),
+        (days[1], True),
+    ]
+    for job, result in res:
+        if not result.ok:
+            assert result.error and result.key not in cache
+        else:
+            assert result.fills and result.key in cache
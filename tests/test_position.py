@@ -0,0 +1,39 @@
+import threading
+
+from shioaji.constant import StockPriceType
+
+from sjtrade.position import PriceSet
+
+
+def test_price_set_claim():
+    price_set = PriceSet(price=41.35, quantity=-3, price_type=StockPriceType.LMT)
+    assert price_set.claim(-1) == -1
+    assert price_set.claim() == -2
+    assert price_set.claim() == 0
+    price_set.release(-2)
+    assert price_set.claim(-5) == -2
+    assert price_set.in_transit_quantity == -3
+    # opposite sign never claims
+    price_set.release(-3)
+    assert price_set.claim(1) == 0
+
+
+def test_price_set_claim_concurrent():
+    price_set = PriceSet(price=41.35, quantity=1000, price_type=StockPriceType.MKT)
+    claimed = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        for _ in range(500):
+            q = price_set.claim(1)
+            if q:
+                claimed.append(q)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(claimed) == 1000
+    assert price_set.in_transit_quantity == 1000
@@ -0,0 +1,138 @@
+import pytest
+import shioaji as sj
+from shioaji.constant import Action, StockPriceType, OrderType
+
+from sjtrade.position import Position, PositionCond, PriceSet
+from sjtrade.registry import TradeRegistry, TradeRole
+
+
+@pytest.fixture
+def position(api: sj.Shioaji) -> Position:
+    price_set = PriceSet(price=41.35, quantity=-3, price_type=StockPriceType.LMT)
+    return Position(
+        contract=api.Contracts.Stocks["1605"],
+        cond=PositionCond(
+            quantity=-3,
+            entry_price=[price_set],
+            stop_loss_price=[],
+            stop_profit_price=[],
+        ),
+    )
+
+
+def gen_trade(position: Position, quantity: int, action: Action = Action.Sell):
+    return sj.order.Trade(
+        position.contract,
+        sj.order.StockOrder(
+            price=41.35,
+            quantity=quantity,
+            action=action,
+            price_type=StockPriceType.LMT,
+            order_type=OrderType.ROD,
+            custom_field="dt1",
+        ),
+        sj.order.OrderStatus(status=sj.order.Status.PreSubmitted),
+    )
+
+
+def gen_order_msg(order_id: str, action: Action, quantity: int, op_type: str):
+    return {
+        "operation": {"op_type": op_type, "op_code": "00", "op_msg": ""},
+        "order": {
+            "id": order_id,
+            "seqno": f"{order_id}s",
+            "action": action,
+            "price": 41.35,
+            "quantity": quantity,
+        },
+        "status": {
+            "id": order_id,
+            "order_quantity": quantity if op_type == "New" else 0,
+            "cancel_quantity": quantity if op_type == "Cancel" else 0,
+        },
+        "contract": {"code": "1605"},
+    }
+
+
+def test_registry_bind_pending(position: Position):
+    registry = TradeRegistry()
+    price_set = position.cond.entry_price[0]
+    trade1 = gen_trade(position, 1)
+    trade2 = gen_trade(position, 2)
+    registry.register(trade1, position, TradeRole.Entry, price_set)
+    registry.register(trade2, position, TradeRole.Entry, price_set)
+    assert len(registry) == 2
+    assert len(registry.working_records()) == 2
+
+    record = registry.on_order(gen_order_msg("a2", Action.Sell, 2, "New"))
+    assert record.trade is trade2
+    assert record.status == sj.order.Status.Submitted
+    assert registry.by_seqno["a2s"] is record
+    assert registry.on_order(gen_order_msg("a3", Action.Buy, 1, "New")) is None
+    record = registry.on_order(gen_order_msg("a1", Action.Sell, 1, "New"))
+    assert record.trade is trade1
+    assert registry.pending == {}
+
+
+def test_registry_deal_and_cancel(position: Position):
+    registry = TradeRegistry()
+    price_set = position.cond.entry_price[0]
+    price_set.in_transit_quantity = -3
+    trade = gen_trade(position, 3)
+    trade.order.id = "a1"
+    record = registry.register(trade, position, TradeRole.Entry, price_set)
+    assert registry.by_id["a1"] is record
+
+    registry.on_deal({"trade_id": "a1", "quantity": 1})
+    assert record.filled == 1
+    assert trade.status.deal_quantity == 1
+    assert trade.status.status == sj.order.Status.PartFilled
+    assert registry.working_records(TradeRole.Entry) == [record]
+    assert registry.working_records(TradeRole.Cover) == []
+
+    msg = gen_order_msg("a1", Action.Sell, 3, "Cancel")
+    msg["status"]["cancel_quantity"] = 2
+    registry.on_order(msg)
+    assert record.cancelled == 2
+    assert price_set.in_transit_quantity == -1
+    assert trade.status.status == sj.order.Status.Cancelled
+    assert registry.working_records() == []
+
+
+def test_registry_filled(position: Position):
+    registry = TradeRegistry()
+    trade = gen_trade(position, 2, Action.Buy)
+    trade.order.id = "a1"
+    trade.order.seqno = "000001"
+    record = registry.register(trade, position, TradeRole.Cover)
+    registry.on_deal({"trade_id": "", "seqno": "000001", "quantity": 2})
+    assert record.status == sj.order.Status.Filled
+    assert record.remaining == 0
+    assert registry.working_records() == []
+    assert list(registry.iter_records()) == [record]
+
+
+def test_registry_drop_done_trade(position: Position):
+    registry = TradeRegistry()
+    trade = gen_trade(position, 2)
+    record = registry.register(trade, position, TradeRole.Entry)
+    assert (record.order_id, record.action, record.price, record.quantity) == (
+        "",
+        Action.Sell,
+        41.35,
+        2,
+    )
+    registry.on_order(gen_order_msg("a1", Action.Sell, 2, "New"))
+    assert (record.order_id, record.seqno) == ("a1", "a1s")
+    msg = gen_order_msg("a1", Action.Sell, 2, "UpdatePrice")
+    msg["order"]["price"] = 41.5
+    registry.on_order(msg)
+    assert record.price == trade.order.price == 41.5
+    # kept while a cancel may still need it, dropped once done
+    assert record.trade is trade
+    registry.on_deal({"trade_id": "a1", "quantity": 2})
+    assert trade.status.status == sj.order.Status.Filled
+    assert record.trade is None
+    assert record.status == sj.order.Status.Filled
+    assert record.filled == 2
+    assert record.updated_at >= record.placed_at
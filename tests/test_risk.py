@@ -0,0 +1,95 @@
+import pytest
+import shioaji as sj
+from pytest_mock import MockerFixture
+from shioaji.constant import Action, StockPriceType, OrderType
+
+from sjtrade.risk import RiskGate, RiskLimit, TokenBucket
+
+
+def gen_order(price: float, quantity: int, price_type=StockPriceType.LMT):
+    return sj.order.StockOrder(
+        price=price,
+        quantity=quantity,
+        action=Action.Sell,
+        price_type=price_type,
+        order_type=OrderType.ROD,
+        custom_field="dt1",
+    )
+
+
+@pytest.fixture
+def contract(api: sj.Shioaji):
+    return api.Contracts.Stocks["1605"]
+
+
+def test_risk_gate_price_band(contract):
+    gate = RiskGate()
+    assert gate.check(contract, gen_order(41.35, 1))
+    assert not gate.check(contract, gen_order(43.35, 1))
+    assert not gate.check(contract, gen_order(35.45, 1), reduce_only=True)
+    assert gate.check(contract, gen_order(0, 1, StockPriceType.MKT))
+
+
+def test_risk_gate_notional(contract):
+    gate = RiskGate(RiskLimit(max_notional_per_code=39.4 * 1000 * 2))
+    assert gate.check(contract, gen_order(41.35, 2))
+    assert not gate.check(contract, gen_order(41.35, 1))
+    assert gate.check(contract, gen_order(41.35, 1), reduce_only=True)
+    gate.on_cancel(contract, 1, reduce_only=False)
+    assert gate.check(contract, gen_order(41.35, 1))
+    gate.on_deal(contract, 2, reduce_only=True)
+    assert gate.notional["1605"] == pytest.approx(0)
+    assert gate.gross_exposure == pytest.approx(0)
+
+
+def test_risk_gate_gross_exposure(api: sj.Shioaji):
+    gate = RiskGate(RiskLimit(max_gross_exposure=100000))
+    assert gate.check(api.Contracts.Stocks["1605"], gen_order(41.35, 2))
+    assert not gate.check(api.Contracts.Stocks["6290"], gen_order(60.1, 1))
+    assert gate.gross_exposure == pytest.approx(39.4 * 1000 * 2)
+
+
+def test_risk_gate_open_orders(contract):
+    gate = RiskGate(RiskLimit(max_open_orders=2))
+    assert gate.check(contract, gen_order(41.35, 1))
+    assert gate.check(contract, gen_order(41.35, 2))
+    assert not gate.check(contract, gen_order(41.35, 1))
+    gate.on_deal(contract, 1, reduce_only=False)
+    assert gate.open_orders == 2
+    gate.on_deal(contract, 2, reduce_only=False)
+    assert gate.open_orders == 0
+    assert gate.check(contract, gen_order(41.35, 1))
+    gate.on_cancel(contract, 1, reduce_only=False)
+    assert gate.open_orders == 0
+
+
+def test_risk_gate_open_orders_per_order(contract):
+    gate = RiskGate(RiskLimit(max_open_orders=2))
+    assert gate.check(contract, gen_order(41.35, 5))
+    assert gate.check(contract, gen_order(41.35, 5))
+    # one order fully filled while the other still work
+    gate.on_deal(contract, 5, reduce_only=False, done=True)
+    assert gate.open_orders == 1
+    assert gate.code_working_quantity["1605"] == 5
+    assert gate.check(contract, gen_order(41.35, 1))
+    gate.on_reject(contract, 1, reduce_only=False)
+    assert gate.open_orders == 1
+    assert gate.notional["1605"] == pytest.approx(39.4 * 1000 * 10)
+
+
+def test_risk_gate_order_rate(contract, mocker: MockerFixture):
+    monotonic = mocker.patch("sjtrade.risk.time.monotonic", return_value=100.0)
+    gate = RiskGate(RiskLimit(max_order_rate=2, max_order_burst=2))
+    assert gate.check(contract, gen_order(41.35, 1))
+    assert gate.check(contract, gen_order(41.35, 1))
+    assert not gate.check(contract, gen_order(41.35, 1))
+    assert gate.check(contract, gen_order(0, 1, StockPriceType.MKT), reduce_only=True)
+    monotonic.return_value = 100.5
+    assert gate.check(contract, gen_order(41.35, 1))
+
+
+def test_token_bucket_capacity(mocker: MockerFixture):
+    monotonic = mocker.patch("sjtrade.risk.time.monotonic", return_value=0.0)
+    bucket = TokenBucket(rate=10, capacity=3)
+    monotonic.return_value = 100.0
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
@@ -0,0 +1,123 @@
+import json
+import datetime
+
+import pytest
+
+from sjtrade.session import (
+    Phase,
+    SessionCalendar,
+    SessionPlan,
+    load_session_plan,
+)
+
+TZ = datetime.timezone(datetime.timedelta(hours=8))
+
+PLAN_TOML = """
+[calendar]
+utc_offset = 8
+holidays = ["2022-06-03"]
+
+[calendar.overrides."2022-06-02"]
+cover = "11:55:59"
+blotter = "skip"
+
+[[phases]]
+name = "entry"
+time = "08:45"
+handler = "place_entry_positions"
+
+[[phases]]
+name = "intraday"
+time = 08:59:55
+tick_handler = "intraday_handler"
+
+[[phases]]
+name = "cover"
+time = "13:25:59"
+handler = "open_position_cover"
+args = [false]
+
+[[phases]]
+name = "blotter"
+time = "13:35"
+handler = "export_blotter"
+"""
+
+
+def test_session_plan_toml(tmp_path):
+    p = tmp_path / "plan.toml"
+    p.write_text(PLAN_TOML)
+    plan = load_session_plan(p)
+    assert [phase.name for phase in plan.phases] == [
+        "entry",
+        "intraday",
+        "cover",
+        "blotter",
+    ]
+    assert plan.phases[2].args == (False,)
+    half_day = plan.schedule(datetime.date(2022, 6, 2))
+    assert [(s.phase.name, s.at.time()) for s in half_day] == [
+        ("entry", datetime.time(8, 45)),
+        ("intraday", datetime.time(8, 59, 55)),
+        ("cover", datetime.time(11, 55, 59)),
+    ]
+    assert half_day[0].at.utcoffset() == datetime.timedelta(hours=8)
+
+
+def test_session_plan_json_default_phases(tmp_path):
+    p = tmp_path / "plan.json"
+    p.write_text(json.dumps({"calendar": {"utc_offset": 9}}))
+    plan = load_session_plan(p)
+    assert [phase.name for phase in plan.phases] == [
+        "entry",
+        "cancel_preorder",
+        "intraday",
+        "cover",
+    ]
+    assert plan.calendar.utc_offset == 9
+    with pytest.raises(FileNotFoundError):
+        load_session_plan(tmp_path / "not_exist.toml")
+    (tmp_path / "plan.ini").write_text("")
+    with pytest.raises(ValueError):
+        load_session_plan(tmp_path / "plan.ini")
+
+
+def test_session_plan_yaml_unquoted_times(tmp_path):
+    pytest.importorskip("yaml")
+    p = tmp_path / "plan.yaml"
+    p.write_text(
+        "phases:\n"
+        "  - {name: entry, time: 8:45, handler: place_entry_positions}\n"
+        "  - {name: cover, time: 13:25:59, handler: open_position_cover}\n"
+        "  - {name: blotter, time: 13:35, handler: export_blotter}\n"
+    )
+    plan = load_session_plan(p)
+    assert [phase.time for phase in plan.phases] == [
+        datetime.time(8, 45),
+        datetime.time(13, 25, 59),
+        datetime.time(13, 35),
+    ]
+
+
+def test_session_plan_next_schedule():
+    calendar = SessionCalendar(
+        holidays={datetime.date(2022, 6, 3)},
+        trading_days={datetime.date(2022, 6, 4)},
+    )
+    plan = SessionPlan.default(calendar=calendar)
+    # thursday before the close, today session
+    now = datetime.datetime(2022, 6, 2, 10, 0, tzinfo=TZ)
+    assert plan.next_schedule(now)[0].at.date() == datetime.date(2022, 6, 2)
+    # after the last phase, friday holiday, make up saturday
+    now = datetime.datetime(2022, 6, 2, 14, 0, tzinfo=TZ)
+    assert plan.next_schedule(now)[0].at.date() == datetime.date(2022, 6, 4)
+    # sunday utc evening is already monday in taipei
+    now = datetime.datetime(2022, 6, 5, 22, 0, tzinfo=datetime.timezone.utc)
+    assert plan.next_schedule(now)[0].at.date() == datetime.date(2022, 6, 6)
+
+
+def test_phase_handler_required():
+    with pytest.raises(ValueError):
+        Phase("entry", datetime.time(8, 45))
+    with pytest.raises(ValueError):
+        Phase("entry", datetime.time(8, 45), handler="a", tick_handler="b")
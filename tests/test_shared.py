@@ -0,0 +1,109 @@
+import time
+import threading
+import shioaji as sj
+from pytest_mock import MockerFixture
+
+from sjtrade.data import Snapshot
+from sjtrade.shared import (
+    FIELD_INDEX,
+    PRICE_TYPE_MKT,
+    IntentConsumer,
+    IntentQueue,
+    SharedMarketState,
+    start_worker,
+)
+
+
+def test_shared_market_state_write_read():
+    state = SharedMarketState(["1605", "6290"])
+    snapshot = Snapshot(price=40.0, bid=39.95, ask=40.05)
+    snapshot.volume = 3
+    state.write("6290", snapshot)
+    state.write("0000", snapshot)
+    assert state.seq(0) == 0
+    assert state.seq(1) == 2
+    assert state.view[1, FIELD_INDEX["ask"]] == 40.05
+    res = state.read_snapshot(1)
+    assert (res.price, res.bid, res.ask, res.volume) == (40.0, 39.95, 40.05, 3)
+    last_seqs = [0, 0]
+    assert state.changed(last_seqs) == [1]
+    assert last_seqs == [0, 2]
+    assert state.changed(last_seqs) == []
+
+
+def test_shared_market_state_concurrent_writers():
+    # tick and bidask callbacks write the same slot from two threads
+    state = SharedMarketState(["1605"])
+    n = 20000
+
+    def writer(price: float):
+        for _ in range(n):
+            state.write("1605", Snapshot(price=price, bid=price, ask=price))
+
+    threads = [threading.Thread(target=writer, args=(p,)) for p in (40.0, 41.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state.seq(0) == 4 * n
+    seq, price, bid, ask = state.read(0)[:4]
+    assert price == bid == ask
+
+
+def test_intent_queue_wrap():
+    queue = IntentQueue(capacity=2)
+    assert queue.pop() is None
+    assert queue.push(0, 1, 40.0)
+    assert queue.push(1, 2, 0, PRICE_TYPE_MKT)
+    assert not queue.push(1, 3, 0)
+    assert len(queue) == 2
+    assert queue.pop() == (0, 1, 40.0, 0)
+    assert queue.push(0, 4, 41.0)
+    assert queue.drain() == [(1, 2, 0, 1), (0, 4, 41.0, 0)]
+    assert len(queue) == 0
+
+
+def cover_when_above(state: SharedMarketState, queue: IntentQueue, limit: float):
+    last_seqs = [0] * len(state.codes)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        for slot in state.changed(last_seqs):
+            if state.view[slot, FIELD_INDEX["price"]] >= limit:
+                queue.push(slot, 1, 0, PRICE_TYPE_MKT)
+                return
+        time.sleep(0.001)
+
+
+def test_worker_process():
+    state = SharedMarketState(["1605", "6290"])
+    queue = IntentQueue()
+    process = start_worker(cover_when_above, state, queue, 42.0)
+    state.write("1605", Snapshot(price=41.0))
+    state.write("1605", Snapshot(price=42.5))
+    process.join(10)
+    assert queue.drain() == [(0, 1, 0, PRICE_TYPE_MKT)]
+
+
+def test_shared_market_state_setstate():
+    state = SharedMarketState(["1605"])
+    attached = SharedMarketState.__new__(SharedMarketState)
+    attached.__setstate__(state.__getstate__())
+    state.write("1605", Snapshot(price=41.0))
+    assert attached.view[0, FIELD_INDEX["price"]] == 41.0
+    assert attached.read(0)[0] == 2
+
+
+def test_intent_consumer(mocker: MockerFixture):
+    state = SharedMarketState(["1605", "6290"])
+    queue = IntentQueue()
+    dispatch = mocker.MagicMock()
+    consumer = IntentConsumer(dispatch, state, [queue])
+    queue.push(1, 2, 60.0)
+    assert consumer.poll() == 1
+    dispatch.assert_called_once_with("6290", 2, 60.0, 0)
+    consumer.start()
+    queue.push(0, 1, 0, PRICE_TYPE_MKT)
+    time.sleep(0.05)
+    consumer.stop()
+    consumer.join(1)
+    dispatch.assert_called_with("1605", 1, 0, PRICE_TYPE_MKT)
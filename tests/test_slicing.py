@@ -0,0 +1,107 @@
+import pytest
+from shioaji.constant import StockPriceType
+
+from sjtrade.position import PriceSet
+from sjtrade.registry import TradeRole
+from sjtrade.slicing import (
+    OrderSlicer,
+    RecentVolume,
+    SliceConfig,
+    SliceMode,
+    allocate,
+    plan_slices,
+)
+from sjtrade.timer import TimerWheel
+
+
+@pytest.mark.parametrize(
+    ("quantity", "weights", "expected"),
+    [
+        (10, [1, 1, 1], [4, 3, 3]),
+        (7, [1, 2, 4], [1, 2, 4]),
+        (5, [0, 0], [3, 2]),
+    ],
+)
+def test_allocate(quantity, weights, expected):
+    res = allocate(quantity, weights)
+    assert sum(res) == quantity
+    assert sorted(res) == sorted(expected)
+
+
+def test_plan_slices_immediate():
+    assert plan_slices(1200, SliceConfig()) == [(0.0, 400)] * 3
+    assert plan_slices(-998, SliceConfig()) == [(0.0, -499)] * 2
+    assert plan_slices(0, SliceConfig()) == []
+
+
+def test_plan_slices_participation():
+    config = SliceConfig(participation=0.1)
+    assert plan_slices(-10, config, recent_volume=40) == [(0.0, -4), (0.0, -3), (0.0, -3)]
+    assert plan_slices(10, config) == [(0.0, 10)]
+
+
+def test_plan_slices_twap():
+    config = SliceConfig(mode=SliceMode.TWAP, window=20.0, interval=5.0)
+    plan = plan_slices(-8, config)
+    assert plan == [(0.0, -2), (5.0, -2), (10.0, -2), (15.0, -2)]
+
+
+def test_plan_slices_vwap():
+    config = SliceConfig(
+        mode=SliceMode.VWAP, window=30.0, volume_profile=[3, 1, 0], max_quantity=2
+    )
+    plan = plan_slices(8, config)
+    assert plan == [(0.0, 2), (0.0, 2), (0.0, 2), (10.0, 2)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def wheel() -> TimerWheel:
+    return TimerWheel(resolution=1.0, slots=16, clock=FakeClock(), autostart=False)
+
+
+def test_order_slicer_fire(wheel: TimerWheel):
+    slicer = OrderSlicer(wheel)
+    price_set = PriceSet(price=10, quantity=-6, price_type=StockPriceType.LMT)
+    sent = []
+    plan = [(0.0, -2), (2.0, -2), (4.0, -2)]
+    slicer.submit("2890", TradeRole.Entry, price_set, plan, lambda q, r: sent.append((q, r)))
+    assert sent == [(-2, False)]
+    assert price_set.in_transit_quantity == -4
+    wheel.advance(2.0)
+    assert sent == [(-2, False), (-2, True)]
+    wheel.advance(4.0)
+    assert sent[-1] == (-2, True)
+    assert slicer.schedules == {}
+
+
+def test_order_slicer_cancel(wheel: TimerWheel):
+    slicer = OrderSlicer(wheel)
+    entry = PriceSet(price=10, quantity=-6, price_type=StockPriceType.LMT)
+    cover = PriceSet(price=0, quantity=6, price_type=StockPriceType.MKT)
+    sent = []
+    send = lambda q, r: sent.append(q)
+    slicer.submit("2890", TradeRole.Entry, entry, [(1.0, -3), (2.0, -3)], send)
+    slicer.submit("2890", TradeRole.Cover, cover, [(1.0, 6)], send)
+    assert slicer.cancel("2890", TradeRole.Entry) == -6
+    assert entry.in_transit_quantity == 0
+    assert cover.in_transit_quantity == 6
+    assert slicer.cancel_all() == 6
+    assert cover.in_transit_quantity == 0
+    wheel.advance(5.0)
+    assert sent == []
+    assert len(wheel) == 0
+
+
+def test_recent_volume_decay():
+    recent = RecentVolume(halflife=10.0)
+    assert recent.update(100, 1.0) == 100
+    assert recent.update(0, 11.0) == pytest.approx(50)
+    assert recent.update(50, 21.0) == pytest.approx(75)
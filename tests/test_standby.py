@@ -0,0 +1,335 @@
+import datetime
+from decimal import Decimal
+from dataclasses import dataclass
+
+import pytest
+import shioaji as sj
+from pytest_mock import MockerFixture
+from shioaji.constant import (
+    Action,
+    Exchange,
+    OrderType,
+    QuoteVersion,
+    StockPriceType,
+)
+
+from sjtrade.events import EventBus, EventKind, EventSubscriber
+from sjtrade.position import PositionState
+from sjtrade.standby import StandbyTrader
+from sjtrade.strategy import StrategyBasic
+from sjtrade.timer import TimerWheel
+from sjtrade.trader import SJTrader
+
+PAST = datetime.datetime(2022, 5, 25, 9, tzinfo=datetime.timezone.utc)
+COVER_TIME = datetime.time(13, 25, 59)
+
+
+@dataclass
+class TickSTKv1:
+    code: str
+    datetime: datetime.datetime
+    close: Decimal
+    simtrade: bool
+    volume: int = 1
+
+
+@dataclass
+class StockPosition:
+    code: str
+    direction: Action
+    quantity: int
+
+
+def broker_positions(trader: SJTrader):
+    return [
+        StockPosition(
+            code,
+            Action.Buy if position.status.open_quantity > 0 else Action.Sell,
+            abs(position.status.open_quantity),
+        )
+        for code, position in trader.positions.items()
+        if position.status.open_quantity
+    ]
+
+
+def new_trader(api, mocker: MockerFixture) -> SJTrader:
+    trader = SJTrader(api)
+    trader.stratagy = StrategyBasic(entry_pct=0.05, contracts=api.Contracts)
+    trader.stratagy.read_position_func = mocker.MagicMock()
+    trader.stratagy.read_position_func.return_value = {"1605": -1, "6290": -3}
+    trader.timer_wheel = TimerWheel(autostart=False)
+    trader.api.place_order.side_effect = lambda contract, order, timeout: (
+        sj.order.Trade(
+            contract,
+            order,
+            sj.order.OrderStatus(status=sj.order.Status.PreSubmitted),
+        )
+    )
+    return trader
+
+
+@pytest.fixture
+def primary(api, mocker: MockerFixture, tmp_path) -> SJTrader:
+    trader = new_trader(api, mocker)
+    trader.place_entry_positions()
+    trader.event_bus = EventBus(tmp_path / "bus.sock", autostart=False)
+    trader.heartbeat_interval = 1.0
+    trader.serve_standby()
+    yield trader
+    trader.event_bus.close()
+
+
+@pytest.fixture
+def standby(api, mocker: MockerFixture, tmp_path) -> StandbyTrader:
+    standby_api = mocker.MagicMock()
+    standby_api.Contracts = api.Contracts
+    trader = new_trader(standby_api, mocker)
+    trader.executor = mocker.MagicMock()
+    # the broker agree with the mirrored book unless a test say otherwise
+    standby_api.list_positions.side_effect = lambda timeout: broker_positions(trader)
+    now = [0.0]
+    subscriber = EventSubscriber(tmp_path / "bus.sock", tmp_path / "standby.sock")
+    plan = [
+        (PAST, trader.place_entry_positions, ()),
+        (PAST, trader.set_on_tick_handler, (trader.cancel_preorder_handler,)),
+        (PAST, trader.set_on_tick_handler, (trader.intraday_handler,)),
+        (COVER_TIME, trader.open_position_cover, ()),
+    ]
+    standby = StandbyTrader(
+        trader, subscriber, timeout=3.0, plan=plan, clock=lambda: now[0]
+    )
+    standby.now = now
+    yield standby
+    subscriber.close()
+
+
+def order_msg(code: str, action: Action, quantity: int):
+    return {
+        "operation": {"op_type": "New", "op_code": "00", "op_msg": ""},
+        "order": {
+            "id": "c21b876d",
+            "seqno": "429832",
+            "action": action,
+            "price": 43.3,
+            "quantity": quantity,
+            "custom_field": "dt1",
+        },
+        "status": {"id": "c21b876d", "order_quantity": quantity},
+        "contract": {"code": code},
+    }
+
+
+def deal_msg(code: str, action: Action, quantity: int):
+    return {
+        "trade_id": "c21b876d",
+        "seqno": "429832",
+        "action": action,
+        "code": code,
+        "price": 43.3,
+        "quantity": quantity,
+        "custom_field": "dt1",
+    }
+
+
+def sync(primary: SJTrader, standby: StandbyTrader) -> int:
+    primary.event_bus.flush()
+    return standby.drain(0.1)
+
+
+def test_standby_mirror_and_takeover(primary: SJTrader, standby: StandbyTrader):
+    # the book placed before the standby joined is replayed on subscribe
+    assert sync(primary, standby) == 2
+    trader = standby.trader
+    assert set(trader.positions) == {"1605", "6290"}
+    for run in (
+        (trader.cancel_preorder_handler,),
+        (trader.intraday_handler,),
+    ):
+        primary.run_at(PAST, primary.set_on_tick_handler, *run)
+    primary.emit(EventKind.Phase, handler="place_entry_positions", args=[], done=True)
+    position = primary.positions["1605"]
+    primary.order_handler(order_msg("1605", Action.Sell, 1), position)
+    primary.deal_handler(deal_msg("1605", Action.Sell, 1), position)
+    primary.heartbeat()
+    sync(primary, standby)
+    mirrored = trader.positions["1605"]
+    assert mirrored.status == position.status
+    assert mirrored.status.state == PositionState.Open
+    assert mirrored.cond == position.cond
+    assert mirrored.cond.stop_loss_price[0].price_type == StockPriceType.MKT
+    assert standby.primary == "dt1" and standby.seq == 1
+    assert standby.phases[("set_on_tick_handler", ("intraday_handler",))]
+
+    working = sj.order.Trade(
+        trader.positions["6290"].contract,
+        sj.order.StockOrder(
+            action=Action.Sell,
+            price=60.15,
+            quantity=3,
+            price_type=StockPriceType.LMT,
+            order_type=OrderType.ROD,
+            id="d31c987e",
+            custom_field="dt1",
+        ),
+        sj.order.OrderStatus(status=sj.order.Status.Submitted),
+    )
+    trader.api.list_trades.return_value = [working]
+    standby.now[0] = 2.5
+    assert not standby.check()
+    standby.now[0] = 3.0
+    assert standby.check()
+    assert standby.active
+    api = trader.api
+    api.set_order_callback.assert_called_with(trader.order_deal_handler)
+    api.quote.set_on_tick_stk_v1_callback.assert_called_with(trader.intraday_handler)
+    api.quote.subscribe.assert_any_call(mirrored.contract, version=QuoteVersion.v1)
+    # entries stay with the primary, the cover phase is still ahead
+    (future,) = standby.futures
+    trader.executor.submit.assert_called_once_with(
+        trader.run_at, COVER_TIME, trader.open_position_cover
+    )
+    (record,) = trader.registry.working_records()
+    assert record.order_id == "d31c987e"
+    assert trader.positions["6290"].status.working_orders == 1
+
+    # stop monitoring continue on the standby
+    trader.intraday_handler(
+        Exchange.TSE,
+        TickSTKv1("1605", "2022-05-25 09:01:00", Decimal("43.0"), False),
+    )
+    order = api.place_order.call_args.kwargs["order"]
+    assert order.action == Action.Buy and order.quantity == 1
+    assert mirrored.status.cover_order_quantity == 0
+    assert mirrored.cond.stop_loss_price[0].in_transit_quantity == -1
+
+
+def test_standby_armed_by_heartbeat(standby: StandbyTrader):
+    standby.now[0] = 100.0
+    assert not standby.check()
+    standby.apply({"kind": "Heartbeat", "name": "dt1", "seq": 7, "positions": 0})
+    standby.now[0] = 102.0
+    assert not standby.check()
+    standby.now[0] = 103.0
+    assert standby.check()
+    # a primary coming back after takeover is not trusted again
+    standby.apply({"kind": "Heartbeat", "name": "dt1", "seq": 8, "positions": 0})
+    assert standby.seq == 7 and not standby.check()
+
+
+def cancel_preorder(trader: SJTrader, code: str):
+    position = trader.positions[code]
+    position.status.cancel_preorder = True
+    for record in position.entry_trades:
+        trader.registry.set_status(record, sj.order.Status.Cancelled)
+    return position
+
+
+def test_standby_takeover_after_re_entry(primary: SJTrader, standby: StandbyTrader):
+    trader = standby.trader
+    primary.run_at(PAST, primary.set_on_tick_handler, primary.intraday_handler)
+    position = cancel_preorder(primary, "1605")
+    # first real tick below the stop re-enter the short on the primary
+    primary.intraday_handler(
+        Exchange.TSE, TickSTKv1("1605", "2022-05-25 09:00:01", Decimal("41"), False)
+    )
+    assert primary.api.place_order.call_count == 3
+    primary.order_handler(order_msg("1605", Action.Sell, 1), position)
+    primary.deal_handler(deal_msg("1605", Action.Sell, 1), position)
+    assert position.status.open_quantity == -1
+    primary.heartbeat()
+    sync(primary, standby)
+    assert trader.open_price["1605"] == 41
+    standby.now[0] = 3.0
+    assert standby.check()
+    trader.intraday_handler(
+        Exchange.TSE, TickSTKv1("1605", "2022-05-25 09:00:05", Decimal("41"), False)
+    )
+    # no second re-entry, below the 42.9 stop nothing to cover either
+    trader.api.place_order.assert_not_called()
+
+
+def test_standby_seed_open_price(primary: SJTrader, standby: StandbyTrader):
+    trader = standby.trader
+    cancel_preorder(primary, "6290")
+    primary.heartbeat()
+    sync(primary, standby)
+    assert "6290" not in trader.open_price
+    # the re-entry reached the broker but not the standby
+    working = sj.order.Trade(
+        trader.positions["6290"].contract,
+        sj.order.StockOrder(
+            action=Action.Sell,
+            price=0,
+            quantity=3,
+            price_type=StockPriceType.MKT,
+            order_type=OrderType.ROD,
+            id="d31c987e",
+            custom_field="dt1",
+        ),
+        sj.order.OrderStatus(status=sj.order.Status.Submitted),
+    )
+    trader.api.list_trades.return_value = [working]
+    standby.now[0] = 3.0
+    assert standby.check()
+    assert "6290" in trader.open_price
+    assert "1605" not in trader.open_price
+    trader.re_entry_order(
+        trader.positions["6290"],
+        TickSTKv1("6290", "2022-05-25 09:00:05", Decimal("52"), False),
+    )
+    trader.api.place_order.assert_not_called()
+
+
+def test_standby_recover_part_filled(primary: SJTrader, standby: StandbyTrader):
+    trader = standby.trader
+    position = primary.positions["6290"]
+    primary.order_handler(order_msg("6290", Action.Sell, 3), position)
+    primary.deal_handler(deal_msg("6290", Action.Sell, 2), position)
+    primary.heartbeat()
+    sync(primary, standby)
+    assert trader.positions["6290"].status.open_quantity == -2
+    working = sj.order.Trade(
+        trader.positions["6290"].contract,
+        sj.order.StockOrder(
+            action=Action.Sell,
+            price=60.15,
+            quantity=3,
+            price_type=StockPriceType.LMT,
+            order_type=OrderType.ROD,
+            id="d31c987e",
+            seqno="429833",
+            custom_field="dt1",
+        ),
+        sj.order.OrderStatus(status=sj.order.Status.PartFilled, deal_quantity=2),
+    )
+    trader.api.list_trades.return_value = [working]
+    standby.now[0] = 3.0
+    assert standby.check()
+    (record,) = trader.registry.working_records()
+    assert record.filled == 2 and record.remaining == 1
+    assert trader.risk_gate.open_orders == 1
+    msg = dict(deal_msg("6290", Action.Sell, 1), trade_id="d31c987e", seqno="429833")
+    trader.order_deal_handler(sj.constant.OrderState.StockDeal, msg)
+    mirrored = trader.positions["6290"]
+    assert record.status == sj.order.Status.Filled and record.remaining == 0
+    assert mirrored.status.working_orders == 0
+    assert mirrored.status.open_quantity == -3
+    assert trader.risk_gate.open_orders == 0
+
+
+def test_standby_takeover_sync_open_quantity(primary: SJTrader, standby: StandbyTrader):
+    trader = standby.trader
+    position = primary.positions["6290"]
+    primary.order_handler(order_msg("6290", Action.Sell, 3), position)
+    primary.deal_handler(deal_msg("6290", Action.Sell, 2), position)
+    primary.heartbeat()
+    sync(primary, standby)
+    # the deal of the last lot was dropped by the bus
+    primary.deal_handler(deal_msg("6290", Action.Sell, 1), position)
+    assert trader.positions["6290"].status.open_quantity == -2
+    trader.api.list_positions.side_effect = None
+    trader.api.list_positions.return_value = [StockPosition("6290", Action.Sell, 3)]
+    standby.now[0] = 3.0
+    assert standby.check()
+    assert trader.positions["6290"].status.open_quantity == -3
+    assert trader.positions["1605"].status.open_quantity == 0
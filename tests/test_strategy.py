@@ -1,6 +1,6 @@
 import pytest
 
-from sjtrade.strategy import StrategyBase
+from sjtrade.strategy import StrategyBase, StrategyBasic, largest_notional_first
 
 
 def test_stratage_base():
@@ -15,4 +15,38 @@ def test_stratage_base():
         stratage.cover_positions(None)
 
 
-    
\ No newline at end of file
+def test_strategy_basic_iter_entry_positions(api):
+    rows = []
+
+    def read_position_func(filepath):
+        for row in (("1605", -1), ("0000", 3), ("6290", -3)):
+            rows.append(row)
+            yield row
+
+    strategy = StrategyBasic(contracts=api.Contracts)
+    strategy.read_position_func = read_position_func
+    plans = strategy.iter_entry_positions()
+    # the first plan is ready before the rest of the file is read
+    assert next(plans)["code"] == "1605"
+    assert rows == [("1605", -1)]
+    assert [plan["code"] for plan in plans] == ["6290"]
+
+    strategy.entry_priority = largest_notional_first
+    assert [plan["code"] for plan in strategy.entry_positions()] == ["6290", "1605"]
+
+
+def test_strategy_basic_duplicate_rows(api, tmp_path, logger_stratagy):
+    p = tmp_path / "position.txt"
+    p.write_text("1605\t-1\n6290\t-3\n1605\t-2\n")
+    strategy = StrategyBasic(position_filepath=str(p), contracts=api.Contracts)
+    plans = strategy.entry_positions()
+    assert [(plan["code"], plan["pos"]) for plan in plans] == [
+        ("1605", -1),
+        ("6290", -3),
+    ]
+    logger_stratagy.warning.assert_called_once()
+    strategy.entry_priority = largest_notional_first
+    assert [(plan["code"], plan["pos"]) for plan in strategy.entry_positions()] == [
+        ("6290", -3),
+        ("1605", -1),
+    ]
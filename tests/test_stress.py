@@ -0,0 +1,84 @@
+import datetime
+import shioaji as sj
+
+from sjtrade.position import Position, PositionCond, PriceSet
+from sjtrade.stress import (
+    EventLoop,
+    StressHarness,
+    percentiles,
+    position_violations,
+    run_stress,
+)
+from shioaji.constant import StockPriceType
+
+
+def test_event_loop():
+    loop = EventLoop()
+    calls = []
+    loop.call_at(2, calls.append, "b")
+    loop.call_at(1, calls.append, "a")
+    future = loop.call_at(5, calls.append, "c")
+    loop.run_until(3)
+    assert calls == ["a", "b"]
+    assert loop.now == 3
+    future.result()
+    assert calls == ["a", "b", "c"]
+    loop.run_until(10)
+    assert calls == ["a", "b", "c"]
+
+
+def test_percentiles():
+    assert percentiles([]) == {}
+    res = percentiles([i / 1e6 for i in range(1, 101)])
+    assert res["p50"] == 51
+    assert res["max"] == 100
+
+
+def test_position_violations(api: sj.Shioaji):
+    position = Position(
+        contract=api.Contracts.Stocks["1605"],
+        cond=PositionCond(
+            quantity=-2,
+            entry_price=[],
+            stop_loss_price=[
+                PriceSet(
+                    price=42.7,
+                    quantity=-2,
+                    price_type=StockPriceType.MKT,
+                    in_transit_quantity=-3,
+                )
+            ],
+            stop_profit_price=[],
+        ),
+    )
+    position.status.entry_quantity = -2
+    position.status.cover_quantity = 3
+    position.status.open_quantity = 1
+    assert len(position_violations(position)) == 3
+
+
+def test_run_stress():
+    kwargs = dict(num_positions=30, tick_rate=0.01, limit_prob=0.01, seed=7)
+    report = run_stress(**kwargs)
+    assert report.ticks > 0
+    assert report.orders >= 30
+    assert report.deals > 0
+    assert report.violations == []
+    assert report.open_positions == 0
+    assert set(report.latency_us) == {"p50", "p90", "p99", "max"}
+    again = run_stress(**kwargs)
+    assert (again.ticks, again.orders, again.deals) == (
+        report.ticks,
+        report.orders,
+        report.deals,
+    )
+
+
+def test_stress_harness_phase(mocker):
+    harness = StressHarness(
+        num_positions=5, tick_rate=0.01, end_time=datetime.time(9, 30)
+    )
+    report = harness.run()
+    assert harness.api.quote.on_tick == harness.trader.intraday_handler
+    assert len(harness.trader.positions) == 5
+    assert report.violations == []
@@ -0,0 +1,56 @@
+from sjtrade.timer import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_timer_wheel_fire_in_order():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=0.1, slots=8, clock=clock, autostart=False)
+    fired = []
+    wheel.schedule(0.3, fired.append, "b")
+    wheel.schedule(0.1, fired.append, "a")
+    assert len(wheel) == 2
+    clock.now = 0.25
+    assert wheel.advance() == 1
+    assert fired == ["a"]
+    clock.now = 0.35
+    assert wheel.advance() == 1
+    assert fired == ["a", "b"]
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_rounds():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=0.1, slots=4, clock=clock, autostart=False)
+    fired = []
+    wheel.schedule(1.0, fired.append, 1)
+    assert wheel.advance(0.95) == 0
+    assert fired == []
+    assert wheel.advance(1.05) == 1
+    assert fired == [1]
+
+
+def test_timer_wheel_cancel():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=0.1, slots=8, clock=clock, autostart=False)
+    fired = []
+    timer = wheel.schedule(0.2, fired.append, 1)
+    assert wheel.cancel(timer)
+    assert not wheel.cancel(timer)
+    assert wheel.advance(1.0) == 0
+    assert fired == []
+
+
+def test_timer_wheel_callback_error_not_stop():
+    wheel = TimerWheel(resolution=0.1, slots=8, clock=FakeClock(), autostart=False)
+    fired = []
+    wheel.schedule(0.1, lambda: 1 / 0)
+    wheel.schedule(0.1, fired.append, 1)
+    assert wheel.advance(0.15) == 2
+    assert fired == [1]
@@ -6,8 +6,19 @@ from pytest_mock import MockFixture, MockerFixture
 import shioaji as sj
 
 from decimal import Decimal
+from typing import List
 from dataclasses import dataclass
-from sjtrade.position import PriceSet
+from sjtrade.position import PositionState, PriceSet
+from sjtrade.risk import RiskGate, RiskLimit
+from sjtrade.execution import CoverMode, PegConfig
+from sjtrade.shared import PRICE_TYPE_MKT, IntentConsumer, IntentQueue
+from sjtrade.slicing import OrderSlicer, SliceConfig, SliceMode
+from sjtrade.session import Phase, SessionPlan
+from sjtrade.dispatch import OrderDispatcher
+from sjtrade.batch import OrderIntents
+from sjtrade.contracts import ContractCache, ContractRef, ContractTable
+from sjtrade.events import EventBus, EventKind, EventSubscriber
+from sjtrade.timer import TimerWheel
 from sjtrade.trader import (
     Position,
     PositionCond,
@@ -20,6 +31,7 @@ from shioaji.constant import (
     StockPriceType,
     OrderType,
     QuoteVersion,
+    QuoteType,
     Exchange,
     OrderState,
     StockOrderLot,
@@ -34,6 +46,18 @@ class TickSTKv1:
     datetime: datetime.datetime
     close: Decimal
     simtrade: bool
+    volume: int = 1
+
+
+@dataclass
+class BidAskSTKv1:
+    code: str
+    datetime: datetime.datetime
+    bid_price: List[Decimal]
+    bid_volume: List[int]
+    ask_price: List[Decimal]
+    ask_volume: List[int]
+    simtrade: bool = False
 
 
 @pytest.fixture
@@ -98,7 +122,9 @@ def test_sjtrader(api: sj.Shioaji):
 
 def test_sjtrader_start(sjtrader: SJTrader, mocker: MockerFixture):
     sleep_until_mock = mocker.patch("sjtrade.trader.sleep_until")
+    sjtrader.sleep = mocker.MagicMock()
     sjtrader.start()
+    sjtrader.executor.shutdown(wait=True)
     sjtrader.stratagy.read_position_func.assert_called_once()
     sjtrader.api.set_order_callback.assert_called_once_with(sjtrader.order_deal_handler)
     sjtrader.api.quote.set_on_tick_stk_v1_callback.assert_has_calls(
@@ -201,22 +227,26 @@ def test_sjtrader_place_entry_order(
         "1605": Position(
             contract=sjtrader.api.Contracts.Stocks["1605"],
             cond=cond_1605,
-            entry_trades=[
-                expected[0],
-            ],
+            entry_trades=sjtrader.positions["1605"].entry_trades,
             lock=sjtrader.positions["1605"].lock
             # cover_trades=[],
         ),
         "6290": Position(
             contract=sjtrader.api.Contracts.Stocks["6290"],
             cond=cond_6290,
-            entry_trades=[
-                expected[1],
-            ],
+            entry_trades=sjtrader.positions["6290"].entry_trades,
             lock=sjtrader.positions["6290"].lock
             # cover_trades=[],
         ),
     }
+    for code, trade in zip(("1605", "6290"), expected):
+        (record,) = sjtrader.positions[code].entry_trades
+        assert record.trade == trade
+        assert (record.action, record.price, record.quantity) == (
+            Action.Sell,
+            trade.order.price,
+            trade.order.quantity,
+        )
     assert len(res) == 2
     assert res == sjtrader.positions
 
@@ -236,7 +266,7 @@ def test_sjtrader_cancel_preorder_handler(
 
     sjtrader_entryed.cancel_preorder_handler(Exchange.TSE, tick)
     sjtrader_entryed.api.cancel_order.assert_called_once_with(
-        sjtrader_entryed.positions["1605"].entry_trades[0]#, timeout=0
+        sjtrader_entryed.positions["1605"].entry_trades[0].trade  # , timeout=0
     )
     assert logger.info.called
     # TODO need single trade update status interface
@@ -324,7 +354,7 @@ def test_sjtrader_place_cover_order(
     order_msg = gen_sample_order_msg("1605", Action.Buy, 1, op_type="New", op_code="00")
     sjtrader_entryed.order_handler(order_msg, position)
     assert position.status.cover_order_quantity == 1
-    position.cover_trades[0].order.price == 43.3
+    assert position.cover_trades[0].price == 43.3
     # TODO assert called once with
     # sjtrader_entryed.api.place_order.assert_has_calls([
     #     ((), dict(contract=position.contract, order=sj.order.StockOrder(
@@ -682,3 +712,711 @@ def test_sjtrader_sim_re_entry_order(
     assert logger.info.called
     time.sleep(0.65)
     assert sjtrader_entryed_sim.positions["1605"].status.entry_order_quantity == -1
+
+
+def test_sjtrader_place_entry_order_risk_reject(
+    sjtrader: SJTrader, logger: loguru._logger.Logger
+):
+    sjtrader.risk_gate = RiskGate(RiskLimit(max_notional_per_code=40000))
+    sjtrader.api.place_order.side_effect = lambda contract, order, timeout: (
+        sj.order.Trade(
+            contract,
+            order,
+            sj.order.OrderStatus(status=sj.order.Status.PreSubmitted),
+        )
+    )
+    sjtrader.place_entry_positions()
+    assert sjtrader.api.place_order.call_count == 1
+    assert len(sjtrader.positions["1605"].entry_trades) == 1
+    assert sjtrader.positions["6290"].entry_trades == []
+    assert sjtrader.positions["6290"].cond.entry_price[0].in_transit_quantity == 0
+
+
+def test_sjtrader_order_failed_release_risk(sjtrader: SJTrader):
+    sjtrader.risk_gate = RiskGate(RiskLimit(max_open_orders=2))
+    sjtrader.api.place_order.side_effect = lambda contract, order, timeout: (
+        sj.order.Trade(
+            contract,
+            order,
+            sj.order.OrderStatus(status=sj.order.Status.PreSubmitted),
+        )
+    )
+    sjtrader.place_entry_positions()
+    assert sjtrader.risk_gate.open_orders == 2
+    position = sjtrader.positions["1605"]
+    sjtrader.order_handler(
+        gen_sample_order_msg("1605", Action.Sell, 1, op_type="New", op_code="88"),
+        position,
+    )
+    assert position.entry_trades[0].status == sj.order.Status.Failed
+    assert position.status.working_orders == 0
+    assert sjtrader.risk_gate.open_orders == 1
+    assert sjtrader.risk_gate.notional["1605"] == pytest.approx(0)
+
+
+def test_sjtrader_update_snapshot(sjtrader_entryed: SJTrader):
+    sjtrader_entryed.update_snapshot(
+        Exchange.TSE, TickSTKv1("1605", "2022-05-25 09:00:01", Decimal("40"), False, 2)
+    )
+    sjtrader_entryed.update_bidask(
+        Exchange.TSE,
+        BidAskSTKv1(
+            "1605",
+            "2022-05-25 09:00:01",
+            [Decimal("39.95")],
+            [5],
+            [Decimal("40.05")],
+            [3],
+        ),
+    )
+    snapshot = sjtrader_entryed.snapshots["1605"]
+    assert snapshot.price == 40
+    assert snapshot.volume == 2
+    assert snapshot.bid == 39.95
+    assert snapshot.ask == 40.05
+
+
+def test_sjtrader_subscribe_bidask(sjtrader: SJTrader):
+    sjtrader.subscribe_bidask = True
+    sjtrader.place_entry_positions()
+    sjtrader.api.quote.subscribe.assert_any_call(
+        sjtrader.api.Contracts.Stocks["1605"],
+        quote_type=QuoteType.BidAsk,
+        version=QuoteVersion.v1,
+    )
+
+
+def test_sjtrader_place_cover_order_peg(
+    sjtrader_entryed: SJTrader, mocker: MockerFixture, logger: loguru._logger.Logger
+):
+    monotonic = mocker.patch("sjtrade.trader.time.monotonic", return_value=100.0)
+    sjtrader_entryed.cover_mode = CoverMode.Peg
+    sjtrader_entryed.peg_config = PegConfig(ticks=2, timeout=3, max_reprice=1)
+    position = sjtrader_entryed.positions["1605"]
+    position.status.open_quantity = -1
+    snapshot = sjtrader_entryed.snapshots["1605"]
+    snapshot.update_bidask(
+        BidAskSTKv1("1605", "", [Decimal("39.95")], [5], [Decimal("40.05")], [3])
+    )
+    sjtrader_entryed.place_cover_order(position, position.cond.stop_loss_price)
+    record = position.cover_trades[0]
+    assert record.price_type == StockPriceType.LMT
+    assert record.price == 40.15
+    assert record.action == Action.Buy
+    trade = record.trade
+    assert len(sjtrader_entryed.peg_orders["1605"]) == 1
+
+    bidask = BidAskSTKv1("1605", "", [Decimal("40.05")], [5], [Decimal("40.1")], [3])
+    sjtrader_entryed.update_bidask(Exchange.TSE, bidask)
+    sjtrader_entryed.api.update_order.assert_not_called()
+    monotonic.return_value = 103.5
+    sjtrader_entryed.update_bidask(Exchange.TSE, bidask)
+    sjtrader_entryed.api.update_order.assert_called_once_with(
+        trade, price=40.2, timeout=0
+    )
+    monotonic.return_value = 107.0
+    sjtrader_entryed.update_bidask(Exchange.TSE, bidask)
+    sjtrader_entryed.api.cancel_order.assert_called_once_with(trade, timeout=0)
+
+    order_msg = gen_sample_order_msg(
+        "1605", Action.Buy, 1, op_type="Cancel", op_code="00"
+    )
+    sjtrader_entryed.order_handler(order_msg, position)
+    # the cancelled peg no longer hold its trade, the escalation is a new record
+    assert record.trade is None
+    assert record.status == sj.order.Status.Cancelled
+    mkt_record = position.cover_trades[-1]
+    assert mkt_record.price_type == StockPriceType.MKT
+    assert mkt_record.quantity == 1
+    assert "1605" not in sjtrader_entryed.peg_orders
+
+
+def test_sjtrader_place_cover_order_peg_without_quote(sjtrader_entryed: SJTrader):
+    sjtrader_entryed.cover_mode = CoverMode.Peg
+    position = sjtrader_entryed.positions["1605"]
+    position.status.open_quantity = -1
+    sjtrader_entryed.place_cover_order(position, position.cond.stop_loss_price)
+    assert position.cover_trades[0].price_type == StockPriceType.MKT
+    assert sjtrader_entryed.peg_orders == {}
+
+
+def test_sjtrader_open_position_cover_cancel_working(
+    sjtrader_entryed: SJTrader, logger: loguru._logger.Logger, mocker: MockerFixture
+):
+    sjtrader_entryed.sleep = mocker.MagicMock()
+    position = sjtrader_entryed.positions["1605"]
+    order_msg = gen_sample_order_msg(
+        "1605", Action.Sell, 1, op_type="New", op_code="00"
+    )
+    sjtrader_entryed.order_handler(order_msg, position)
+    deal_msg = gen_sample_deal_msg("1605", Action.Sell, 1)
+    deal_msg["trade_id"] = "c21b876d"
+    sjtrader_entryed.deal_handler(deal_msg, position)
+    record = sjtrader_entryed.registry.by_id["c21b876d"]
+    assert record.status == sj.order.Status.Filled
+    sjtrader_entryed.open_position_cover()
+    assert not sjtrader_entryed.stop_enabled
+    sjtrader_entryed.api.cancel_order.assert_called_once_with(
+        sjtrader_entryed.positions["6290"].entry_trades[0].trade, timeout=0
+    )
+
+
+def test_sjtrader_share_market_state_and_place_intent(sjtrader_entryed: SJTrader):
+    state = sjtrader_entryed.share_market_state()
+    assert state.codes == ["1605", "6290"]
+    sjtrader_entryed.update_snapshot(
+        Exchange.TSE, TickSTKv1("6290", "2022-05-25 09:00:01", Decimal("60"), False)
+    )
+    assert state.read_snapshot(1).price == 60
+    position = sjtrader_entryed.positions["6290"]
+    position.status.open_quantity = -3
+    sjtrader_entryed.place_intent("6290", 2, 0, PRICE_TYPE_MKT)
+    sjtrader_entryed.place_intent("6290", 2, 0, PRICE_TYPE_MKT)
+    sjtrader_entryed.place_intent("6290", 2, 0, PRICE_TYPE_MKT)
+    assert [r.quantity for r in position.cover_trades] == [2, 1]
+    assert position.cover_trades[0].action == Action.Buy
+    assert position.cover_trades[0].price_type == StockPriceType.MKT
+
+
+def test_sjtrader_intent_consumer(sjtrader_entryed: SJTrader):
+    state = sjtrader_entryed.share_market_state()
+    queue = IntentQueue()
+    consumer = IntentConsumer(sjtrader_entryed.place_intent, state, [queue])
+    position = sjtrader_entryed.positions["6290"]
+    position.status.open_quantity = -3
+    queue.push(1, -1, 0, PRICE_TYPE_MKT)
+    queue.push(1, 1, 0, PRICE_TYPE_MKT)
+    assert consumer.poll() == 2
+    # the sell would add to the short, only the buy cover is sent
+    assert [(r.action, r.quantity) for r in position.cover_trades] == [
+        (Action.Buy, 1)
+    ]
+
+
+def test_sjtrader_place_intent_same_direction(sjtrader_entryed: SJTrader):
+    position = sjtrader_entryed.positions["6290"]
+    position.status.open_quantity = -3
+    # a sell on a short add to the position, intents only cover
+    sjtrader_entryed.place_intent("6290", -2, 0, PRICE_TYPE_MKT)
+    assert position.cover_trades == []
+    assert position.cond.cover_price == []
+    sjtrader_entryed.place_intent("6290", 2, 0, PRICE_TYPE_MKT)
+    assert [(r.action, r.quantity) for r in position.cover_trades] == [
+        (Action.Buy, 2)
+    ]
+
+
+def test_sjtrader_place_cover_order_twap(sjtrader_entryed: SJTrader):
+    now = [0.0]
+    wheel = TimerWheel(resolution=1.0, clock=lambda: now[0], autostart=False)
+    sjtrader_entryed.slicer = OrderSlicer(wheel)
+    sjtrader_entryed.cover_slicing = SliceConfig(
+        mode=SliceMode.TWAP, window=3.0, interval=1.0
+    )
+    position = sjtrader_entryed.positions["6290"]
+    position.status.open_quantity = -3
+    price_set = PriceSet(price=0, quantity=3, price_type=StockPriceType.MKT)
+    sjtrader_entryed.place_cover_order(position, [price_set])
+    assert [r.quantity for r in position.cover_trades] == [1]
+    assert price_set.in_transit_quantity == 3
+    wheel.advance(1.0)
+    assert [r.quantity for r in position.cover_trades] == [1, 1]
+    # first slice dealt, the rest fill the parent before the last slice goes out
+    position.status.open_quantity, position.status.cover_quantity = -2, 1
+    sjtrader_entryed.deal_handler(gen_sample_deal_msg("6290", Action.Buy, 2), position)
+    assert position.status.open_quantity == 0
+    assert price_set.in_transit_quantity == 2
+    wheel.advance(5.0)
+    assert len(position.cover_trades) == 2
+
+
+def test_sjtrader_cancel_preorder_handler_batch(sjtrader_entryed: SJTrader):
+    now = [0.0]
+    sjtrader_entryed.timer_wheel = TimerWheel(
+        resolution=0.1, clock=lambda: now[0], autostart=False
+    )
+    sjtrader_entryed.preopen_batch_delay = 0.1
+    monitor = sjtrader_entryed.preopen_monitor
+    assert "1605" in monitor and "6290" in monitor
+    assert len(monitor) == 2
+    # unknown code and normal trial price are ignored
+    sjtrader_entryed.cancel_preorder_handler(
+        Exchange.TSE, TickSTKv1("2330", "2022-05-25 08:55:01", Decimal("500"), True)
+    )
+    sjtrader_entryed.cancel_preorder_handler(
+        Exchange.TSE, TickSTKv1("1605", "2022-05-25 08:55:01", Decimal("40"), True)
+    )
+    for code in ("1605", "6290", "1605"):
+        contract = sjtrader_entryed.api.Contracts.Stocks[code]
+        sjtrader_entryed.cancel_preorder_handler(
+            Exchange.TSE,
+            TickSTKv1(
+                code, "2022-05-25 08:55:02", Decimal(str(contract.limit_up)), True
+            ),
+        )
+    sjtrader_entryed.api.cancel_order.assert_not_called()
+    sjtrader_entryed.api.update_status.reset_mock()
+    sjtrader_entryed.timer_wheel.advance(0.1)
+    assert sjtrader_entryed.api.cancel_order.call_count == 2
+    sjtrader_entryed.api.update_status.assert_called_once_with()
+    assert sjtrader_entryed.positions["1605"].status.cancel_preorder
+    assert sjtrader_entryed.positions["6290"].status.cancel_preorder
+    assert len(monitor) == 0
+
+
+def test_sjtrader_cancel_preorder_retry(sjtrader_entryed: SJTrader):
+    monitor = sjtrader_entryed.preopen_monitor
+    api = sjtrader_entryed.api
+    api.cancel_order.side_effect = [TimeoutError("cancel timeout"), None]
+    contract = api.Contracts.Stocks["1605"]
+    tick = TickSTKv1(
+        "1605", "2022-05-25 08:55:02", Decimal(str(contract.limit_up)), True
+    )
+    sjtrader_entryed.cancel_preorder_handler(Exchange.TSE, tick)
+    assert api.cancel_order.call_count == 1
+    # the failed cancel put 1605 back on watch
+    assert "1605" in monitor
+    sjtrader_entryed.cancel_preorder_handler(Exchange.TSE, tick)
+    assert api.cancel_order.call_count == 2
+    assert "1605" not in monitor
+    sjtrader_entryed.cancel_preorder_handler(Exchange.TSE, tick)
+    assert api.cancel_order.call_count == 2
+
+
+def test_sjtrader_export_blotter(
+    sjtrader_entryed: SJTrader, order_msg: dict, tmp_path
+):
+    sjtrader_entryed.order_handler(order_msg, sjtrader_entryed.positions["1605"])
+    deal_msg = gen_sample_deal_msg("1605", Action.Sell, 1)
+    sjtrader_entryed.deal_handler(deal_msg, sjtrader_entryed.positions["1605"])
+    blotter = sjtrader_entryed.blotter
+    assert blotter.columns["kind"] == ["order", "deal"]
+    assert blotter.columns["role"][0] == "Entry"
+    assert blotter.columns["latency"][0] >= 0
+    assert sjtrader_entryed.export_blotter() is None
+    sjtrader_entryed.blotter_path = str(tmp_path / "{date}.csv")
+    assert sjtrader_entryed.phase_plan()[-1][1] == sjtrader_entryed.export_blotter
+    p = sjtrader_entryed.export_blotter()
+    assert p.name == f"{blotter.date}.csv"
+    assert len(p.read_text().splitlines()) == 3
+
+
+@pytest.mark.freeze_time("2022-05-24 12:00:00 UTC")
+def test_sjtrader_blotter_evening_start(sjtrader: SJTrader, mocker: MockerFixture):
+    # started at 20:00 Taipei time for the next morning session
+    sjtrader.executor = mocker.MagicMock()
+    row = ("c21b876d", "", "1605", Action.Sell, "Entry", "LMT", 41.35, 1, 0, 0, 0)
+    sjtrader.blotter.append("order", "New", *row)
+    sjtrader.start()
+    assert sjtrader.trading_day() == datetime.date(2022, 5, 25)
+    assert sjtrader.blotter.date == "2022-05-25"
+    assert sjtrader.blotter.columns["date"] == ["2022-05-25"]
+
+
+def test_sjtrader_position_state(sjtrader_entryed: SJTrader, mocker: MockerFixture):
+    position = sjtrader_entryed.positions["6290"]
+    assert position.status.state == PositionState.PendingEntry
+    assert position.status.working_orders == 1
+    sjtrader_entryed.order_handler(
+        gen_sample_order_msg("6290", Action.Sell, 3, op_type="New", op_code="00"),
+        position,
+    )
+    assert position.status.state == PositionState.PendingEntry
+    deal_msg = gen_sample_deal_msg("6290", Action.Sell, 1)
+    deal_msg["trade_id"] = "c21b876d"
+    sjtrader_entryed.deal_handler(deal_msg, position)
+    assert position.status.state == PositionState.Partial
+    assert position.status.cover_remaining == -1
+    deal_msg["quantity"] = 2
+    sjtrader_entryed.deal_handler(deal_msg, position)
+    assert position.status.state == PositionState.Open
+    assert position.status.working_orders == 0
+    sjtrader_entryed.order_handler(
+        gen_sample_order_msg("6290", Action.Buy, 3, op_type="New", op_code="00"),
+        position,
+    )
+    assert position.status.state == PositionState.Covering
+    assert position.status.cover_remaining == 0
+    sjtrader_entryed.deal_handler(gen_sample_deal_msg("6290", Action.Buy, 3), position)
+    assert position.status.state == PositionState.Flat
+    assert position.status.done
+
+    # flat positions skip the stop checks
+    sjtrader_entryed.stop_loss = mocker.MagicMock()
+    tick = TickSTKv1("6290", "2022-05-25 09:01:00", Decimal("63.0"), False)
+    sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    sjtrader_entryed.stop_loss.assert_not_called()
+
+    position = sjtrader_entryed.positions["1605"]
+    for op_type in ("New", "Cancel"):
+        order_msg = gen_sample_order_msg(
+            "1605", Action.Sell, 1, op_type=op_type, op_code="00"
+        )
+        order_msg["order"]["id"] = order_msg["order"]["seqno"] = "d32c987e"
+        sjtrader_entryed.order_handler(order_msg, position)
+    assert position.status.state == PositionState.Cancelled
+
+
+def test_sjtrader_retire_flat_position(
+    sjtrader_entryed: SJTrader, mocker: MockerFixture
+):
+    sjtrader_entryed.unsubscribe_flat = True
+    sjtrader_entryed.watch_codes = {"1605"}
+    sjtrader_entryed.stop_loss = mocker.MagicMock()
+    for code in ("1605", "6290"):
+        status = sjtrader_entryed.positions[code].status
+        status.working_orders = 0
+        status.entry_order_quantity = status.entry_quantity = -1
+        status.cover_order_quantity = status.cover_quantity = 1
+        assert status.state == PositionState.Flat
+    tick = TickSTKv1("6290", "2022-05-25 09:01:00", Decimal("57.3"), False)
+    sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    assert sjtrader_entryed.retired_codes == {"6290"}
+    sjtrader_entryed.api.quote.unsubscribe.assert_called_once_with(
+        sjtrader_entryed.positions["6290"].contract, version=QuoteVersion.v1
+    )
+    sjtrader_entryed.update_snapshot = mocker.MagicMock()
+    sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    sjtrader_entryed.update_snapshot.assert_not_called()
+
+    # watched codes keep their snapshot but stay out of the trading path
+    tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal("40.0"), False)
+    sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    assert sjtrader_entryed.retired_codes == {"1605", "6290"}
+    assert sjtrader_entryed.api.quote.unsubscribe.call_count == 1
+    assert sjtrader_entryed.update_snapshot.call_count == 2
+    sjtrader_entryed.stop_loss.assert_not_called()
+
+
+def test_sjtrader_start_session_plan(sjtrader: SJTrader, mocker: MockerFixture):
+    sleep_until_mock = mocker.patch("sjtrade.trader.sleep_until")
+    sjtrader.session_plan = SessionPlan.default(cover_time=datetime.time(11, 55, 59))
+    day = datetime.date(2022, 6, 2)
+    sjtrader.session_plan.schedule = mocker.MagicMock(
+        return_value=SessionPlan.schedule(sjtrader.session_plan, day)
+    )
+    plan = sjtrader.phase_plan()
+    assert [func for _, func, _ in plan] == [
+        sjtrader.place_entry_positions,
+        sjtrader.set_on_tick_handler,
+        sjtrader.set_on_tick_handler,
+        sjtrader.open_position_cover,
+    ]
+    assert plan[2][2] == (sjtrader.intraday_handler,)
+    assert sjtrader.schedule[-1].at.time() == datetime.time(11, 55, 59)
+    sjtrader.sleep = mocker.MagicMock()
+    sjtrader.start()
+    sjtrader.executor.shutdown(wait=True)
+    assert [c.args[0] for c in sleep_until_mock.call_args_list] == [
+        s.at for s in sjtrader.schedule
+    ]
+
+
+def test_sjtrader_session_plan_extra_phases(
+    sjtrader: SJTrader, mocker: MockerFixture
+):
+    sjtrader.session_plan = SessionPlan.default()
+    day = datetime.date(2022, 6, 2)
+    schedule = SessionPlan.schedule(sjtrader.session_plan, day)
+    sjtrader.session_plan.schedule = mocker.MagicMock(return_value=schedule)
+    sjtrader.stale_quote_seconds = 5.0
+    sjtrader.blotter_path = "{date}.csv"
+    plan = sjtrader.phase_plan()
+    assert plan[-2:] == [
+        (schedule[2].at, sjtrader.start_quote_watchdog, ()),
+        (
+            datetime.datetime.combine(
+                day, datetime.time(13, 35), schedule[0].at.tzinfo
+            ),
+            sjtrader.export_blotter,
+            (),
+        ),
+    ]
+    # listed as a phase it is not added twice
+    sjtrader.session_plan.phases.append(
+        Phase("blotter", datetime.time(14), handler="export_blotter")
+    )
+    sjtrader.session_plan.schedule.return_value = SessionPlan.schedule(
+        sjtrader.session_plan, day
+    )
+    plan = sjtrader.phase_plan()
+    (blotter_at,) = [t for t, func, _ in plan if func == sjtrader.export_blotter]
+    assert blotter_at.time() == datetime.time(14)
+
+
+def test_sjtrader_queued_re_entry_not_retired(sjtrader_entryed: SJTrader):
+    sjtrader = sjtrader_entryed
+    sjtrader.dispatcher = OrderDispatcher(autostart=False)
+    position = sjtrader.positions["1605"]
+    # preorder cancelled at the open
+    position.status.cancel_preorder = True
+    for record in position.entry_trades:
+        sjtrader.registry.set_status(record, sj.order.Status.Cancelled)
+    assert position.status.state == PositionState.Cancelled
+    tick = TickSTKv1("1605", "2022-05-25 09:00:01", Decimal("35"), False)
+    sjtrader.intraday_handler(Exchange.TSE, tick)
+    assert sjtrader.dispatcher.depth()["Entry"] == 1
+    assert position.status.state == PositionState.PendingEntry
+    assert "1605" not in sjtrader.retired_codes
+    sjtrader.dispatcher.run_pending()
+    assert position.status.working_orders == 1
+    assert len(position.entry_trades) == 2
+
+    # dropped from the queue give the hold back
+    sjtrader.open_price.clear()
+    for record in position.entry_trades:
+        sjtrader.registry.set_status(record, sj.order.Status.Cancelled)
+    sjtrader.re_entry_order(position, tick)
+    assert position.status.working_orders == 1
+    assert sjtrader.drop_queued_entries(position) == 1
+    assert position.status.working_orders == 0
+    assert position.status.state == PositionState.Cancelled
+
+
+def test_sjtrader_place_entry_order_twice(sjtrader_entryed: SJTrader):
+    position = sjtrader_entryed.positions["1605"]
+    calls = sjtrader_entryed.api.place_order.call_count
+    sjtrader_entryed.place_entry_positions()
+    assert sjtrader_entryed.api.place_order.call_count == calls
+    assert sjtrader_entryed.positions["1605"] is position
+
+
+def test_sjtrader_dispatcher_cover_first(sjtrader: SJTrader):
+    sjtrader.api.place_order.side_effect = lambda contract, order, timeout: (
+        sj.order.Trade(
+            contract,
+            order,
+            sj.order.OrderStatus(status=sj.order.Status.PreSubmitted),
+        )
+    )
+    sjtrader.dispatcher = OrderDispatcher(autostart=False)
+    sjtrader.place_entry_positions()
+    sjtrader.api.place_order.assert_not_called()
+    entry = sjtrader.positions["6290"].cond.entry_price[0]
+    # queued entries already count as in transit
+    assert entry.in_transit_quantity == -3
+
+    position = sjtrader.positions["1605"]
+    position.status.open_quantity = -1
+    tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal("43.3"), False)
+    sjtrader.stop_loss(position, tick)
+    sjtrader.stop_loss(position, tick)
+    assert sjtrader.dispatcher.depth() == {"Cover": 1, "Cancel": 0, "Entry": 2}
+    sjtrader.dispatcher.run_pending()
+    actions = [c.kwargs["order"].action for c in sjtrader.api.place_order.call_args_list]
+    assert actions == [Action.Buy, Action.Sell, Action.Sell]
+
+
+def test_sjtrader_dispatcher_drop_queued_entries(sjtrader: SJTrader):
+    sjtrader.dispatcher = OrderDispatcher(autostart=False)
+    sjtrader.place_entry_positions()
+    assert sjtrader.drop_queued_entries(sjtrader.positions["6290"]) == 1
+    assert sjtrader.positions["6290"].cond.entry_price[0].in_transit_quantity == 0
+    assert sjtrader.positions["1605"].cond.entry_price[0].in_transit_quantity == -1
+    assert sjtrader.dispatcher.depth()["Entry"] == 1
+
+
+def test_sjtrader_stop_loss_claim_once(sjtrader_entryed: SJTrader):
+    position = sjtrader_entryed.positions["1605"]
+    position.status.open_quantity = -1
+    place_order = sjtrader_entryed.api.place_order
+    calls = place_order.call_count
+    tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal("43.3"), False)
+    price_set = position.cond.stop_loss_price[0]
+    # a second handler passed the unlocked pre-check but the claim is already taken
+    assert price_set.claim() == price_set.quantity
+    sjtrader_entryed.stop_loss(position, tick)
+    assert place_order.call_count == calls
+    price_set.release(price_set.quantity)
+    sjtrader_entryed.stop_loss(position, tick)
+    sjtrader_entryed.stop_loss(position, tick)
+    assert place_order.call_count == calls + 1
+    assert price_set.in_transit_quantity == price_set.quantity
+
+
+def test_sjtrader_on_ticks_batch(
+    api: sj.Shioaji, mocker: MockerFixture, positions: dict
+):
+    class BatchStrategy(StrategyBasic):
+        batch_window_us = 1000
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.batches = []
+
+        def on_ticks(self, batch):
+            self.batches.append(batch)
+            intents = OrderIntents()
+            for slot, price in zip(batch.slot, batch.price):
+                if price >= 43.3:
+                    intents.add(slot, 1, 0.0, PRICE_TYPE_MKT)
+            return intents
+
+    sjtrader = SJTrader(api)
+    sjtrader.stratagy = BatchStrategy(contracts=api.Contracts)
+    sjtrader.stratagy.read_position_func = mocker.MagicMock(return_value=positions)
+    sjtrader.timer_wheel = TimerWheel(autostart=False)
+    sjtrader.place_entry_positions()
+    assert sjtrader.tick_batcher.codes == ["1605", "6290"]
+    sjtrader.place_intent = mocker.MagicMock()
+    for price in ("43.0", "43.3"):
+        tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal(price), False)
+        sjtrader.intraday_handler(Exchange.TSE, tick)
+    assert sjtrader.tick_batcher.flush() == 2
+    assert list(sjtrader.stratagy.batches[0].price) == [43.0, 43.3]
+    sjtrader.place_intent.assert_called_once_with("1605", 1, 0.0, PRICE_TYPE_MKT)
+
+
+def test_sjtrader_trailing_stop(sjtrader_entryed: SJTrader, mocker: MockerFixture):
+    sjtrader_entryed.trailing_ticks = 5
+    sjtrader_entryed.stop_loss = mocker.MagicMock()
+    position = sjtrader_entryed.positions["1605"]
+    stop = position.cond.stop_loss_price[0]
+    assert stop.price == 42.9
+    for price, simtrade in (("40.0", False), ("38.0", True)):
+        tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal(price), simtrade)
+        sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    # no open quantity yet
+    assert sjtrader_entryed.trailing_stops == {}
+    position.status.open_quantity = -1
+    for price in ("40.0", "38.0", "38.5"):
+        tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal(price), False)
+        sjtrader_entryed.intraday_handler(Exchange.TSE, tick)
+    assert sjtrader_entryed.trailing_stops["1605"].mark == 38.0
+    assert stop.price == 38.25
+    assert sjtrader_entryed.stop_loss.call_count == 5
+
+
+def test_sjtrader_contract_cache(sjtrader: SJTrader, mocker: MockerFixture, tmp_path):
+    day = datetime.date(2022, 5, 20)
+    live = ContractTable.from_contracts(sjtrader.api.Contracts)
+    cached = ContractTable(live)
+    cached.add(ContractRef("1605", "TSE", 39.0, 42.9, 35.1, 1000, "Yes"))
+    sjtrader.contract_cache = ContractCache(tmp_path)
+    sjtrader.contract_cache.save(cached, day)
+    sjtrader.api.Contracts = sj.contracts.Contracts()
+    assert sjtrader.load_contract_cache(day)
+    sjtrader.stratagy = StrategyBasic(contracts=sjtrader.contract_table)
+    sjtrader.stratagy.read_position_func = mocker.MagicMock(
+        return_value={"1605": -1, "6290": -3}
+    )
+    sjtrader.place_entry_positions()
+    # entries are planned and sent from the cache before the download finish
+    assert sjtrader.positions["1605"].cond.entry_price[0].price == 40.95
+    order_contracts = [
+        call.kwargs["contract"] for call in sjtrader.api.place_order.call_args_list
+    ]
+    assert [c.code for c in order_contracts] == ["1605", "6290"]
+    assert order_contracts[0].exchange == Exchange.TSE
+
+    sjtrader.api.fetch_contracts = mocker.MagicMock()
+    mocker.patch("sjtrade.trader.ContractTable.from_contracts", return_value=live)
+    assert sjtrader.sync_contract_cache(day) == ["1605"]
+    sjtrader.api.fetch_contracts.assert_called_once_with(contract_download=True)
+    assert sjtrader.stratagy.contracts["1605"].reference == 39.4
+    assert list(sjtrader.contract_cache.load(day)) == list(live)
+
+
+def test_sjtrader_place_entry_positions_streaming(
+    sjtrader: SJTrader, mocker: MockerFixture
+):
+    events = []
+
+    def read_position_func(filepath):
+        for code, pos in (("1605", -1), ("6290", -3)):
+            events.append(("read", code))
+            yield code, pos
+
+    sjtrader.stratagy.read_position_func = read_position_func
+    def place_order(contract, order, timeout):
+        events.append(("order", contract.code))
+        return sj.order.Trade(
+            contract,
+            order,
+            sj.order.OrderStatus(status=sj.order.Status.PreSubmitted),
+        )
+
+    sjtrader.api.place_order.side_effect = place_order
+    sjtrader.api.quote.subscribe.side_effect = lambda contract, **kwargs: (
+        events.append(("subscribe", contract.code))
+    )
+    sjtrader.place_entry_positions()
+    assert events == [
+        ("read", "1605"),
+        ("order", "1605"),
+        ("subscribe", "1605"),
+        ("read", "6290"),
+        ("order", "6290"),
+        ("subscribe", "6290"),
+    ]
+
+
+def test_sjtrader_quote_watchdog(sjtrader_entryed: SJTrader, mocker: MockerFixture):
+    now = [0.0]
+    sjtrader_entryed.timer_wheel = TimerWheel(
+        resolution=1.0, clock=lambda: now[0], autostart=False
+    )
+    sjtrader_entryed.stale_quote_seconds = 5.0
+    sjtrader_entryed.stale_quote_cover = True
+    sjtrader_entryed.place_intent = mocker.MagicMock()
+    plan = sjtrader_entryed.phase_plan()
+    assert (
+        datetime.time(8, 59, 55),
+        sjtrader_entryed.start_quote_watchdog,
+        (),
+    ) in plan
+    watchdog = sjtrader_entryed.start_quote_watchdog()
+    assert len(watchdog) == 2
+    sjtrader_entryed.positions["1605"].status.open_quantity = -1
+    for t in range(1, 7):
+        now[0] = float(t)
+        tick = TickSTKv1("6290", "2022-05-25 09:00:01", Decimal("60"), False)
+        sjtrader_entryed.update_snapshot(Exchange.TSE, tick)
+        sjtrader_entryed.timer_wheel.advance()
+    # 1605 went quiet with an open position, 6290 keep ticking
+    assert set(watchdog.stale) == {"1605"}
+    contract = sjtrader_entryed.positions["1605"].contract
+    sjtrader_entryed.api.quote.unsubscribe.assert_called_once_with(
+        contract, version=QuoteVersion.v1
+    )
+    assert sjtrader_entryed.api.quote.subscribe.call_args == mocker.call(
+        contract, version=QuoteVersion.v1
+    )
+    sjtrader_entryed.place_intent.assert_called_once_with("1605", 1, 0, PRICE_TYPE_MKT)
+
+
+def test_sjtrader_event_bus(sjtrader_entryed: SJTrader, tmp_path):
+    bus = sjtrader_entryed.event_bus = EventBus(tmp_path / "bus.sock", autostart=False)
+    position = sjtrader_entryed.positions["1605"]
+    sjtrader_entryed.order_handler(
+        gen_sample_order_msg("1605", Action.Sell, 1, op_type="New", op_code="00"),
+        position,
+    )
+    deal_msg = gen_sample_deal_msg("1605", Action.Sell, 1)
+    sjtrader_entryed.deal_handler(deal_msg, position)
+    tick = TickSTKv1("1605", "2022-05-25 09:01:00", Decimal("43.0"), False)
+    sjtrader_entryed.stop_loss(position, tick)
+    kinds = [kind for kind, _, _ in bus.queue]
+    assert kinds == ["Order", "Status", "Deal", "Status", "Decision"]
+    _, _, deal = bus.queue[2]
+    assert deal["code"] == "1605" and deal["msg"] is deal_msg
+    _, _, status = bus.queue[3]
+    assert status["status"]["open_quantity"] == -1
+    assert status["status"]["state"] == PositionState.Open
+    _, _, decision = bus.queue[4]
+    assert decision == {
+        "code": "1605",
+        "reason": "stop_loss",
+        "price": Decimal("43.0"),
+        "trigger": 42.9,
+        "quantity": -1,
+    }
+    subscriber = EventSubscriber(tmp_path / "bus.sock", tmp_path / "sub.sock")
+    assert bus.flush() == 5
+    assert [subscriber.recv(1)["kind"] for _ in kinds] == kinds
+    bus.publish(EventKind.Phase, handler="open_position_cover", args=[])
+    bus.flush()
+    assert subscriber.recv(1)["handler"] == "open_position_cover"
+    subscriber.close()
+    bus.close()
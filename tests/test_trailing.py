@@ -0,0 +1,36 @@
+from shioaji.constant import StockPriceType
+
+from sjtrade.position import PriceSet
+from sjtrade.trailing import TrailingStop
+
+
+def test_trailing_stop_long():
+    price_set = PriceSet(price=35.85, quantity=1, price_type=StockPriceType.MKT)
+    trailing = TrailingStop(price_set, True, 3, 39.4, 60.0, 35.5)
+    assert trailing.update(39.4)
+    assert price_set.price == 39.25
+    # inside the current tick nothing is recomputed
+    assert trailing.next_mark == 39.45
+    assert not trailing.update(39.3)
+    assert not trailing.update(39.4)
+    assert trailing.update(40.0)
+    assert (trailing.mark, price_set.price) == (40.0, 39.85)
+    # pull back never loosen the stop
+    assert not trailing.update(39.9)
+    assert price_set.price == 39.85
+    # cross the 50 tick boundary, 0.1 ticks above and 0.05 below
+    assert trailing.update(50.2)
+    assert price_set.price == 49.95
+
+
+def test_trailing_stop_short_clamp_and_in_transit():
+    price_set = PriceSet(price=42.95, quantity=-1, price_type=StockPriceType.MKT)
+    trailing = TrailingStop(price_set, False, 2, 39.4, 43.3, 35.5)
+    assert trailing.update(39.4)
+    assert price_set.price == 39.5
+    assert not trailing.update(39.45)
+    assert trailing.update(35.5)
+    assert price_set.price == 35.6
+    price_set.in_transit_quantity = -1
+    assert not trailing.update(35.5)
+    assert price_set.price == 35.6
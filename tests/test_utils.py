@@ -10,6 +10,7 @@ from sjtrade.utils import (
     price_round,
     quantity_num_split,
     quantity_split,
+    session_date,
     sleep_until,
 )
 
@@ -127,6 +128,28 @@ def test_sleep_until(mocker: MockerFixture):
     sleep_mock.assert_called_once_with(30 * 60 + 1)
 
 
+@pytest.mark.freeze_time("2022-06-06 12:00:00 UTC")
+def test_sleep_until_next_day(mocker: MockerFixture):
+    # 20:00 in Taipei, the session is tomorrow morning
+    sleep_mock = mocker.patch("time.sleep")
+    sleep_until((9, 0, 1))
+    sleep_mock.assert_called_once_with(13 * 3600 + 1)
+    assert session_date() == datetime.date(2022, 6, 7)
+    assert session_date(datetime.datetime(2022, 6, 6, 13, 59)) == datetime.date(
+        2022, 6, 6
+    )
+
+
+@pytest.mark.freeze_time("2022-06-06 00:30:00 UTC")
+def test_sleep_until_datetime(mocker: MockerFixture):
+    sleep_mock = mocker.patch("time.sleep")
+    tz = datetime.timezone(datetime.timedelta(hours=8))
+    sleep_until(datetime.datetime(2022, 6, 6, 9, 0, 1, tzinfo=tz))
+    sleep_mock.assert_called_once_with(30 * 60 + 1)
+    sleep_until(datetime.datetime(2022, 6, 6, 8, 0, tzinfo=tz))
+    sleep_mock.assert_called_once()
+
+
 @pytest.mark.parametrize(
     ("quantity", "threshold", "expected"),
     [
@@ -147,6 +170,11 @@ def test_sleep_until(mocker: MockerFixture):
             499,
             [-499, -499, -26],
         ),
+        (
+            998,
+            499,
+            [499, 499],
+        ),
     ],
 )
 def test_quantiy_split(quantity: int, threshold: int, expected: List[int]):
@@ -0,0 +1,63 @@
+from sjtrade.timer import TimerWheel
+from sjtrade.watchdog import QuoteWatchdog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run_until(clock: FakeClock, wheel: TimerWheel, now: float) -> int:
+    fired = 0
+    while clock.now < now:
+        clock.now += wheel.resolution
+        fired += wheel.advance()
+    return fired
+
+
+def test_quote_watchdog_stale():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=0.5, slots=16, clock=clock, autostart=False)
+    stale = []
+    watchdog = QuoteWatchdog(
+        ["1605", "6290", "0000"],
+        5.0,
+        lambda code, age: stale.append((code, age)),
+        wheel,
+        clock,
+    )
+    watchdog.watch(["1605", "6290"])
+    assert len(watchdog) == 2 and "0000" not in watchdog
+    for t in (1.0, 2.0, 3.0, 4.0):
+        run_until(clock, wheel, t)
+        watchdog.touch("6290")
+        watchdog.touch("0000")
+    # one fire each, 6290 is only re-armed for the time left
+    assert run_until(clock, wheel, 5.0) == 2
+    assert stale == [("1605", 5.0)]
+    assert watchdog.stale == {"1605": 5.0}
+    assert run_until(clock, wheel, 8.5) == 0
+    assert run_until(clock, wheel, 9.0) == 1
+    assert stale == [("1605", 5.0), ("6290", 5.0)]
+    assert run_until(clock, wheel, 10.0) == 1
+    assert stale[-1] == ("1605", 10.0)
+    assert watchdog.metrics() == {
+        "watched": 2,
+        "stale": 2,
+        "flagged": 3,
+        "max_age": 10.0,
+    }
+
+    # the feed come back, cleared at the next due check
+    run_until(clock, wheel, 12.0)
+    watchdog.touch("1605")
+    run_until(clock, wheel, 15.0)
+    assert "1605" not in watchdog.stale
+    assert stale[-1] == ("6290", 10.0)
+    watchdog.unwatch("6290")
+    assert watchdog.stale == {}
+    assert len(wheel) == 1
+    assert watchdog.ages() == {"1605": 3.0}